@@ -0,0 +1,151 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+
+logger = logging.getLogger(__name__)
+
+# Configuration, overridable through environment variables
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', 512))
+ANSWER_CACHE_SIMILARITY = float(os.environ.get('ANSWER_CACHE_SIMILARITY', 0.95))
+
+
+def normalize_query(query: str) -> str:
+    """
+    Lowercases a query, collapses whitespace and drops trailing punctuation.
+    """
+    return re.sub(r'\s+', ' ', query).strip().lower().rstrip('?!. ')
+
+
+def scope_key(*parts) -> str:
+    """
+    Fingerprints whatever besides the question itself shapes the answer
+    (conversation history, filters), so answers are only shared within the same scope.
+    """
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+class AnswerTicket:
+    """
+    The result of an answer cache lookup for one chat request.
+
+    `answer` holds the cached answer on a hit. On a miss, call `match_similar()`
+    once the query embedding and retrieved chunk IDs are known, and `store()`
+    once the answer has been generated.
+    """
+
+    def __init__(self, cache, query: str, scope: str, kb_version):
+        self.cache = cache
+        self.query = normalize_query(query)
+        self.scope = scope
+        self.kb_version = kb_version
+        self.embedding = None
+        self.chunk_ids = ()
+        self.answer = None
+
+    def match_similar(self, embedding, chunk_ids) -> str:
+        """
+        Looks for a near-duplicate question that retrieved the same chunks.
+        """
+        self.embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(self.embedding)
+        if norm:
+            self.embedding = self.embedding / norm
+        self.chunk_ids = tuple(chunk_ids)
+        self.answer = self.cache._lookup_similar(self)
+        return self.answer
+
+    def store(self, answer: str):
+        self.cache._store(self, answer)
+
+
+class AnswerCache:
+    """
+    A bounded LRU cache of chat answers for knowledge base questions.
+
+    An answer is reused when the normalized question matches exactly, or when
+    a question's embedding is at least `similarity_threshold` cosine-similar to
+    a cached one that retrieved the same chunks. Entries are dropped whenever
+    the knowledge base version changes.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 similarity_threshold: float = ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._kb_version = None
+        self._lock = threading.Lock()
+        self._counters = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "invalidations": 0}
+
+    def _check_version(self, kb_version):
+        if kb_version != self._kb_version:
+            if self._entries:
+                logger.info("Knowledge base changed, clearing the answer cache.")
+                self._counters["invalidations"] += 1
+            self._entries.clear()
+            self._kb_version = kb_version
+
+    def lookup(self, query: str, scope: str, kb_version) -> AnswerTicket:
+        """
+        Looks up an exact (normalized) match and returns a ticket for the request.
+        """
+        ticket = AnswerTicket(self, query, scope, kb_version)
+        key = (ticket.query, scope)
+        with self._lock:
+            self._check_version(kb_version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counters["exact_hits"] += 1
+                ticket.answer = entry["answer"]
+        return ticket
+
+    def _lookup_similar(self, ticket: AnswerTicket):
+        with self._lock:
+            self._check_version(ticket.kb_version)
+            best_key, best_score = None, self.similarity_threshold
+            for key, entry in self._entries.items():
+                if key[1] != ticket.scope or entry["chunk_ids"] != ticket.chunk_ids:
+                    continue
+                if entry["embedding"] is None or entry["embedding"].shape != ticket.embedding.shape:
+                    continue
+                score = float(np.dot(entry["embedding"], ticket.embedding))
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self._counters["similar_hits"] += 1
+            return self._entries[best_key]["answer"]
+
+    def _store(self, ticket: AnswerTicket, answer: str):
+        key = (ticket.query, ticket.scope)
+        with self._lock:
+            self._check_version(ticket.kb_version)
+            self._entries[key] = {
+                "embedding": ticket.embedding,
+                "chunk_ids": ticket.chunk_ids,
+                "answer": answer,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            counters["entries"] = len(self._entries)
+        hits = counters["exact_hits"] + counters["similar_hits"]
+        lookups = hits + counters["misses"]
+        counters["hit_ratio"] = hits / lookups if lookups else 0.0
+        return counters
@@ -1,26 +1,125 @@
 import os
 import re
+import json
+import asyncio
 import logging
-from flask import Flask, request, jsonify, send_from_directory
-from tools import url_scraper_tool, file_processor_tool, url_shortener_tool, find_and_clean_urls
-from knowledge_base import KnowledgeBase
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
+import threading
+from flask import Flask, Response, request, jsonify, send_from_directory, g
+from tools import (scrape_url, scrape_urls_with_deadline, scrape_urls_async, FAILED_TIERS, iter_file_pages, scrape_found_urls, url_shortener_tool,
+                   url_shortener_tool_async, find_and_clean_urls, get_fetch_tier_stats, warm_up_scrapers)
+from knowledge_base import KnowledgeBase, merge_summaries
+from scrape_cache import get_scrape_cache
+from short_url_cache import get_short_url_cache
+from jobs import JobManager, JobQueueFull
+from answer_cache import AnswerCache, scope_key
+from prompt_builder import build_prompt_messages, select_relevant_text, HISTORY_MAX_MESSAGES
+from token_budget import take_within_budget, truncate_to_budget
+from event_loop import run_coroutine
+from metrics import RequestTrace, span, install_request_id_logging, render_prometheus
+from sessions import SessionStore, extractive_summary, SESSION_SUMMARIZER, SESSION_SUMMARY_TOKENS
+from upload_storage import UploadRequest, TooManyFiles, UPLOAD_MAX_REQUEST_BYTES
+from werkzeug.exceptions import RequestEntityTooLarge
 
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
 
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-kb = KnowledgeBase()
-llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest")
+install_request_id_logging()
+
+
+class ChatbotFlask(Flask):
+    """
+    Runs async views on the process-wide event loop rather than on a new loop per
+    request, so the shared LLM and HTTP clients stay bound to a live loop.
+    """
+
+    def async_to_sync(self, func):
+        return lambda *args, **kwargs: run_coroutine(func(*args, **kwargs))
+
+
+app = ChatbotFlask(__name__)
+# Uploaded files are hashed and written to the upload folder while the request body is parsed
+app.request_class = UploadRequest
+jobs = JobManager()
+answer_cache = AnswerCache()
+
+# --- Lazily created clients ---
+# The knowledge base (Chroma) and the LLM client are slow to import and construct,
+# so they are created on first use, or ahead of time by the background warm-up.
+_kb = None
+_llm = None
+_clients_lock = threading.Lock()
+
+
+def get_kb() -> KnowledgeBase:
+    """
+    Returns the process-wide knowledge base, opening it on first use.
+    """
+    global _kb
+    if _kb is None:
+        with _clients_lock:
+            if _kb is None:
+                _kb = KnowledgeBase()
+    return _kb
+
+
+def get_llm():
+    """
+    Returns the process-wide chat model client, creating it on first use.
+
+    Its async client is bound to the first event loop that uses it, which is fine
+    because all async views run on one loop: the process-wide one under WSGI
+    (see ChatbotFlask) or the server's own loop under ASGI (see asgi.py).
+    """
+    global _llm
+    if _llm is None:
+        with _clients_lock:
+            if _llm is None:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                _llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest")
+    return _llm
+
+
+_warmup_status = {"knowledge_base": "pending", "llm": "pending", "scrapers": "pending"}
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+
+
+def _warm_up():
+    for component, factory in (("knowledge_base", get_kb), ("llm", get_llm), ("scrapers", warm_up_scrapers)):
+        if _warmup_status[component] == "ready":
+            continue
+        _warmup_status[component] = "warming"
+        try:
+            factory()
+            _warmup_status[component] = "ready"
+        except Exception as e:
+            logger.error(f"Warming up {component} failed: {e}")
+            _warmup_status[component] = f"failed: {e}"
+    logger.info(f"Warm-up finished: {_warmup_status}")
+
+
+def start_warmup():
+    """
+    Starts creating the clients in a background thread, unless that is already running
+    or has already succeeded. Components that failed are retried by the next call.
+    """
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is not None and _warmup_thread.is_alive():
+            return
+        if all(state == "ready" for state in _warmup_status.values()):
+            return
+        _warmup_thread = threading.Thread(target=_warm_up, name='warmup', daemon=True)
+        _warmup_thread.start()
 
 # Configuration for file uploads
 UPLOAD_FOLDER = 'uploads'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_REQUEST_BYTES
 
 
 # --- Route to serve the frontend UI ---
@@ -29,108 +128,183 @@ def index():
     return send_from_directory('static', 'index.html')
 
 
+# --- Request tracing: a request ID for the logs and per-request latency metrics ---
+@app.before_request
+def start_request_trace():
+    g.trace = RequestTrace(request.headers.get('X-Request-ID'))
+
+
+@app.after_request
+def finish_request_trace(response):
+    trace = g.get('trace')
+    if trace is not None:
+        response.headers['X-Request-ID'] = trace.request_id
+        if response.is_streamed:
+            # A streamed body is generated after this hook returns, so its trace ends when the response is closed
+            endpoint, method, status = request.endpoint, request.method, response.status_code
+            response.call_on_close(lambda: trace.finish(endpoint, method, status))
+        else:
+            trace.finish(request.endpoint, request.method, response.status_code)
+    return response
+
+
+# --- Readiness probe; the first call also starts the warm-up ---
+@app.route('/ready', methods=['GET'])
+def ready():
+    start_warmup()
+    status = dict(_warmup_status)
+    is_ready = all(state == "ready" for state in status.values())
+    body = {"ready": is_ready, "components": status}
+    if _kb is not None:
+        # An embedding backend switch re-indexes in the background while the previous collection is served
+        body["reindex"] = _kb.reindex_status
+    return jsonify(body), 200 if is_ready else 503
+
+
 # --- Route to upload documents and build the knowledge base ---
 @app.route('/upload', methods=['POST'])
 def upload_files():
     """
-    Handles knowledge base creation. It saves all inputs to the 'uploads' folder,
-    then processes them to extract text and build/add to the knowledge base.
+    Handles knowledge base creation. Uploaded files arrive already stored in the
+    'uploads' folder under content-addressed names (see upload_storage.py); files
+    whose content is already in the knowledge base are skipped. The rest are handed
+    to a background job that extracts their text and builds/adds to the knowledge
+    base. Returns the job ID right away; progress is available at /jobs/<id>.
     """
-    files = request.files.getlist('files')
+    files = [file for file in request.files.getlist('files') if file.filename]
     gdoc_link = request.form.get('gdoc_link')
 
     if not files and not gdoc_link:
         return jsonify({"error": "No files or Google Doc link provided"}), 400
-   
-    if len(files) > 3:
-        return jsonify({"error": "You can upload a maximum of 3 documents."}), 400
-   
-    all_text_content = []
-   
-    # Process file uploads
+
+    saved_files = []
+    duplicates = []
+    seen_hashes = set()
     for file in files:
-        if file.filename == '':
+        spool = file.stream
+        filename = os.path.basename(file.filename)
+        if spool.sha256 in seen_hashes or get_kb().has_content(filename, spool.sha256):
+            logger.info(f"Skipping {filename}: its content is already in the knowledge base.")
+            duplicates.append(filename)
             continue
-        filename = file.filename
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        seen_hashes.add(spool.sha256)
+        saved_files.append((spool.store(), filename, spool.sha256))
+
+    if not saved_files and not gdoc_link:
+        return jsonify({
+            "message": "These documents are already in the knowledge base.",
+            "duplicates": duplicates
+        }), 200
+
+    try:
+        job = jobs.submit(run_ingestion_job, saved_files, gdoc_link)
+    except JobQueueFull as e:
+        return jsonify({"error": f"The server is busy, please try again later. {e}"}), 503
+
+    return jsonify({
+        "message": "Documents are being added to the knowledge base.",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "duplicates": duplicates
+    }), 202
+
+
+@app.errorhandler(TooManyFiles)
+@app.errorhandler(RequestEntityTooLarge)
+def upload_rejected(e):
+    return jsonify({"error": e.description}), e.code
+
+
+def run_ingestion_job(job, saved_files: list, gdoc_link: str) -> dict:
+    """
+    Background ingestion pipeline: stream the pages of the saved files into the
+    knowledge base as they are parsed, then scrape the URLs they mention and the
+    Google Doc link and add those too.
+    """
+    kb = get_kb()
+    summary = {"added": 0, "skipped": 0, "removed": 0, "failed": 0}
+    extracted_any = False
+    found_urls_by_file = []
+
+    def merge(result):
+        merge_summaries(summary, result)
+        if result.get("error"):
+            job.report_error(result["error"])
+
+    for file_path, filename, content_hash in saved_files:
+        found_urls = set()
+
+        def parsed_pages(pages):
+            nonlocal extracted_any
+            for page_number, text in pages:
+                job.progress('parse', done=1, total=1)
+                found_urls.update(find_and_clean_urls(text))
+                if text.strip():
+                    extracted_any = True
+                yield page_number, text
+
         with open(file_path, 'rb') as saved_file:
-            original_content, scraped_content = file_processor_tool(saved_file, filename)
-        if original_content: all_text_content.append(original_content)
-        if scraped_content: all_text_content.append(scraped_content)
-       
+            pages = iter_file_pages(saved_file, filename)
+            if pages is None:
+                logger.warning(f"Skipping {filename}: unsupported file type.")
+                continue
+            result = kb.add_pages(filename, parsed_pages(pages), progress=job.progress)
+        merge(result)
+        if (result["added"] or result["skipped"]) and not result["failed"] and not result.get("error"):
+            kb.record_content(filename, content_hash)
+        found_urls_by_file.append((found_urls, filename))
+    job.finish_stage('parse')
+
+    scraped_text_content = []
+    scraped_sources = []
+    scraped_filenames = []
+    job.progress('scrape', total=sum(len(urls) for urls, _ in found_urls_by_file) + (1 if gdoc_link else 0))
+    for found_urls, filename in found_urls_by_file:
+        scraped_content = scrape_found_urls(found_urls, filename, on_done=lambda url: job.progress('scrape', done=1))
+        if scraped_content:
+            scraped_text_content.append(scraped_content)
+            scraped_sources.append(f"links:{filename}")
+            scraped_filenames.append(filename)
+
     # Process a Google Doc link if provided
     if gdoc_link:
-        gdoc_content, _ = url_scraper_tool(gdoc_link, save_to_folder=app.config['UPLOAD_FOLDER'])
-        if gdoc_content: all_text_content.append(gdoc_content)
+        gdoc_content, saved_path, tier = scrape_url(gdoc_link, save_to_folder=app.config['UPLOAD_FOLDER'])
+        job.progress('scrape', done=1)
+        if tier != 'error' and gdoc_content:
+            scraped_text_content.append(gdoc_content)
+            scraped_sources.append(gdoc_link)
+            scraped_filenames.append(os.path.basename(saved_path) if saved_path else gdoc_link)
+        else:
+            logger.warning(f"Could not add the Google Doc: {gdoc_content}")
+    job.finish_stage('scrape')
 
     # Build/add to the Knowledge Base
-    if not all_text_content:
-        return jsonify({"error": "Could not extract any text from the provided sources."}), 400
+    if not extracted_any and not scraped_text_content:
+        raise ValueError("Could not extract any text from the provided sources.")
    
-    kb.add_documents(all_text_content)
+    if scraped_text_content:
+        merge(kb.add_documents(scraped_text_content, sources=scraped_sources, progress=job.progress,
+                               filenames=scraped_filenames))
+    job.finish_stage('chunk')
+    job.finish_stage('embed')
+    return {"chunks": summary}
 
-    return jsonify({
-        "message": "Successfully added documents to the knowledge base."
-    }), 200
 
+# --- Route reporting the progress of an upload job ---
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job ID."}), 404
+    return jsonify(job.to_dict())
 
-# --- Main route for chat functionality ---
-@app.route('/chat', methods=['POST'])
-def chat():
-    """
-    Handles chat queries, now with conversation memory.
-    """
-    data = request.get_json()
-    if not data or 'query' not in data:
-        return jsonify({"error": "Invalid request: 'query' field is required."}), 400
 
-    user_query = data.get('query')
-    history = data.get('history', [])
-
-    # Truncate history to the last 3 conversation pairs (6 messages)
-    if len(history) > 6:
-        history = history[-6:]
-
-    # Build the list of messages for the LLM
-    messages = [
-        SystemMessage(content="You are a helpful assistant. Answer questions based on the provided context.")
-    ]
-    for message in history:
-        if message.get('role') == 'user':
-            messages.append(HumanMessage(content=message.get('content')))
-        elif message.get('role') == 'ai':
-            messages.append(AIMessage(content=message.get('content')))
+# --- Prompt templates; {context} and {question} are filled in by the prompt builder ---
+SYSTEM_PROMPT = "You are a helpful assistant. Answer questions based on the provided context."
 
-    # --- Router Logic ---
-    found_urls = find_and_clean_urls(user_query)
-    context = ""
-   
-    if found_urls:
-        all_scraped_content = []
-        for url in found_urls:
-            scraped_content, _ = url_scraper_tool(url)
-            all_scraped_content.append(scraped_content)
-        context = "\n\n".join(all_scraped_content)
-       
-        url_pattern_for_sub = r'https?://\S+'
-        question_text = re.sub(url_pattern_for_sub, "", user_query).strip()
-        if not question_text:
-            question_text = "Summarize the content of the provided web page(s)."
-       
-        final_user_prompt = f"Answer the following question based only on the provided web page content.\n\nWeb Page Content:\n{context}\n\nQuestion:\n{question_text}"
-
-    else:
-        if not kb.vector_store:
-            return jsonify({"error": "Knowledge base is not yet built. Please use the /upload endpoint first."}), 400
-
-        relevant_chunks = kb.query(user_query)
-        if not relevant_chunks:
-            context = "No relevant information found in the documents."
-        else:
-            context = "\n\n".join(relevant_chunks)
-       
-        final_user_prompt = f"""
+WEB_PAGE_PROMPT = "Answer the following question based only on the provided web page content.\n\nWeb Page Content:\n{context}\n\nQuestion:\n{question}"
+
+KNOWLEDGE_BASE_PROMPT = """
         You are a helpful assistant. Answer the user query. Refer to the context provided below. Give
         the answer as per the context as much as possible. 
         
@@ -138,22 +312,305 @@ def chat():
         {context}
 
         User Query:
-        {user_query}
+        {question}
         """
 
-    messages.append(HumanMessage(content=final_user_prompt))
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an assistant with the new messages below.
+Keep names, numbers, decisions and open questions; leave out greetings and filler.
+Reply with the updated summary only, in at most {words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}"""
+
+
+def summarize_with_llm(previous_summary: str, messages: list) -> str:
+    """
+    Rewrites a session's rolling summary to cover `messages` too. Runs on the session store's background worker.
+    """
+    from langchain_core.messages import HumanMessage
+    transcript = "\n".join(f"{'User' if message['role'] == 'user' else 'Assistant'}: "
+                           f"{truncate_to_budget(message['content'], SESSION_SUMMARY_TOKENS)}" for message in messages)
+    prompt = SUMMARY_PROMPT.format(words=SESSION_SUMMARY_TOKENS * 3 // 4, summary=previous_summary or "(none yet)",
+                                   messages=transcript)
+    with span('session_summary'):
+        response = get_llm().invoke([HumanMessage(content=prompt)])
+    return truncate_to_budget(response.content.strip(), SESSION_SUMMARY_TOKENS)
+
+
+# Server-side conversations; older turns are summarized in the background
+sessions = SessionStore(summarize_with_llm if SESSION_SUMMARIZER == 'llm' else extractive_summary)
+
+
+class ChatRequestError(Exception):
+    """Raised when a chat request cannot be answered, carrying the HTTP status to return."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def chat_session(data: dict):
+    """
+    Returns the server-side session of a chat request: the one named by 'session_id',
+    or a new one. Clients that send their own 'history' instead get no session.
+    """
+    if not isinstance(data, dict) or 'query' not in data:
+        return None
+    session_id = data.get('session_id')
+    if session_id is None and 'history' in data:
+        return None
+    if session_id is not None and not isinstance(session_id, str):
+        raise ChatRequestError("Invalid request: 'session_id' must be a string.")
+    return sessions.get(session_id)
+
+
+def parse_chat_request(data: dict, session=None):
+    """
+    Validates a chat request payload. With a session, its history replaces the request's.
+    Returns a tuple: (user_query, history, sources_filter)
+    """
+    if not data or 'query' not in data:
+        raise ChatRequestError("Invalid request: 'query' field is required.")
+
+    user_query = data.get('query')
+    history = session.history() if session is not None else data.get('history', [])
+    # Optional list of sources (upload filenames, Google Doc links) to restrict retrieval to
+    sources_filter = data.get('sources') or None
+    if sources_filter is not None and (not isinstance(sources_filter, list)
+                                       or not all(isinstance(source, str) for source in sources_filter)):
+        raise ChatRequestError("Invalid request: 'sources' must be a list of strings.")
+
+    if not isinstance(history, list):
+        raise ChatRequestError("Invalid request: 'history' must be a list of messages.")
+    history = [message for message in history[-HISTORY_MAX_MESSAGES:] if isinstance(message, dict)]
+    return user_query, history, sources_filter
+
+
+def web_page_messages(user_query: str, history: list, urls: list[str], scraped: list[tuple]):
+    """
+    Builds the messages for a query about web pages from their scrape_url results.
+    Pages that failed or timed out are reported in the sources but kept out of the prompt.
+    Returns a tuple: (messages, sources)
+    """
+    all_scraped_content = []
+    sources = []
+    for url, (scraped_content, _, tier) in zip(urls, scraped):
+        source = {"url": url, "tier": tier}
+        if tier in FAILED_TIERS:
+            source["error"] = scraped_content
+        elif scraped_content:
+            all_scraped_content.append(scraped_content)
+        sources.append(source)
+
+    url_pattern_for_sub = r'https?://\S+'
+    question_text = re.sub(url_pattern_for_sub, "", user_query).strip()
+    if not question_text:
+        question_text = "Summarize the content of the provided web page(s)."
+
+    # Large pages are cut down to the parts most relevant to the question
+    messages = build_prompt_messages(
+        SYSTEM_PROMPT, history, WEB_PAGE_PROMPT, question_text,
+        lambda budget: select_relevant_text(all_scraped_content, question_text, budget)
+        if all_scraped_content else "None of the web pages could be retrieved.")
+    return messages, sources
+
+
+def timed_out_urls(sources: list) -> list[str]:
+    return [source["url"] for source in sources if source["tier"] == 'timeout']
+
+
+def knowledge_base_messages(user_query: str, history: list, sources_filter: list[str]):
+    """
+    Builds the messages for a knowledge base question, unless the answer cache can answer it.
+    Returns a tuple: (messages, sources, answer_ticket); messages is None on a cache hit.
+    """
+    kb = get_kb()
+    if not kb.vector_store:
+        raise ChatRequestError("Knowledge base is not yet built. Please use the /upload endpoint first.")
+
+    ticket = answer_cache.lookup(user_query, scope_key(history, sorted(sources_filter or [])), kb.version)
+    if ticket.answer is not None:
+        return None, [], ticket
+
+    query_embedding = kb.embed_query(user_query)
+    results = kb.query_with_ids(user_query, query_embedding=query_embedding, sources=sources_filter)
+    if ticket.match_similar(query_embedding, [chunk_id for chunk_id, _ in results]) is not None:
+        return None, [], ticket
+
+    relevant_chunks = [text for _, text in results]
+
+    def fit_chunks(budget):
+        if not relevant_chunks:
+            return "No relevant information found in the documents."
+        return "\n\n".join(take_within_budget(relevant_chunks, budget))
+
+    messages = build_prompt_messages(SYSTEM_PROMPT, history, KNOWLEDGE_BASE_PROMPT, user_query, fit_chunks)
+    return messages, [], ticket
+
+
+def build_chat_messages(data: dict, session=None):
+    """
+    Builds the list of messages for the LLM from a chat request payload,
+    routing the query to the scraped web pages or the knowledge base.
+
+    Returns a tuple: (messages, sources, answer_ticket)
+    - sources lists the fetch tier that served each URL in the query; the URLs are
+      fetched concurrently, and those that miss their deadline get the tier 'timeout'.
+    - answer_ticket is the answer cache ticket for knowledge base questions, None otherwise.
+      On a cache hit `answer_ticket.answer` holds the answer and messages is None.
+    """
+    user_query, history, sources_filter = parse_chat_request(data, session)
+
+    # --- Router Logic ---
+    found_urls = find_and_clean_urls(user_query)
+    if found_urls:
+        scraped = scrape_urls_with_deadline(found_urls)
+        messages, sources = web_page_messages(user_query, history, found_urls, scraped)
+        return messages, sources, None
+    return knowledge_base_messages(user_query, history, sources_filter)
+
+
+async def build_chat_messages_async(data: dict, session=None):
+    """
+    Async counterpart of build_chat_messages: the URLs in the query are fetched
+    concurrently on the event loop, and the (blocking) knowledge base lookup
+    runs in a worker thread.
+    """
+    user_query, history, sources_filter = parse_chat_request(data, session)
+
+    found_urls = find_and_clean_urls(user_query)
+    if found_urls:
+        scraped = await scrape_urls_async(found_urls)
+        messages, sources = web_page_messages(user_query, history, found_urls, scraped)
+        return messages, sources, None
+    return await asyncio.to_thread(knowledge_base_messages, user_query, history, sources_filter)
+
+
+# --- Main route for chat functionality ---
+@app.route('/chat', methods=['POST'])
+async def chat():
+    """
+    Handles chat queries, now with conversation memory.
+
+    This view is async: the page fetches, the LLM call and the URL shortening
+    await network I/O instead of blocking on it one after another.
+    The conversation is kept on the server under the returned 'session_id'.
+    """
+    data = request.get_json()
+    try:
+        session = chat_session(data)
+        messages, sources, ticket = await build_chat_messages_async(data, session)
+    except ChatRequestError as e:
+        return jsonify({"error": e.message}), e.status
+    session_fields = {"session_id": session.id} if session is not None else {}
+
+    if ticket is not None and ticket.answer is not None:
+        logger.info("Answering from the answer cache.")
+        if session is not None:
+            sessions.record_turn(session, data['query'], ticket.answer)
+        return jsonify({"response": ticket.answer, "cached": True, **session_fields})
 
     # Invoke the LLM
     logger.info("Generating answer with conversation history...")
-    llm_response = llm.invoke(messages)
+    with span('llm'):
+        llm_response = await get_llm().ainvoke(messages)
     response_text = llm_response.content
    
     # Process for URL shortening
-    final_response = url_shortener_tool(response_text)
+    final_response = await url_shortener_tool_async(response_text)
+    if ticket is not None:
+        ticket.store(final_response)
+    if session is not None:
+        sessions.record_turn(session, data['query'], final_response)
+
+    result = {"response": final_response, **session_fields}
+    if sources:
+        result["sources"] = sources
+        result["timed_out"] = timed_out_urls(sources)
+    return jsonify(result)
+
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+# --- Streaming variant of the chat route (Server-Sent Events) ---
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Handles chat queries like /chat, but forwards the answer token by token as
+    Server-Sent Events. 'token' events carry the raw text as it is generated;
+    the final 'done' event carries the complete answer with shortened URLs.
+    """
+    data = request.get_json()
+    try:
+        session = chat_session(data)
+        messages, sources, ticket = build_chat_messages(data, session)
+    except ChatRequestError as e:
+        return jsonify({"error": e.message}), e.status
+    session_fields = {"session_id": session.id} if session is not None else {}
+
+    def generate():
+        if sources:
+            yield _sse('sources', {"sources": sources})
+        if ticket is not None and ticket.answer is not None:
+            logger.info("Answering from the answer cache.")
+            if session is not None:
+                sessions.record_turn(session, data['query'], ticket.answer)
+            yield _sse('token', {"token": ticket.answer})
+            yield _sse('done', {"response": ticket.answer, "sources": sources, "cached": True, **session_fields})
+            return
+        try:
+            logger.info("Streaming answer with conversation history...")
+            response_parts = []
+            with span('llm_stream'):
+                for chunk in get_llm().stream(messages):
+                    if chunk.content:
+                        response_parts.append(chunk.content)
+                        yield _sse('token', {"token": chunk.content})
+
+            final_response = url_shortener_tool("".join(response_parts))
+            if ticket is not None:
+                ticket.store(final_response)
+            if session is not None:
+                sessions.record_turn(session, data['query'], final_response)
+            yield _sse('done', {"response": final_response, "sources": sources,
+                                "timed_out": timed_out_urls(sources), **session_fields})
+        except Exception as e:
+            logger.error(f"An error occurred while streaming the answer: {e}")
+            yield _sse('error', {"error": "An error occurred while generating the response."})
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# --- Route exposing cache and fetch statistics ---
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        "fetch_tiers": get_fetch_tier_stats(),
+        "scrape_cache": get_scrape_cache().stats(),
+        "answer_cache": answer_cache.stats(),
+        # Reporting stats must not open the knowledge base
+        "query_embedding_cache": _kb.query_embedding_cache.stats() if _kb is not None else None,
+        "short_url_cache": get_short_url_cache().stats(),
+        "sessions": sessions.stats(),
+    })
+
 
-    return jsonify({"response": final_response})
+# --- Route exposing latency histograms in the Prometheus text format ---
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
 
 
 # --- Main execution block ---
+# Development server only; production runs `gunicorn -c gunicorn.conf.py wsgi:app`
 if __name__ == '__main__':
+    start_warmup()
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,234 @@
+"""
+ASGI entry point: `uvicorn asgi:app --host 0.0.0.0 --port 5000`
+
+Async views (/chat) are awaited directly on the server's event loop, so an
+in-flight chat holds no thread while it waits on page fetches, Gemini or is.gd.
+The other routes are synchronous and run on a bounded thread pool, with the
+request body streamed in and the response streamed out as they would be under
+Gunicorn, so uploads and /chat/stream are unchanged.
+"""
+import io
+import os
+import sys
+import asyncio
+import inspect
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from flask import Response, request, request_started
+from werkzeug.exceptions import HTTPException, ClientDisconnected
+from app import app as flask_app, start_warmup
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+
+logger = logging.getLogger(__name__)
+
+# Threads for the synchronous routes (uploads, job polling, /chat/stream, /stats, ...)
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+
+_executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='asgi-sync')
+
+
+class RequestBody(io.RawIOBase):
+    """
+    The request body as a blocking file for a worker thread: each read waits for
+    the next body message on the event loop, so uploads are not buffered first.
+    """
+
+    def __init__(self, receive, loop: asyncio.AbstractEventLoop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b""
+        self._more_body = True
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer and self._more_body:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                raise ClientDisconnected()
+            self._buffer += message.get('body', b"")
+            self._more_body = message.get('more_body', False)
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def build_environ(scope: dict, body) -> dict:
+    """
+    Builds the WSGI environ of an ASGI HTTP request.
+    """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b"").decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # The body stream ends where the request does, even without a Content-Length
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f"HTTP_{name}"
+        value = value.decode('latin-1')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _encode_headers(headers) -> list:
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+
+def _routes_to_async_view(environ: dict) -> bool:
+    """
+    Whether the request is routed to an async view (automatic OPTIONS replies are not).
+    """
+    try:
+        endpoint, _ = flask_app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        return False
+    if environ['REQUEST_METHOD'] == 'OPTIONS':
+        return False
+    return inspect.iscoroutinefunction(flask_app.view_functions.get(endpoint))
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        chunks.append(message.get('body', b""))
+        if not message.get('more_body', False):
+            return b"".join(chunks)
+
+
+async def _full_dispatch_request() -> Response:
+    """
+    Flask's full_dispatch_request and dispatch_request, except that the view is
+    awaited on this event loop instead of being run to completion on another one.
+    Signals, error handlers and response finalization are Flask's own.
+    """
+    flask_app._got_first_request = True
+    try:
+        request_started.send(flask_app, _async_wrapper=flask_app.ensure_sync)
+        rv = flask_app.preprocess_request()
+        if rv is None:
+            if request.routing_exception is not None:
+                flask_app.raise_routing_exception(request)
+            rv = await flask_app.view_functions[request.url_rule.endpoint](**request.view_args)
+    except Exception as e:
+        rv = flask_app.handle_user_exception(e)
+    return flask_app.finalize_request(rv)
+
+
+async def _serve_async_view(environ: dict, send):
+    """
+    Serves a request routed to an async view, like Flask's wsgi_app does.
+    """
+    ctx = flask_app.request_context(environ)
+    error = None
+    try:
+        try:
+            ctx.push()
+            response = await _full_dispatch_request()
+        except Exception as e:
+            error = e
+            response = flask_app.handle_exception(e)
+        except BaseException as e:
+            error = e
+            raise
+        app_iter, status, headers = response.get_wsgi_response(environ)
+    finally:
+        if error is not None and flask_app.should_ignore_error(error):
+            error = None
+        ctx.pop(error)
+
+    try:
+        await send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                    'headers': _encode_headers(headers)})
+        for chunk in app_iter:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b"", 'more_body': False})
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+
+def _serve_wsgi(environ: dict, send, loop: asyncio.AbstractEventLoop):
+    """
+    Runs the Flask app on a worker thread, sending each chunk of its response
+    from the event loop as soon as it is produced.
+    """
+    def send_message(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    start = {}
+
+    def start_response(status, headers, exc_info=None):
+        start['status'] = int(status.split(' ', 1)[0])
+        start['headers'] = _encode_headers(headers)
+        return lambda data: send_message({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+    def send_start():
+        if start and not start.get('sent'):
+            send_message({'type': 'http.response.start', 'status': start['status'], 'headers': start['headers']})
+            start['sent'] = True
+
+    iterable = flask_app(environ, start_response)
+    try:
+        for chunk in iterable:
+            send_start()
+            if chunk:
+                send_message({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        send_start()
+        send_message({'type': 'http.response.body', 'body': b"", 'more_body': False})
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Warm the clients up in the background so the first requests do not pay for it
+            start_warmup()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """
+    The chatbot as an ASGI application (HTTP and lifespan).
+    """
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    loop = asyncio.get_running_loop()
+    environ = build_environ(scope, None)
+    if _routes_to_async_view(environ):
+        environ['wsgi.input'] = io.BytesIO(await _read_body(receive))
+        await _serve_async_view(environ, send)
+    else:
+        environ['wsgi.input'] = RequestBody(receive, loop)
+        await loop.run_in_executor(_executor, _serve_wsgi, environ, send, loop)
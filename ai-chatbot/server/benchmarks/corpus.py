@@ -0,0 +1,85 @@
+import os
+import random
+
+# Generated documents for the upload benchmark. Texts are built from a fixed
+# vocabulary with a seeded RNG, so every run ingests exactly the same bytes.
+
+VOCABULARY = ("printer toner cartridge router firmware warranty battery install configure reset error "
+              "network cable driver update manual page section support replace device screen power "
+              "account password backup restore schedule report invoice order shipping return").split()
+
+
+def _paragraphs(rng: random.Random, words: int, tag: str) -> list[str]:
+    paragraphs = []
+    remaining = words
+    while remaining > 0:
+        size = min(remaining, rng.randint(60, 140))
+        sentence = " ".join(rng.choice(VOCABULARY) for _ in range(size))
+        paragraphs.append(f"{tag} ERR-{rng.randint(1000, 9999)} SKU_{rng.randint(100, 999)}: {sentence}.")
+        remaining -= size
+    return paragraphs
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def make_pdf(pages: list[list[str]]) -> bytes:
+    """
+    Builds a minimal PDF with the given lines of Helvetica text on each page.
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        shown = " T* ".join(f"({_pdf_escape(line)}) Tj" for line in lines)
+        stream = f"BT /F1 9 Tf 11 TL 36 756 Td {shown} ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>"
+
+    pdf = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n"
+    xref_offset = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n"
+    return pdf.encode('latin-1')
+
+
+def generate_corpus(directory: str, txt_files: int, pdf_files: int, words_per_file: int, pdf_pages: int,
+                    links: list[str] = (), seed: int = 42) -> list[str]:
+    """
+    Writes `txt_files` text files and `pdf_files` PDFs of roughly `words_per_file`
+    words each into `directory`, mentioning the given links, and returns their paths.
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+
+    for number in range(txt_files):
+        paragraphs = _paragraphs(rng, words_per_file, f"Document {number}")
+        paragraphs.extend(f"Reference: {link}" for link in links)
+        path = os.path.join(directory, f"doc_{number:03d}.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("\n\n".join(paragraphs))
+        paths.append(path)
+
+    for number in range(pdf_files):
+        words = " ".join(_paragraphs(rng, words_per_file, f"Manual {number}")).split()
+        lines = [" ".join(words[start:start + 14]) for start in range(0, len(words), 14)]
+        per_page = max(1, -(-len(lines) // pdf_pages))
+        pages = [lines[start:start + per_page] for start in range(0, len(lines), per_page)]
+        pages[-1] = pages[-1] + [f"Reference: {link}" for link in links]
+        path = os.path.join(directory, f"manual_{number:03d}.pdf")
+        with open(path, 'wb') as f:
+            f.write(make_pdf(pages))
+        paths.append(path)
+
+    return paths
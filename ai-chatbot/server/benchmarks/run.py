@@ -0,0 +1,350 @@
+"""
+Offline benchmark for the ingestion and chat pipelines.
+
+Runs the real Flask app on a local port with deterministic stand-ins for the
+embedding API, the LLM, the scraped web pages and the URL shortener, then
+measures upload throughput, chat latency under concurrent clients and memory
+high-water marks. Results are written as JSON; pass --compare to check them
+against an earlier run.
+
+Usage (from the server directory):
+    python -m benchmarks.run --clients 8 --compare benchmarks/results/baseline.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from unittest import mock
+
+import numpy as np
+import requests
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+RESULTS_DIR = os.path.join(SERVER_DIR, 'benchmarks', 'results')
+
+# Metric -> whether a larger value is better, for --compare
+COMPARED_METRICS = {
+    "upload.chunks_per_second": True,
+    "upload.mb_per_second": True,
+    "chat.requests_per_second": True,
+    "chat.p50_ms": False,
+    "chat.p99_ms": False,
+    "memory.peak_rss_mb": False,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--txt-files', type=int, default=6, help="Text files to upload.")
+    parser.add_argument('--pdf-files', type=int, default=3, help="PDF files to upload.")
+    parser.add_argument('--words-per-file', type=int, default=20000)
+    parser.add_argument('--pdf-pages', type=int, default=40)
+    parser.add_argument('--links-per-file', type=int, default=2, help="Local web pages each file links to.")
+    parser.add_argument('--clients', type=int, default=8, help="Concurrent chat clients.")
+    parser.add_argument('--requests-per-client', type=int, default=10)
+    parser.add_argument('--url-fraction', type=float, default=0.25, help="Share of chat queries that contain a URL.")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="Seconds the fake LLM takes per answer.")
+    parser.add_argument('--embed-latency', type=float, default=0.02, help="Seconds the fake embeddings take per call.")
+    parser.add_argument('--embedding-backend', default='fake', choices=['fake', 'hashing', 'sentence-transformers'],
+                        help="'fake' stands in for the Google API; the others are the real local backends.")
+    parser.add_argument('--web-latency', type=float, default=0.05, help="Seconds the local web server takes per page.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Where to write the JSON results (default: benchmarks/results/<time>.json).")
+    parser.add_argument('--compare', help="Earlier results to compare against; exits with 1 on a regression.")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Allowed relative regression for --compare.")
+    parser.add_argument('--verbose', action='store_true', help="Keep the server's INFO logs.")
+    return parser.parse_args(argv)
+
+
+# --- Environment ---
+
+def prepare_app(workdir: str, args):
+    """
+    Imports the app inside `workdir` and wires in the stand-ins.
+    Returns (app_module, web_server, embeddings); `embeddings` is None for the real local backends.
+    """
+    os.environ.setdefault('GOOGLE_API_KEY', 'benchmark')
+    os.environ['SCRAPE_CACHE_PATH'] = os.path.join(workdir, 'scrape_cache.db')
+    os.environ['SHORT_URL_CACHE_PATH'] = os.path.join(workdir, 'short_urls.db')
+    os.chdir(workdir)
+    if SERVER_DIR not in sys.path:
+        sys.path.insert(0, SERVER_DIR)
+
+    from benchmarks.stand_ins import FakeEmbeddings, FakeChatModel, LocalWebServer
+    import app as app_module
+    import tools
+    from knowledge_base import KnowledgeBase
+    from embeddings import create_embedding_provider
+
+    web_server = LocalWebServer(latency=args.web_latency).start()
+    persist_directory = os.path.join(workdir, 'chroma_db')
+    embeddings = None
+    if args.embedding_backend == 'fake':
+        embeddings = FakeEmbeddings(latency=args.embed_latency)
+        with mock.patch('langchain_google_genai.GoogleGenerativeAIEmbeddings', return_value=embeddings):
+            app_module._kb = KnowledgeBase(persist_directory=persist_directory)
+    else:
+        app_module._kb = KnowledgeBase(persist_directory=persist_directory,
+                                       embedding_provider=create_embedding_provider(args.embedding_backend))
+    app_module._llm = FakeChatModel(latency=args.llm_latency, link=f"{web_server.base_url}/page/answer")
+
+    shortener = tools.IsGdShortener()
+    shortener.api_url = f"{web_server.base_url}/create.php"
+    tools.set_shortener_backend(shortener)
+    return app_module, web_server, embeddings
+
+
+def serve(app):
+    """
+    Serves the Flask app with werkzeug's threaded server on a free local port.
+    """
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-app', daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def peak_rss_mb() -> dict:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "peak_children_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+
+# --- Phases ---
+
+def run_upload(base_url: str, paths: list[str]) -> dict:
+    """
+    Uploads the corpus in batches of three files (the /upload limit) and waits for every job.
+    """
+    started = time.perf_counter()
+    job_ids = []
+    for start in range(0, len(paths), 3):
+        batch = paths[start:start + 3]
+        files = [('files', (os.path.basename(path), open(path, 'rb'))) for path in batch]
+        try:
+            response = requests.post(f"{base_url}/upload", files=files, timeout=60)
+        finally:
+            for _, (_, handle) in files:
+                handle.close()
+        response.raise_for_status()
+        job_ids.append(response.json()["job_id"])
+
+    results = []
+    for job_id in job_ids:
+        while True:
+            job = requests.get(f"{base_url}/jobs/{job_id}", timeout=10).json()
+            if job["status"] in ('completed', 'partial', 'failed'):
+                results.append(job)
+                break
+            time.sleep(0.05)
+    seconds = time.perf_counter() - started
+
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    chunks = sum((job["result"] or {}).get("chunks", {}).get("added", 0) for job in results)
+    return {
+        "files": len(paths),
+        "megabytes": round(total_bytes / 1e6, 3),
+        "chunks": chunks,
+        "failed_jobs": sum(1 for job in results if job["status"] == 'failed'),
+        "seconds": round(seconds, 3),
+        "chunks_per_second": round(chunks / seconds, 2),
+        "mb_per_second": round(total_bytes / 1e6 / seconds, 3),
+    }
+
+
+def make_queries(count: int, url_fraction: float, web_base_url: str, rng: random.Random) -> list[tuple]:
+    from benchmarks.corpus import VOCABULARY
+    queries = []
+    for number in range(count):
+        if rng.random() < url_fraction:
+            queries.append(('url', f"What does this page say about topic{number % 50}? {web_base_url}/page/{number % 20}"))
+        else:
+            words = " ".join(rng.choice(VOCABULARY) for _ in range(4))
+            queries.append(('kb', f"How do I fix ERR-{rng.randint(1000, 9999)} with the {words} (question {number})?"))
+    return queries
+
+
+def run_chat(base_url: str, queries: list[tuple], clients: int) -> dict:
+    """
+    Sends the queries to /chat from `clients` concurrent threads and records each latency.
+    """
+    latencies = {"kb": [], "url": []}
+    errors = []
+    lock = threading.Lock()
+    next_query = iter(queries)
+
+    def client():
+        session = requests.Session()
+        while True:
+            with lock:
+                item = next(next_query, None)
+            if item is None:
+                return
+            kind, query = item
+            started = time.perf_counter()
+            try:
+                response = session.post(f"{base_url}/chat", json={"query": query}, timeout=120)
+                response.raise_for_status()
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies[kind].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, name=f'bench-client-{number}') for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    all_latencies = latencies["kb"] + latencies["url"]
+    result = {"clients": clients, "requests": len(all_latencies), "errors": len(errors),
+              "seconds": round(seconds, 3), "requests_per_second": round(len(all_latencies) / seconds, 2)}
+    result.update(_latency_summary(all_latencies))
+    result["by_kind"] = {kind: _latency_summary(values) for kind, values in latencies.items() if values}
+    return result
+
+
+def _latency_summary(latencies: list[float]) -> dict:
+    if not latencies:
+        return {}
+    values = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 1),
+        "p90_ms": round(float(np.percentile(values, 90)), 1),
+        "p99_ms": round(float(np.percentile(values, 99)), 1),
+        "mean_ms": round(float(values.mean()), 1),
+        "max_ms": round(float(values.max()), 1),
+    }
+
+
+def stage_breakdown() -> dict:
+    from metrics import stage_seconds
+    stages = {}
+    for (stage, outcome), series in sorted(stage_seconds.snapshot().items()):
+        if outcome != 'ok' or not series["count"]:
+            continue
+        stages[stage] = {"count": series["count"], "total_seconds": round(series["sum"], 3),
+                         "mean_ms": round(series["sum"] / series["count"] * 1000, 2)}
+    return stages
+
+
+# --- Results ---
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _lookup(results: dict, dotted_key: str):
+    value = results
+    for key in dotted_key.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Prints how each tracked metric moved since the baseline and returns the regressions.
+    """
+    regressions = []
+    print(f"\nCompared with {baseline.get('git_commit') or 'baseline'} ({baseline.get('timestamp')}):")
+    for key, higher_is_better in COMPARED_METRICS.items():
+        current, previous = _lookup(results, key), _lookup(baseline, key)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        marker = "  REGRESSION" if regressed else ""
+        print(f"  {key:28} {previous:>10} -> {current:>10} ({change:+.1%}){marker}")
+        if regressed:
+            regressions.append(key)
+    return regressions
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    original_cwd = os.getcwd()
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+
+    with tempfile.TemporaryDirectory(prefix='chatbot-bench-') as workdir:
+        app_module, web_server, embeddings = prepare_app(workdir, args)
+        if not args.verbose:
+            # Werkzeug sets its own logger to INFO, so the root level is not enough
+            logging.disable(logging.INFO)
+        server, base_url = serve(app_module.app)
+        try:
+            from benchmarks.corpus import generate_corpus
+            links = [f"{web_server.base_url}/page/link{number}" for number in range(args.links_per_file)]
+            paths = generate_corpus(os.path.join(workdir, 'corpus'), args.txt_files, args.pdf_files,
+                                    args.words_per_file, args.pdf_pages, links=links, seed=args.seed)
+            print(f"Uploading {len(paths)} files...")
+            upload = run_upload(base_url, paths)
+            memory = {"after_upload": peak_rss_mb()}
+
+            rng = random.Random(args.seed)
+            queries = make_queries(args.clients * args.requests_per_client, args.url_fraction, web_server.base_url, rng)
+            print(f"Sending {len(queries)} chat requests from {args.clients} clients...")
+            chat = run_chat(base_url, queries, args.clients)
+            memory["after_chat"] = peak_rss_mb()
+            memory["peak_rss_mb"] = memory["after_chat"]["peak_rss_mb"]
+        finally:
+            server.shutdown()
+            web_server.stop()
+            os.chdir(original_cwd)
+
+    results = {
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'verbose')},
+        "upload": upload,
+        "chat": chat,
+        "memory": memory,
+        "embedding_calls": embeddings.calls if embeddings is not None else None,
+        "stages": stage_breakdown(),
+    }
+
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{results['git_commit'] or 'local'}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"Upload: {upload['chunks']} chunks, {upload['chunks_per_second']} chunks/s, {upload['mb_per_second']} MB/s")
+    print(f"Chat: p50 {chat.get('p50_ms')} ms, p99 {chat.get('p99_ms')} ms, "
+          f"{chat['requests_per_second']} req/s, {chat['errors']} errors")
+    print(f"Peak RSS: {memory['peak_rss_mb']} MB")
+    print(f"Results written to: {output}")
+
+    if baseline_path:
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import time
+import asyncio
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Deterministic, offline replacements for the Gemini embeddings, the Gemini chat model,
+# the web pages the chatbot scrapes and the is.gd shortener.
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Hashes word counts into a fixed-size unit vector, so similar texts get similar
+    vectors. `latency` seconds are slept per call to mimic the embedding API.
+    """
+
+    def __init__(self, dimensions: int = 256, latency: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in text.lower().split():
+            digest = hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest()
+            vector[int.from_bytes(digest[:4], 'little') % self.dimensions] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _wait(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self._wait()
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        self._wait()
+        return self._embed(text)
+
+
+class _Chunk:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeChatModel:
+    """
+    Stands in for ChatGoogleGenerativeAI: answers after `latency` seconds with a
+    fixed-size reply that mentions a link, so URL shortening is exercised too.
+    """
+
+    def __init__(self, latency: float = 0.5, answer_words: int = 120, link: str = "https://example.com/docs"):
+        self.latency = latency
+        self.answer = " ".join(["answer"] * answer_words) + f" See {link} for details."
+
+    def invoke(self, messages):
+        time.sleep(self.latency)
+        return _Chunk(self.answer)
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(self.latency)
+        return _Chunk(self.answer)
+
+    def stream(self, messages):
+        words = self.answer.split(" ")
+        for word in words:
+            time.sleep(self.latency / len(words))
+            yield _Chunk(word + " ")
+
+
+class LocalWebServer:
+    """
+    Serves generated article pages at /page/<n> and an is.gd-compatible
+    shortener at /create.php on a local port.
+    """
+
+    def __init__(self, page_words: int = 800, latency: float = 0.0):
+        self.page_words = page_words
+        self.latency = latency
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                url = urlparse(self.path)
+                if url.path == '/create.php':
+                    long_url = parse_qs(url.query).get('url', [''])[0]
+                    body = f"{server.base_url}/s/{hashlib.sha1(long_url.encode('utf-8')).hexdigest()[:8]}"
+                    content_type = 'text/plain'
+                elif url.path.startswith('/page/'):
+                    body = server.page(url.path.rsplit('/', 1)[-1])
+                    content_type = 'text/html'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, name='bench-web', daemon=True)
+
+    def page(self, name: str) -> str:
+        words = " ".join(f"article{name} topic{i % 50} detail{i}" for i in range(self.page_words // 3))
+        return f"<html><head><title>Article {name}</title></head><body><h1>Article {name}</h1><p>{words}</p></body></html>"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
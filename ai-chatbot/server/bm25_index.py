@@ -0,0 +1,144 @@
+import re
+import math
+import logging
+import threading
+from collections import Counter, defaultdict
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+
+logger = logging.getLogger(__name__)
+
+# Words joined by '-', '_', '.' or '/' (error codes, SKUs, versions) are kept whole as well as split
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:[-_./][a-z0-9]+)*')
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lowercases a text and splits it into terms for lexical matching.
+    Compound terms such as 'err-404' or 'sku_1234' yield both the compound and its parts.
+    """
+    tokens = []
+    for term in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(term)
+        if not term.isalnum():
+            tokens.extend(re.split(r'[-_./]', term))
+    return tokens
+
+
+class BM25Index:
+    """
+    An in-memory inverted index scored with Okapi BM25.
+
+    Documents are identified by chunk ID and carry the metadata fields used
+    for source filtering. Adding an existing ID replaces it.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(dict)
+        self._doc_terms = {}
+        self._doc_lengths = {}
+        self._doc_sources = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._doc_lengths)
+
+    def add(self, doc_id: str, text: str, metadata: dict = None):
+        terms = Counter(tokenize(text))
+        metadata = metadata or {}
+        with self._lock:
+            self._remove(doc_id)
+            for term, count in terms.items():
+                self._postings[term][doc_id] = count
+            self._doc_terms[doc_id] = list(terms)
+            length = sum(terms.values())
+            self._doc_lengths[doc_id] = length
+            self._total_length += length
+            self._doc_sources[doc_id] = {metadata.get('source'), metadata.get('filename')} - {None}
+
+    def remove(self, doc_ids):
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        self._doc_sources.pop(doc_id, None)
+
+    def idf(self, term: str) -> float:
+        doc_count = len(self._doc_lengths)
+        matches = len(self._postings.get(term, ()))
+        return math.log(1 + (doc_count - matches + 0.5) / (matches + 0.5))
+
+    def search(self, query: str, k: int = 10, sources: list[str] = None) -> list[tuple]:
+        """
+        Returns up to `k` (doc_id, score) pairs, best first, optionally restricted
+        to documents whose source or filename is in `sources`.
+        """
+        allowed = set(sources) if sources else None
+        with self._lock:
+            if not self._doc_lengths:
+                return []
+            average_length = self._total_length / len(self._doc_lengths)
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = self.idf(term)
+                for doc_id, tf in postings.items():
+                    if allowed is not None and not (self._doc_sources[doc_id] & allowed):
+                        continue
+                    length_norm = 1 - self.b + self.b * self._doc_lengths[doc_id] / average_length
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[str]:
+    """
+    Merges several ranked lists of IDs into one, scoring each ID by the sum of
+    1 / (k + rank) over the lists it appears in.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1 / (k + rank)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
+
+
+class LexicalReranker:
+    """
+    A lightweight local reranker: orders passages by how much of the query they
+    cover, weighting each query term by how rare it is among the candidates.
+    The fused order breaks ties.
+    """
+
+    def __call__(self, query: str, passages: list[tuple]) -> list[tuple]:
+        query_terms = set(tokenize(query))
+        if not query_terms or not passages:
+            return passages
+        passage_terms = [set(tokenize(text)) for _, text in passages]
+        weights = {}
+        for term in query_terms:
+            matches = sum(1 for terms in passage_terms if term in terms)
+            weights[term] = math.log(1 + (len(passages) - matches + 0.5) / (matches + 0.5))
+        total_weight = sum(weights.values()) or 1.0
+
+        def score(position):
+            coverage = sum(weight for term, weight in weights.items() if term in passage_terms[position])
+            return (-coverage / total_weight, position)
+
+        return [passages[position] for position in sorted(range(len(passages)), key=score)]
@@ -0,0 +1,231 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+
+logger = logging.getLogger(__name__)
+
+# Configuration, overridable through environment variables
+BROWSER_POOL_SIZE = int(os.environ.get('BROWSER_POOL_SIZE', 3))
+BROWSER_MAX_PAGES = int(os.environ.get('BROWSER_MAX_PAGES', 50))
+BROWSER_CHECKOUT_TIMEOUT = float(os.environ.get('BROWSER_CHECKOUT_TIMEOUT', 30))
+BROWSER_PAGE_LOAD_TIMEOUT = float(os.environ.get('BROWSER_PAGE_LOAD_TIMEOUT', 30))
+# 'ready' waits until the page shows text that has stopped changing (at most BROWSER_WAIT_SECONDS),
+# 'fixed' sleeps for BROWSER_WAIT_SECONDS
+BROWSER_WAIT_POLICY = os.environ.get('BROWSER_WAIT_POLICY', 'ready')
+BROWSER_WAIT_SECONDS = float(os.environ.get('BROWSER_WAIT_SECONDS', 10))
+BROWSER_POLL_SECONDS = float(os.environ.get('BROWSER_POLL_SECONDS', 0.25))
+# Consecutive polls the page text must stay the same for before it counts as rendered
+BROWSER_STABLE_POLLS = 2
+BODY_TEXT_LENGTH_SCRIPT = "return document.body ? document.body.innerText.length : 0"
+
+
+def chrome_driver_factory():
+    """
+    Starts a new headless Chrome session.
+    """
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--window-size=1920,1080")
+    return webdriver.Chrome(options=chrome_options)
+
+
+class BrowserPool:
+    """
+    A bounded pool of warm browser sessions.
+
+    Sessions are created lazily up to `size`, checked out with `session()`,
+    health-checked on return and recycled after `max_pages` page loads.
+    """
+
+    def __init__(self, driver_factory=chrome_driver_factory, size: int = BROWSER_POOL_SIZE,
+                 max_pages: int = BROWSER_MAX_PAGES, checkout_timeout: float = BROWSER_CHECKOUT_TIMEOUT,
+                 wait_policy: str = BROWSER_WAIT_POLICY, wait_seconds: float = BROWSER_WAIT_SECONDS,
+                 poll_seconds: float = BROWSER_POLL_SECONDS):
+        if wait_policy not in ('ready', 'fixed'):
+            raise ValueError(f"Unknown browser wait policy: {wait_policy}")
+        self.driver_factory = driver_factory
+        self.size = size
+        self.max_pages = max_pages
+        self.checkout_timeout = checkout_timeout
+        self.wait_policy = wait_policy
+        self.wait_seconds = wait_seconds
+        self.poll_seconds = poll_seconds
+
+        # Idle sessions, most recently used last
+        self._idle = []
+        self._page_counts = {}
+        self._created = 0
+        # Notified whenever a session is returned or a slot frees up
+        self._available = threading.Condition()
+        self._closed = False
+
+    def _acquire(self, timeout: float = None):
+        """
+        Returns an idle session, or starts a new one if the pool has room. Otherwise
+        waits until a session is returned or a discarded one frees its slot, for at
+        most `timeout` seconds (capped by the pool's checkout timeout).
+        """
+        timeout = self.checkout_timeout if timeout is None else min(timeout, self.checkout_timeout)
+        deadline = time.monotonic() + timeout
+        with self._available:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Browser pool is closed.")
+                if self._idle:
+                    return self._idle.pop()
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No browser session became available within {timeout:g}s.")
+                self._available.wait(remaining)
+
+        try:
+            driver = self.driver_factory()
+        except Exception:
+            self._free_slot()
+            raise
+        self._page_counts[id(driver)] = 0
+        logger.info(f"Started new browser session ({self._created}/{self.size}).")
+        return driver
+
+    def _free_slot(self):
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    def _discard(self, driver):
+        self._page_counts.pop(id(driver), None)
+        self._free_slot()
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning(f"Error while quitting browser session: {e}")
+
+    def _is_healthy(self, driver) -> bool:
+        try:
+            driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def _release(self, driver, broken: bool = False):
+        self._page_counts[id(driver)] = self._page_counts.get(id(driver), 0) + 1
+
+        if self._closed or broken or self._page_counts[id(driver)] >= self.max_pages or not self._is_healthy(driver):
+            self._discard(driver)
+            return
+        with self._available:
+            self._idle.append(driver)
+            self._available.notify()
+
+    @contextmanager
+    def session(self, timeout: float = None):
+        """
+        Checks out a browser session for the duration of the `with` block,
+        waiting at most `timeout` seconds for one.
+        """
+        driver = self._acquire(timeout)
+        broken = False
+        try:
+            yield driver
+        except Exception:
+            broken = not self._is_healthy(driver)
+            raise
+        finally:
+            self._release(driver, broken=broken)
+
+    def wait_for_page(self, driver, wait_seconds: float = None):
+        """
+        Waits until the loaded page is ready according to the configured wait policy,
+        for at most `wait_seconds` (the pool's wait_seconds by default).
+
+        driver.get() already returns after the load event, but the pages that reach
+        the browser are rendered by JavaScript after that. So 'ready' waits for the
+        rendered content instead: visible body text that is non-empty and the same
+        length for BROWSER_STABLE_POLLS polls in a row.
+        """
+        wait_seconds = self.wait_seconds if wait_seconds is None else min(wait_seconds, self.wait_seconds)
+        if self.wait_policy == 'fixed':
+            time.sleep(wait_seconds)
+            return
+
+        deadline = time.monotonic() + wait_seconds
+        last_length = None
+        stable_polls = 0
+        while time.monotonic() < deadline:
+            try:
+                length = driver.execute_script(BODY_TEXT_LENGTH_SCRIPT)
+            except Exception:
+                length = None
+            if length and length == last_length:
+                stable_polls += 1
+                if stable_polls >= BROWSER_STABLE_POLLS:
+                    return
+            else:
+                stable_polls = 0
+            last_length = length
+            time.sleep(self.poll_seconds)
+        logger.warning(f"Page content did not settle within {wait_seconds:g}s, using current content.")
+
+    def fetch_page_source(self, url: str, timeout: float = None) -> str:
+        """
+        Loads a URL in a pooled session and returns the rendered page source.
+
+        With a `timeout`, the checkout, the page load and the readiness wait
+        together take about that many seconds at most, so a caller that gives
+        up on the page does not leave it holding a worker and a session for long.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def time_left(limit: float) -> float:
+            if deadline is None:
+                return limit
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Gave up loading {url} after {timeout:g}s.")
+            return min(limit, remaining)
+
+        with self.session(time_left(self.checkout_timeout)) as driver:
+            driver.set_page_load_timeout(time_left(BROWSER_PAGE_LOAD_TIMEOUT))
+            driver.get(url)
+            self.wait_for_page(driver, time_left(self.wait_seconds))
+            return driver.page_source
+
+    def close(self):
+        """
+        Quits all idle sessions and stops handing out new ones.
+        """
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._available.notify_all()
+        for driver in idle:
+            self._discard(driver)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """
+    Returns the process-wide browser pool, creating it on first use.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                import atexit
+                _pool = BrowserPool()
+                atexit.register(_pool.close)
+    return _pool
@@ -0,0 +1,194 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+
+logger = logging.getLogger(__name__)
+
+# Configuration, overridable through environment variables
+QUERY_EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get('QUERY_EMBEDDING_CACHE_MAX_ENTRIES', 10000))
+QUERY_EMBEDDING_HOT_ENTRIES = int(os.environ.get('QUERY_EMBEDDING_HOT_ENTRIES', 256))
+# Access times of cache hits are buffered in memory and written at most this often (and before evicting)
+QUERY_EMBEDDING_ACCESS_FLUSH_SECONDS = float(os.environ.get('QUERY_EMBEDDING_ACCESS_FLUSH_SECONDS', 30))
+# How long the batcher waits for more queries before embedding them together; 0 disables batching
+QUERY_EMBED_BATCH_WINDOW_MS = float(os.environ.get('QUERY_EMBED_BATCH_WINDOW_MS', 0))
+QUERY_EMBED_MAX_BATCH = int(os.environ.get('QUERY_EMBED_MAX_BATCH', 32))
+
+
+class QueryEmbeddingCache:
+    """
+    A persistent, size-bounded LRU cache of query text -> embedding vector.
+
+    Vectors are stored as float32 blobs in SQLite so a restarted process starts
+    warm. Keys include `namespace` (the embedding model) so vectors from a
+    different model are never returned.
+    """
+
+    def __init__(self, path: str, namespace: str = "", max_entries: int = QUERY_EMBEDDING_CACHE_MAX_ENTRIES,
+                 hot_entries: int = QUERY_EMBEDDING_HOT_ENTRIES,
+                 access_flush_seconds: float = QUERY_EMBEDDING_ACCESS_FLUSH_SECONDS):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.hot_entries = hot_entries
+        self.access_flush_seconds = access_flush_seconds
+
+        self._hot = OrderedDict()
+        # key -> last access time not yet written to SQLite
+        self._pending_access = {}
+        self._last_access_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS query_embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_query_embeddings_accessed ON query_embeddings (accessed_at)")
+        self._conn.commit()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\x00{text}".encode('utf-8')).hexdigest()
+
+    def _remember(self, key: str, vector: list):
+        self._hot[key] = vector
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_entries:
+            self._hot.popitem(last=False)
+
+    def get(self, text: str):
+        """
+        Returns the cached embedding for a query, or None.
+        """
+        key = self._key(text)
+        with self._lock:
+            vector = self._hot.get(key)
+            if vector is not None:
+                self._hot.move_to_end(key)
+            else:
+                row = self._conn.execute("SELECT vector FROM query_embeddings WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self._counters["misses"] += 1
+                    return None
+                vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+                self._remember(key, vector)
+            # A hit is a read; its access time only matters for eviction, so it is written lazily
+            self._pending_access[key] = time.time()
+            if time.monotonic() - self._last_access_flush >= self.access_flush_seconds:
+                self._flush_access_times()
+                self._conn.commit()
+            self._counters["hits"] += 1
+            return vector
+
+    def put(self, text: str, vector: list):
+        key = self._key(text)
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, vector, accessed_at) VALUES (?, ?, ?)",
+                (key, blob, time.time()))
+            self._pending_access.pop(key, None)
+            self._remember(key, list(vector))
+            self._evict()
+            self._conn.commit()
+
+    def _flush_access_times(self):
+        if self._pending_access:
+            self._conn.executemany("UPDATE query_embeddings SET accessed_at = ? WHERE key = ?",
+                                   [(accessed_at, key) for key, accessed_at in self._pending_access.items()])
+            self._pending_access.clear()
+        self._last_access_flush = time.monotonic()
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        # The LRU order must reflect every hit before anything is evicted
+        self._flush_access_times()
+        rows = self._conn.execute(
+            "SELECT key FROM query_embeddings ORDER BY accessed_at LIMIT ?", (excess,)).fetchall()
+        self._conn.executemany("DELETE FROM query_embeddings WHERE key = ?", rows)
+        for (key,) in rows:
+            self._hot.pop(key, None)
+        self._counters["evictions"] += len(rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            counters["entries"] = self._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_ratio"] = counters["hits"] / lookups if lookups else 0.0
+        return counters
+
+
+class _PendingBatch:
+    def __init__(self):
+        self.items = []
+        self.full = threading.Event()
+
+
+class QueryEmbeddingBatcher:
+    """
+    Coalesces concurrent query embedding requests into batched calls.
+
+    The first request of a batch waits up to `window_ms` for others to arrive
+    (or for the batch to fill up), then embeds all of them with a single
+    `embed_batch(texts)` call.
+    """
+
+    def __init__(self, embed_batch, window_ms: float = QUERY_EMBED_BATCH_WINDOW_MS,
+                 max_batch: int = QUERY_EMBED_MAX_BATCH):
+        self.embed_batch = embed_batch
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self._current = None
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> list:
+        future = Future()
+        with self._lock:
+            batch = self._current
+            leader = batch is None or len(batch.items) >= self.max_batch
+            if leader:
+                batch = self._current = _PendingBatch()
+            batch.items.append((text, future))
+            if len(batch.items) >= self.max_batch:
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(timeout=self.window_ms / 1000)
+            with self._lock:
+                if self._current is batch:
+                    self._current = None
+            self._run(batch.items)
+        return future.result()
+
+    def _run(self, items: list):
+        texts = [text for text, _ in items]
+        try:
+            vectors = self.embed_batch(texts)
+        except Exception as e:
+            for _, future in items:
+                future.set_exception(e)
+            return
+        logger.info(f"Embedded a batch of {len(texts)} queries.")
+        for (_, future), vector in zip(items, vectors):
+            future.set_result(vector)
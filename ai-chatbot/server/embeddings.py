@@ -0,0 +1,212 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+import numpy as np
+
+from bm25_index import tokenize
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+
+logger = logging.getLogger(__name__)
+
+# Embedding configuration, overridable through environment variables
+# 'google' (Gemini API), 'hashing' (local, NumPy) or 'sentence-transformers' (local, pip install sentence-transformers)
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'google')
+# Model name for the backend; empty means the backend's default
+EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', '')
+HASHING_DIMENSIONS = int(os.environ.get('HASHING_DIMENSIONS', 1024))
+SENTENCE_TRANSFORMER_BATCH_SIZE = 64
+
+
+# The backend every store created before backends were configurable was embedded with
+LEGACY_EMBEDDING_KEY = "google:models/embedding-001"
+
+
+def collection_name_for(key: str) -> str:
+    """
+    The Chroma collection holding the vectors of the provider with this key.
+    """
+    if key == LEGACY_EMBEDDING_KEY:
+        return "langchain"
+    return re.sub(r'[^a-zA-Z0-9_-]+', '-', f"kb-{key}").strip('-_')[:63]
+
+
+# --- Embedding providers ---
+
+class EmbeddingProvider(ABC):
+    """
+    The interface the knowledge base embeds through. It is duck-type compatible
+    with LangChain's Embeddings, so a provider can be handed to Chroma directly.
+
+    `key` names the backend and model; vectors from different keys are never
+    mixed, in the vector store or in the query embedding cache.
+    """
+
+    name = ""
+    default_model = ""
+
+    def __init__(self, model: str = None):
+        self.model = model or self.default_model
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}:{self.model}"
+
+    @property
+    def collection_name(self) -> str:
+        return collection_name_for(self.key)
+
+    @abstractmethod
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        ...
+
+    @abstractmethod
+    def embed_query(self, text: str) -> list[float]:
+        ...
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embeds several questions at once. Providers that can batch queries override this.
+        """
+        return [self.embed_query(text) for text in texts]
+
+
+class GoogleEmbeddingProvider(EmbeddingProvider):
+    """
+    Gemini embeddings over the network. Needs GOOGLE_API_KEY.
+    """
+
+    name = "google"
+    default_model = "models/embedding-001"
+
+    def __init__(self, model: str = None):
+        super().__init__(model)
+        if not os.environ.get("GOOGLE_API_KEY"):
+            raise RuntimeError("GOOGLE_API_KEY environment variable not set.")
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        self._client = GoogleGenerativeAIEmbeddings(model=self.model)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._client.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._client.embed_query(text)
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        # Google embeddings distinguish query and document vectors by task type
+        return self._client.embed_documents(texts, task_type="retrieval_query")
+
+
+@lru_cache(maxsize=65536)
+def _hashed_term(term: str, dimensions: int) -> tuple:
+    digest = hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest()
+    value = int.from_bytes(digest, 'little')
+    return value % dimensions, 1.0 if value >> 63 else -1.0
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    A local, dependency-free vectorizer: the feature hashing trick over the same
+    terms the BM25 index uses (so compound terms like error codes are features too),
+    with sublinear term frequencies and L2 normalization. A batch is built as one
+    NumPy matrix. It captures word overlap rather than meaning, so it is a fast
+    offline stand-in for a semantic model, not a replacement.
+    """
+
+    name = "hashing"
+
+    def __init__(self, model: str = None, dimensions: int = HASHING_DIMENSIONS):
+        # The model name records the dimensions, so a provider can be recreated from its key
+        match = re.fullmatch(r'v1-(\d+)', model or "")
+        self.dimensions = int(match.group(1)) if match else dimensions
+        super().__init__(model or f"v1-{self.dimensions}")
+
+    def _vectorize(self, texts: list[str]) -> np.ndarray:
+        rows, columns, signs = [], [], []
+        for row, text in enumerate(texts):
+            for term in tokenize(text):
+                column, sign = _hashed_term(term, self.dimensions)
+                rows.append(row)
+                columns.append(column)
+                signs.append(sign)
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.intp), np.asarray(columns, dtype=np.intp)),
+                  np.asarray(signs, dtype=np.float32))
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._vectorize(texts).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._vectorize([text])[0].tolist()
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_documents(texts)
+
+
+class SentenceTransformerProvider(EmbeddingProvider):
+    """
+    A local sentence-transformers model on the CPU (or GPU, if available).
+    """
+
+    name = "sentence-transformers"
+    default_model = "all-MiniLM-L6-v2"
+
+    def __init__(self, model: str = None):
+        super().__init__(model)
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise RuntimeError("EMBEDDING_BACKEND=sentence-transformers needs `pip install sentence-transformers`.") from e
+        self._model = SentenceTransformer(self.model)
+        self._lock = threading.Lock()
+
+    def _encode(self, texts: list[str]) -> list[list[float]]:
+        with self._lock:
+            vectors = self._model.encode(texts, batch_size=SENTENCE_TRANSFORMER_BATCH_SIZE,
+                                         normalize_embeddings=True, convert_to_numpy=True)
+        return vectors.astype(np.float32).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._encode(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._encode([text])[0]
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        return self._encode(texts)
+
+
+EMBEDDING_PROVIDERS = {
+    GoogleEmbeddingProvider.name: GoogleEmbeddingProvider,
+    HashingEmbeddingProvider.name: HashingEmbeddingProvider,
+    SentenceTransformerProvider.name: SentenceTransformerProvider,
+}
+
+
+def create_embedding_provider(backend: str = None, model: str = None) -> EmbeddingProvider:
+    """
+    Creates the provider for `backend` (default: EMBEDDING_BACKEND).
+    """
+    backend = backend or EMBEDDING_BACKEND
+    provider_class = EMBEDDING_PROVIDERS.get(backend)
+    if provider_class is None:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'. Choose one of: {', '.join(EMBEDDING_PROVIDERS)}.")
+    return provider_class(model or EMBEDDING_MODEL or None)
+
+
+def provider_for_key(key: str) -> EmbeddingProvider:
+    """
+    Recreates the provider whose `key` is given, e.g. the one a store was last embedded with.
+    """
+    backend, _, model = key.partition(':')
+    return create_embedding_provider(backend, model)
+
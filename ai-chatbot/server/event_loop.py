@@ -0,0 +1,47 @@
+import asyncio
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+
+logger = logging.getLogger(__name__)
+
+# --- Process-wide event loop ---
+# Flask (through asgiref) runs every async view on a new event loop by default.
+# Clients bound to a loop, like the LLM's gRPC channel and the pooled async HTTP
+# client, would then be unusable from the second request on, so under WSGI all
+# async views run on this one long-lived loop instead.
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the process-wide event loop, starting it on a daemon thread on first use.
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='event-loop', daemon=True).start()
+                logger.info("Started the process-wide event loop.")
+                _loop = loop
+    return _loop
+
+
+def run_coroutine(coro):
+    """
+    Runs a coroutine on the process-wide event loop and blocks until it finishes.
+    The coroutine sees a copy of the caller's context (request ID, Flask request).
+    """
+    loop = get_event_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_coroutine() cannot wait on the event loop it is called from")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
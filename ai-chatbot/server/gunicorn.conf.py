@@ -0,0 +1,19 @@
+import os
+
+# Gunicorn settings for serving the chatbot in production, overridable through environment variables.
+#
+# Chat requests spend most of their time waiting on the network (page fetches, Gemini,
+# is.gd), so one process runs many threads. A waiting chat still holds its thread, so
+# GUNICORN_THREADS caps concurrent chats; asgi.py (Uvicorn) serves them without one.
+# Upload jobs and their progress live in the process that accepted the upload, which is
+# why a single worker is the default; only raise GUNICORN_WORKERS behind a load balancer
+# with sticky sessions.
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+# LLM answers and browser renders can take a while
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
@@ -0,0 +1,128 @@
+import os
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+
+logger = logging.getLogger(__name__)
+
+# Configuration, overridable through environment variables
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', 20))
+JOB_HISTORY_LIMIT = int(os.environ.get('JOB_HISTORY_LIMIT', 100))
+
+INGESTION_STAGES = ('parse', 'scrape', 'chunk', 'embed')
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already waiting to run."""
+
+
+class Job:
+    """
+    A background job with per-stage progress counters.
+    """
+
+    def __init__(self, stages=INGESTION_STAGES):
+        self.id = uuid.uuid4().hex
+        self.status = 'queued'
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.stages = OrderedDict((name, {"status": "pending", "done": 0, "total": 0}) for name in stages)
+        self._lock = threading.Lock()
+
+    def progress(self, stage: str, done: int = 0, total: int = 0):
+        """
+        Adds to the done/total counters of a stage and marks it as running.
+        """
+        with self._lock:
+            counters = self.stages[stage]
+            counters["status"] = "running"
+            counters["done"] += done
+            counters["total"] += total
+
+    def report_error(self, message: str):
+        """
+        Records an error that did not stop the job. The job then finishes as 'partial'.
+        """
+        with self._lock:
+            self.error = f"{self.error}; {message}" if self.error else message
+
+    def finish_stage(self, stage: str):
+        with self._lock:
+            self.stages[stage]["status"] = "completed"
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "error": self.error,
+                "result": self.result,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+                "stages": {name: dict(counters) for name, counters in self.stages.items()},
+            }
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded pool of background workers and keeps
+    the most recent `history_limit` jobs available for status lookups.
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_pending: int = JOB_MAX_PENDING,
+                 history_limit: int = JOB_HISTORY_LIMIT):
+        self.max_pending = max_pending
+        self.history_limit = history_limit
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs) -> Job:
+        """
+        Queues `fn(job, *args, **kwargs)` and returns the job right away.
+        The function's return value becomes the job's result.
+        """
+        job = Job()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"There are already {self._pending} jobs waiting to run.")
+            self._pending += 1
+            self._jobs[job.id] = job
+            self._prune()
+        # Run in a copy of the submitter's context so the job logs with its request's ID
+        self._executor.submit(contextvars.copy_context().run, self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job: Job, fn, args, kwargs):
+        with self._lock:
+            self._pending -= 1
+        job.status = 'running'
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = 'partial' if job.error else 'completed'
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed.")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        while len(self._jobs) > self.history_limit and finished:
+            del self._jobs[finished.pop(0)]
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
@@ -1,69 +1,639 @@
 
 import os
+import json
+import time
+import hashlib
 import logging
-import google.generativeai as genai
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import uuid
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from embedding_cache import QueryEmbeddingCache, QueryEmbeddingBatcher, QUERY_EMBED_BATCH_WINDOW_MS
+from bm25_index import BM25Index, LexicalReranker, reciprocal_rank_fusion
+from token_budget import take_within_budget
+from metrics import span, timed, in_current_context
+from embeddings import create_embedding_provider, provider_for_key, collection_name_for, LEGACY_EMBEDDING_KEY
 
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
 
 logger = logging.getLogger(__name__)
 
-try:
-    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
-except KeyError:
-    logger.error("GOOGLE_API_KEY environment variable not set.")
-    exit()
+# Embedding pipeline configuration, overridable through environment variables
+EMBED_BATCH_SIZE = int(os.environ.get('EMBED_BATCH_SIZE', 32))
+EMBED_CONCURRENCY = int(os.environ.get('EMBED_CONCURRENCY', 4))
+EMBED_MAX_RETRIES = int(os.environ.get('EMBED_MAX_RETRIES', 5))
+EMBED_BACKOFF_SECONDS = float(os.environ.get('EMBED_BACKOFF_SECONDS', 2))
+
+# Retrieval configuration, overridable through environment variables
+RETRIEVAL_VECTOR_K = int(os.environ.get('RETRIEVAL_VECTOR_K', 10))
+RETRIEVAL_LEXICAL_K = int(os.environ.get('RETRIEVAL_LEXICAL_K', 10))
+RRF_K = int(os.environ.get('RRF_K', 60))
+# 'lexical' reorders the fused candidates by query term coverage, 'none' keeps the fused order
+RERANKER = os.environ.get('RERANKER', 'none')
+# Estimated tokens of retrieved context allowed into the prompt
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 1500))
+BM25_LOAD_PAGE_SIZE = 1000
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    """
+    Recognizes quota and rate-limit errors raised by the embedding API.
+    """
+    if type(error).__name__ in ('ResourceExhausted', 'TooManyRequests'):
+        return True
+    message = str(error).lower()
+    return '429' in message or 'quota' in message or 'rate limit' in message or 'resource has been exhausted' in message
+
+
+def source_filter(sources: list[str]):
+    """
+    Builds the Chroma metadata filter that restricts a search to the given
+    sources or filenames, or None to search the whole collection.
+    """
+    if not sources:
+        return None
+    return {"$or": [{"source": {"$in": list(sources)}}, {"filename": {"$in": list(sources)}}]}
+
+
+def merge_summaries(summary: dict, result: dict):
+    """
+    Adds the chunk counts of one ingestion result to a running summary,
+    joining their 'error' messages.
+    """
+    for key, value in result.items():
+        if key == 'error':
+            summary['error'] = f"{summary['error']}; {value}" if summary.get('error') else value
+        else:
+            summary[key] = summary.get(key, 0) + value
+
+
+def _no_progress(stage, done=0, total=0):
+    pass
+
+
+def _batched(items, batch_size: int):
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _iter_store_pages(vector_store, include: list[str]):
+    """
+    Reads a whole Chroma store, BM25_LOAD_PAGE_SIZE records at a time.
+    """
+    offset = 0
+    while True:
+        page = vector_store.get(include=include, limit=BM25_LOAD_PAGE_SIZE, offset=offset)
+        if len(page["ids"]):
+            yield page
+        if len(page["ids"]) < BM25_LOAD_PAGE_SIZE:
+            return
+        offset += len(page["ids"])
 
 
 class KnowledgeBase:
-    def __init__(self):
-        self.persist_directory = 'chroma_db'
+    def __init__(self, persist_directory: str = 'chroma_db', embedding_provider=None):
+        # Chroma and LangChain take seconds to import, so they are loaded with the first knowledge base
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        from langchain_chroma import Chroma
+
+        self.persist_directory = persist_directory
+        self.embed_batch_size = EMBED_BATCH_SIZE
+        self.embed_concurrency = EMBED_CONCURRENCY
+        self._cooldown_until = 0.0
+        self._cooldown_lock = threading.Lock()
+        self._content_hashes_lock = threading.Lock()
        
-        self.embedding_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
+        # The provider named by EMBEDDING_BACKEND/EMBEDDING_MODEL unless one is passed in (see embeddings.py)
+        self.embedding_model = embedding_provider or create_embedding_provider()
+        self.query_embedding_cache = QueryEmbeddingCache(
+            os.path.join(self.persist_directory, 'query_embeddings.db'),
+            namespace=self.embedding_model.key
+        )
+        self.query_batcher = None
+        if QUERY_EMBED_BATCH_WINDOW_MS > 0:
+            self.query_batcher = QueryEmbeddingBatcher(self._embed_query_batch)
        
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=100
         )
+        # Each embedding backend has its own collection, since their vectors are not comparable
         self.vector_store = Chroma(
+            collection_name=self.embedding_model.collection_name,
             persist_directory=self.persist_directory,
             embedding_function=self.embedding_model
         )
-        logger.info(f"Knowledge base initialized. Loading from: {self.persist_directory}")
 
+        # The lexical index is rebuilt from the store on first use and kept in sync afterwards
+        self.bm25_index = None
+        self._bm25_version = None
+        self._bm25_lock = threading.Lock()
+        self.context_token_budget = CONTEXT_TOKEN_BUDGET
+        self.reranker = None
+        if RERANKER == 'lexical':
+            self.reranker = LexicalReranker()
+
+        # Set once the store is embedded with the current backend (see _ensure_embedding_backend)
+        self.reindex_status = "not needed"
+        self._reindex_done = threading.Event()
+        self._ensure_embedding_backend()
+        logger.info(f"Knowledge base initialized with {self.embedding_model.key} embeddings. "
+                    f"Loading from: {self.persist_directory}")
+
+    @property
+    def version(self) -> str:
+        """
+        A token that changes whenever documents are added to or removed from the store.
+        It is kept next to the Chroma files so that every process sharing the store sees it.
+        """
+        try:
+            with open(os.path.join(self.persist_directory, 'kb_version'), encoding='utf-8') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return ""
+
+    def _bump_version(self):
+        version = self.version
+        bm25_in_sync = self.bm25_index is not None and self._bm25_version == version
+        os.makedirs(self.persist_directory, exist_ok=True)
+        version_path = os.path.join(self.persist_directory, 'kb_version')
+        temp_path = f"{version_path}.{uuid.uuid4().hex}"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(temp_path, version_path)
+        # Our own changes were already applied to the in-memory index
+        if bm25_in_sync:
+            self._bm25_version = self.version
+
+    # --- Embedding backend switches ---
+
+    def _embedding_marker_path(self) -> str:
+        return os.path.join(self.persist_directory, 'embedding_backend')
+
+    def _write_embedding_marker(self, key: str):
+        os.makedirs(self.persist_directory, exist_ok=True)
+        with open(self._embedding_marker_path(), 'w', encoding='utf-8') as f:
+            f.write(key)
+
+    def _ensure_embedding_backend(self):
+        """
+        Starts re-indexing the store when the embedding backend has changed since it was last used.
 
-    def add_documents(self, documents: list[str]):
+        The backend is recorded in an `embedding_backend` marker file next to the Chroma
+        files (stores without one were built with the original Google model). On a switch,
+        every chunk of the previous backend's collection is embedded again into the current
+        backend's collection on a background thread, with the usual batching and backoff.
+        Until it finishes, questions are answered from the previous collection with the
+        previous backend, and new documents wait for it. Chunks the current collection
+        already holds are kept, so switching back and forth only embeds what changed.
+        The previous collection is left in place.
+        """
+        try:
+            with open(self._embedding_marker_path(), encoding='utf-8') as f:
+                previous_key = f.read().strip()
+        except FileNotFoundError:
+            previous_key = LEGACY_EMBEDDING_KEY
+        current_key = self.embedding_model.key
+        if previous_key == current_key and os.path.exists(self._embedding_marker_path()):
+            self._reindex_done.set()
+            return
+        if collection_name_for(previous_key) == self.embedding_model.collection_name:
+            self._write_embedding_marker(current_key)
+            self._reindex_done.set()
+            return
+
+        target = (self.embedding_model, self.vector_store, self.query_embedding_cache)
+        try:
+            previous_model = provider_for_key(previous_key)
+        except Exception as e:
+            logger.warning(f"Cannot embed questions with the previous backend {previous_key} ({e}); "
+                           f"answering from the {current_key} collection while it is re-indexed.")
+        else:
+            from langchain_chroma import Chroma
+            self.embedding_model = previous_model
+            self.vector_store = Chroma(
+                collection_name=previous_model.collection_name,
+                persist_directory=self.persist_directory,
+                embedding_function=previous_model
+            )
+            self.query_embedding_cache = QueryEmbeddingCache(
+                os.path.join(self.persist_directory, 'query_embeddings.db'),
+                namespace=previous_model.key
+            )
+        self.reindex_status = "pending"
+        threading.Thread(target=in_current_context(self._reindex), args=(previous_key, *target),
+                         name='kb-reindex', daemon=True).start()
+
+    def _reindex(self, previous_key: str, embedding_model, vector_store, query_embedding_cache):
+        logger.info(f"The embedding backend changed from {previous_key} to {embedding_model.key}; "
+                    f"re-indexing the knowledge base in the background.")
+        self.reindex_status = "running"
+        try:
+            failed = self._reindex_from(collection_name_for(previous_key), vector_store)
+            if failed:
+                self.reindex_status = f"failed: {failed} chunks could not be re-indexed"
+                logger.warning(f"{failed} chunks failed to re-index; answering from the previous collection "
+                               f"until the re-index resumes on the next start.")
+                return
+            # Switch to the new collection; the lexical index is rebuilt from it on next use
+            with self._bm25_lock:
+                self.embedding_model = embedding_model
+                self.vector_store = vector_store
+                self.query_embedding_cache = query_embedding_cache
+                self.bm25_index = None
+            self._write_embedding_marker(embedding_model.key)
+            self._bump_version()
+            self.reindex_status = "completed"
+        except Exception as e:
+            logger.exception("Re-indexing the knowledge base failed.")
+            self.reindex_status = f"failed: {e}"
+        finally:
+            self._reindex_done.set()
+
+    def wait_for_reindex(self, timeout: float = None) -> bool:
+        """
+        Waits until a running re-index has finished. Returns False if it is still running after `timeout`.
+        """
+        return self._reindex_done.wait(timeout)
+
+    def _reindex_from(self, collection_name: str, vector_store) -> int:
+        """
+        Embeds the chunks of another collection into `vector_store`. Returns the number that failed.
+        """
+        from langchain_chroma import Chroma
+        previous_store = Chroma(collection_name=collection_name, persist_directory=self.persist_directory)
+        existing_ids = set(vector_store.get(include=[])["ids"])
+        previous_ids = set()
+
+        def chunks():
+            for page in _iter_store_pages(previous_store, ["documents", "metadatas"]):
+                for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                    previous_ids.add(chunk_id)
+                    if text and chunk_id not in existing_ids:
+                        yield chunk_id, text, metadata or {}
+
+        stored, failed, error = self._store_chunks(chunks(), vector_store=vector_store)
+        if error is not None:
+            logger.error(f"Reading the chunks of '{collection_name}' failed: {error}")
+            failed = failed or 1
+        stale_ids = existing_ids - previous_ids
+        if stale_ids and not failed:
+            vector_store.delete(ids=list(stale_ids))
+        logger.info(f"Re-indexed {stored} chunks from '{collection_name}' ({len(existing_ids & previous_ids)} "
+                    f"already present, {len(stale_ids) if not failed else 0} outdated removed, {failed} failed).")
+        return failed
+
+    # --- Uploaded content hashes ---
+    # Maps each uploaded source to the SHA-256 of the file it was last fully ingested from,
+    # so that re-uploads of an unchanged file can be rejected before they are parsed.
+
+    def _content_hashes_path(self) -> str:
+        return os.path.join(self.persist_directory, 'source_hashes.json')
+
+    def _load_content_hashes(self) -> dict:
+        try:
+            with open(self._content_hashes_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def has_content(self, source: str, content_hash: str) -> bool:
+        """
+        Whether `source` was last ingested from a file with this SHA-256.
+        """
+        return self._load_content_hashes().get(source) == content_hash
+
+    def record_content(self, source: str, content_hash: str):
+        """
+        Records that `source` is now fully ingested from a file with this SHA-256.
         """
-        Takes a list of document texts, splits them into chunks,
+        with self._content_hashes_lock:
+            hashes = self._load_content_hashes()
+            hashes[source] = content_hash
+            os.makedirs(self.persist_directory, exist_ok=True)
+            temp_path = f"{self._content_hashes_path()}.{uuid.uuid4().hex}"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(hashes, f)
+            os.replace(temp_path, self._content_hashes_path())
+
+    @staticmethod
+    def _chunk_id(source: str, chunk: str) -> str:
+        """
+        Derives a stable chunk ID from the chunk's source and content.
+        """
+        return hashlib.sha256(f"{source}\x00{chunk}".encode('utf-8')).hexdigest()
+
+    @timed('kb_add_documents')
+    def add_documents(self, documents: list[str], sources: list[str] = None, progress=None,
+                      filenames: list[str] = None) -> dict:
+        """
+        Takes a list of document texts, splits each one into chunks,
         and adds them to the persistent Chroma vector store.
+
+        Chunks are identified by a hash of their source and content, so chunks
+        already in the store are skipped, and chunks that a re-uploaded source
+        no longer contains are removed. Documents without a source are keyed
+        by their own content hash. Each chunk is tagged with its source,
+        filename (which defaults to the source) and upload time.
+
+        If given, `progress(stage, done=0, total=0)` is called to report how many
+        documents were chunked ('chunk') and how many chunks were embedded ('embed').
+
+        Returns the number of chunks added, skipped, removed and failed, plus an
+        'error' message if some documents could not be added completely.
         """
+        summary = {"added": 0, "skipped": 0, "removed": 0, "failed": 0}
         if not documents:
             logger.warning("No documents provided to add to the knowledge base.")
-            return
+            return summary
 
-        text_chunks = self.text_splitter.split_text("\n\n---\n\n".join(documents))
+        if sources is None:
+            sources = [None] * len(documents)
+        if filenames is None:
+            filenames = [None] * len(documents)
+        progress = progress or _no_progress
+        progress('chunk', total=len(documents))
 
-        if not text_chunks:
-            logger.warning("No text chunks generated from the provided documents.")
-            return
+        for document, source, filename in zip(documents, sources, filenames):
+            source = source or hashlib.sha256(document.encode('utf-8')).hexdigest()
+            result = self._add_source(source, filename or source, [(None, document)], progress)
+            merge_summaries(summary, result)
 
-        logger.info(f"Adding {len(text_chunks)} text chunks to the Chroma vector store.")
+        logger.info(f"Knowledge base update finished: {summary['added']} chunks added, "
+                    f"{summary['skipped']} unchanged, {summary['removed']} removed, {summary['failed']} failed.")
+        return summary
 
+    @timed('kb_add_pages')
+    def add_pages(self, source: str, pages, progress=None, filename: str = None) -> dict:
+        """
+        Streams the pages of one document into the knowledge base.
+
+        `pages` is an iterable of (page_number, text), such as the one returned by
+        tools.iter_file_pages. Each page is split and its new chunks are queued
+        for embedding as soon as it arrives, so the whole document is never held
+        in memory. Chunks are deduplicated and replaced like in add_documents,
+        and are also tagged with their page number.
+
+        Returns the number of chunks added, skipped, removed and failed. If the
+        pages stop with an error, the chunks stored until then are kept and
+        counted, nothing is removed, and the error message is returned as 'error'.
+        """
+        progress = progress or _no_progress
+
+        def counted(pages):
+            for page in pages:
+                progress('chunk', total=1)
+                yield page
+
+        summary = self._add_source(source, filename or source, counted(pages), progress)
+        logger.info(f"Finished adding '{source}': {summary['added']} chunks added, "
+                    f"{summary['skipped']} unchanged, {summary['removed']} removed, {summary['failed']} failed.")
+        return summary
+
+    def _add_source(self, source: str, filename: str, pages, progress) -> dict:
+        # New chunks go to the collection that is being served, which a running re-index is about to replace
+        self._reindex_done.wait()
         try:
-            self.vector_store.add_texts(texts=text_chunks)
-            logger.info("Successfully added new documents to the Chroma vector store.")
+            result = self._add_pages(source, filename, pages, progress)
         except Exception as e:
-            logger.error(f"An error occurred while adding documents to Chroma: {e}")
+            logger.error(f"An error occurred while adding '{source}' to Chroma: {e}")
+            # Some batches may have been committed before the error
+            self._bump_version()
+            return {"added": 0, "skipped": 0, "removed": 0, "failed": 0, "error": f"{filename}: {e}"}
+        if result["added"] or result["removed"]:
+            self._bump_version()
+        return result
+
+    def _add_pages(self, source: str, filename: str, pages, progress) -> dict:
+        uploaded_at = int(time.time())
+        existing_ids = set(self.vector_store.get(where={"source": source}, include=[])["ids"])
+        seen_ids = set()
+
+        def new_chunks():
+            for page_number, text in pages:
+                for chunk in self.text_splitter.split_text(text):
+                    chunk_id = self._chunk_id(source, chunk)
+                    if chunk_id in seen_ids:
+                        continue
+                    seen_ids.add(chunk_id)
+                    if chunk_id in existing_ids:
+                        continue
+                    progress('embed', total=1)
+                    metadata = {"source": source, "filename": filename, "uploaded_at": uploaded_at}
+                    if page_number is not None:
+                        metadata["page"] = page_number
+                    yield chunk_id, chunk, metadata
+                progress('chunk', done=1)
+
+        stored, failed, error = self._store_chunks(new_chunks(), on_batch_done=lambda count: progress('embed', done=count))
+
+        if error is not None:
+            # The document was not read to the end, so none of its chunks count as outdated
+            logger.error(f"Reading '{source}' failed after {stored} chunks were stored: {error}")
+            return {
+                "added": stored,
+                "skipped": len(seen_ids & existing_ids),
+                "removed": 0,
+                "failed": failed,
+                "error": f"{filename}: {error}",
+            }
+
+        if not seen_ids:
+            logger.warning(f"No text chunks generated from '{source}'.")
+            return {"added": 0, "skipped": 0, "removed": 0, "failed": 0}
+
+        # Stale chunks are removed only once all of their replacements are stored
+        stale_ids = existing_ids - seen_ids
+        if stale_ids and failed:
+            logger.warning(f"Keeping {len(stale_ids)} outdated chunks of '{source}' because {failed} new chunks failed to embed.")
+            stale_ids = set()
+        if stale_ids:
+            logger.info(f"Removing {len(stale_ids)} outdated text chunks of '{source}'.")
+            self.vector_store.delete(ids=list(stale_ids))
+            if self.bm25_index is not None:
+                self.bm25_index.remove(stale_ids)
+
+        return {
+            "added": stored,
+            "skipped": len(seen_ids & existing_ids),
+            "removed": len(stale_ids),
+            "failed": failed,
+        }
+
+    def _store_chunks(self, items, on_batch_done=None, vector_store=None) -> (int, int, Exception): # type: ignore
+        """
+        Embeds and stores an iterable of (id, text, metadata) items, in the
+        served store unless another `vector_store` is given.
+
+        Items are grouped into batches of `embed_batch_size`, and up to
+        `embed_concurrency` batches are embedded at once. Each batch is committed
+        to the store as soon as it is embedded, so a failing batch does not lose
+        the others. The iterable is consumed lazily: no more than twice the
+        concurrency limit of batches are pending at any time.
 
-    def query(self, user_question: str) -> list[str]:
+        Returns the number of chunks stored, the number that failed, and the
+        exception the iterable raised, if any. Batches submitted before such an
+        exception are still stored and counted.
         """
-        Performs a similarity search on the vector store to find relevant chunks.
+        stored = failed = 0
+        error = None
+
+        def collect(done):
+            nonlocal stored, failed
+            for future in done:
+                ok, count = future.result()
+                if on_batch_done:
+                    on_batch_done(count)
+                if ok:
+                    stored += count
+                else:
+                    failed += count
+
+        with ThreadPoolExecutor(max_workers=self.embed_concurrency, thread_name_prefix='embed') as executor:
+            pending = set()
+            try:
+                for batch in _batched(items, self.embed_batch_size):
+                    if len(pending) >= self.embed_concurrency * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    pending.add(executor.submit(in_current_context(self._store_batch), batch, vector_store))
+            except Exception as e:
+                error = e
+            collect(wait(pending).done)
+
+        return stored, failed, error
+
+    def _wait_for_cooldown(self):
+        with self._cooldown_lock:
+            delay = self._cooldown_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _start_cooldown(self, delay: float):
+        with self._cooldown_lock:
+            self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+
+    def _store_batch(self, batch: list, vector_store=None) -> (bool, int): # type: ignore
+        """
+        Embeds and commits one batch, backing off on quota errors.
+
+        A quota error pauses every worker, not just the one that hit it, so the
+        whole pipeline slows down to what the API allows.
+        """
+        if vector_store is None:
+            vector_store = self.vector_store
+        # The lexical index mirrors the served store only
+        served = vector_store is self.vector_store
+        ids, texts, metadatas = (list(column) for column in zip(*batch))
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            self._wait_for_cooldown()
+            try:
+                with span('embed_batch'):
+                    vector_store.add_texts(texts=texts, ids=ids, metadatas=metadatas)
+                if served and self.bm25_index is not None:
+                    for chunk_id, text, metadata in batch:
+                        self.bm25_index.add(chunk_id, text, metadata)
+                return True, len(batch)
+            except Exception as e:
+                if not _is_rate_limit_error(e) or attempt == EMBED_MAX_RETRIES:
+                    logger.error(f"An error occurred while adding a batch of {len(batch)} chunks to Chroma: {e}")
+                    return False, len(batch)
+                delay = EMBED_BACKOFF_SECONDS * (2 ** attempt)
+                logger.warning(f"Embedding quota exceeded, backing off for {delay:.1f}s (attempt {attempt + 1}).")
+                self._start_cooldown(delay)
+
+    @timed('embed_query')
+    def embed_query(self, user_question: str) -> list[float]:
+        """
+        Embeds a question with the knowledge base's embedding model.
+
+        Embeddings are served from the persistent query embedding cache when
+        possible. Misses are embedded directly, or coalesced with concurrent
+        misses into one batched call when query batching is enabled.
+        """
+        cached = self.query_embedding_cache.get(user_question)
+        if cached is not None:
+            return cached
+
+        if self.query_batcher is not None:
+            embedding = self.query_batcher.embed(user_question)
+        else:
+            embedding = self.embedding_model.embed_query(user_question)
+        self.query_embedding_cache.put(user_question, embedding)
+        return embedding
+
+    def _embed_query_batch(self, questions: list[str]) -> list[list[float]]:
+        if len(questions) == 1:
+            return [self.embedding_model.embed_query(questions[0])]
+        return self.embedding_model.embed_queries(questions)
+
+    def _get_bm25_index(self) -> BM25Index:
+        """
+        Returns the lexical index, (re)building it from the vector store when it
+        is missing or another process has changed the store since it was built.
+        """
+        version = self.version
+        if self.bm25_index is not None and self._bm25_version == version:
+            return self.bm25_index
+        with self._bm25_lock:
+            if self.bm25_index is not None and self._bm25_version == version:
+                return self.bm25_index
+            index = BM25Index()
+            for page in _iter_store_pages(self.vector_store, ["documents", "metadatas"]):
+                for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                    index.add(chunk_id, text or "", metadata)
+            logger.info(f"Built the lexical index over {len(index)} chunks.")
+            self.bm25_index = index
+            self._bm25_version = version
+        return self.bm25_index
+
+    def _texts_for(self, chunk_ids: list[str]) -> dict:
+        if not chunk_ids:
+            return {}
+        found = self.vector_store.get(ids=list(chunk_ids), include=["documents"])
+        return dict(zip(found["ids"], found["documents"]))
+
+    @timed('kb_query')
+    def query_with_ids(self, user_question: str, query_embedding: list[float] = None,
+                       sources: list[str] = None) -> list[tuple]:
+        """
+        Finds the chunks most relevant to a question and returns (chunk_id, text) pairs, best first.
+
+        Vector similarity results are merged with BM25 keyword results using
+        reciprocal rank fusion, so exact terms such as error codes are not missed.
+        The fused candidates are optionally reranked, then cut down to what fits in
+        `context_token_budget`. Pass `query_embedding` to reuse an embedding that was
+        already computed, and `sources` to only search chunks whose source or
+        filename is in the list.
         """
         if not self.vector_store:
             return []
 
-        relevant_docs = self.vector_store.similarity_search(user_question)
-        return [doc.page_content for doc in relevant_docs]
+        if query_embedding is None:
+            query_embedding = self.embed_query(user_question)
+        with span('vector_search'):
+            relevant_docs = self.vector_store.similarity_search_by_vector(
+                query_embedding, k=RETRIEVAL_VECTOR_K, filter=source_filter(sources))
+        texts = {doc.id: doc.page_content for doc in relevant_docs}
+
+        with span('bm25_search'):
+            lexical_hits = self._get_bm25_index().search(user_question, k=RETRIEVAL_LEXICAL_K, sources=sources)
+        fused_ids = reciprocal_rank_fusion([list(texts), [chunk_id for chunk_id, _ in lexical_hits]], k=RRF_K)
+        texts.update(self._texts_for([chunk_id for chunk_id in fused_ids if chunk_id not in texts]))
+        passages = [(chunk_id, texts[chunk_id]) for chunk_id in fused_ids if texts.get(chunk_id)]
+
+        if self.reranker is not None and passages:
+            with span('rerank'):
+                passages = self.reranker(user_question, passages)
+        return take_within_budget(passages, self.context_token_budget, text_of=lambda passage: passage[1])
+
+    def query(self, user_question: str, sources: list[str] = None) -> list[str]:
+        """
+        Finds the chunks most relevant to a question.
+        """
+        return [text for _, text in self.query_with_ids(user_question, sources=sources)]
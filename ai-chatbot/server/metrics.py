@@ -0,0 +1,216 @@
+import os
+import time
+import uuid
+import bisect
+import inspect
+import logging
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+
+logger = logging.getLogger(__name__)
+
+# Configuration, overridable through environment variables
+# Requests slower than this are logged with their stage breakdown (and profiled, if enabled)
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 5))
+# Set to 1 to sample slow requests with pyinstrument (pip install pyinstrument)
+PROFILE_SLOW_REQUESTS = os.environ.get('PROFILE_SLOW_REQUESTS', '0').lower() in ('1', 'true', 'yes')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s %(threadName)s [%(request_id)s] : %(message)s'
+
+# The ID of the request being handled; copied into worker threads and asyncio tasks with the context
+request_id_var = contextvars.ContextVar('request_id', default='-')
+# Stage -> seconds spent, for the request being handled
+_request_stages_var = contextvars.ContextVar('request_stages', default=None)
+
+
+class Histogram:
+    """
+    A Prometheus-style cumulative histogram, keyed by label values.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            position = bisect.bisect_left(self.buckets, value)
+            if position < len(self.buckets):
+                series["counts"][position] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def snapshot(self) -> dict:
+        """
+        Returns the observation count and sum of every label combination.
+        """
+        with self._lock:
+            return {labels: {"count": series["count"], "sum": series["sum"]} for labels, series in self._series.items()}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_items = sorted((labels, dict(series, counts=list(series["counts"])))
+                                  for labels, series in self._series.items())
+        for label_values, series in series_items:
+            labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, label_values))
+            separator = "," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels}{separator}le="+Inf"}} {series["count"]}')
+            lines.append(f'{self.name}_sum{{{labels}}} {series["sum"]}')
+            lines.append(f'{self.name}_count{{{labels}}} {series["count"]}')
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+stage_seconds = Histogram('chatbot_stage_duration_seconds',
+                          'Time spent in each stage of the chat and upload pipelines.', ('stage', 'outcome'))
+request_seconds = Histogram('chatbot_request_duration_seconds',
+                            'Time spent handling HTTP requests.', ('endpoint', 'method', 'status'))
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Times a block as one pipeline stage, recording it in the stage histogram
+    (with outcome 'ok' or 'error') and in the current request's breakdown.
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage, outcome)
+        stages = _request_stages_var.get()
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + elapsed
+
+
+def timed(stage: str):
+    """
+    Decorator form of span() for plain and async functions.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def in_current_context(fn):
+    """
+    Wraps a callable so that it runs in a copy of the caller's context, carrying
+    the request ID into thread pools, which do not copy contextvars on their own.
+    """
+    context = contextvars.copy_context()
+    return functools.partial(context.run, fn)
+
+
+# --- Per-request tracing ---
+
+class RequestTrace:
+    """
+    Tracks one HTTP request: its ID, its stage breakdown and, optionally, a profiler.
+    """
+
+    def __init__(self, request_id: str = None):
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.profiler = _start_profiler() if PROFILE_SLOW_REQUESTS else None
+        request_id_var.set(self.request_id)
+        _request_stages_var.set(self.stages)
+
+    def finish(self, endpoint: str, method: str, status: int) -> float:
+        elapsed = time.perf_counter() - self.started
+        request_seconds.observe(elapsed, endpoint or "unknown", method, str(status))
+        if self.profiler is not None:
+            self.profiler.stop()
+        if elapsed >= SLOW_REQUEST_SECONDS:
+            breakdown = ", ".join(f"{stage}={seconds:.3f}s" for stage, seconds in
+                                  sorted(self.stages.items(), key=lambda item: item[1], reverse=True))
+            logger.warning(f"Slow request to {endpoint} took {elapsed:.3f}s: {breakdown or 'no stages recorded'}")
+            if self.profiler is not None:
+                self._save_profile()
+        return elapsed
+
+    def _save_profile(self):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{self.request_id}.html")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.profiler.output_html())
+        logger.warning(f"Saved the profile of the slow request to: {path}")
+
+
+def _start_profiler():
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        logger.warning("PROFILE_SLOW_REQUESTS is set but pyinstrument is not installed.")
+        return None
+    profiler = Profiler(async_mode='enabled')
+    profiler.start()
+    return profiler
+
+
+# --- Logging ---
+
+class RequestIdFilter(logging.Filter):
+    """
+    Adds the current request ID to every log record as `request_id`.
+    """
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+def install_request_id_logging():
+    """
+    Makes the root log handlers print the request ID of each line.
+    """
+    for handler in logging.getLogger().handlers:
+        if not any(isinstance(existing, RequestIdFilter) for existing in handler.filters):
+            handler.addFilter(RequestIdFilter())
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+
+def render_prometheus() -> str:
+    """
+    Renders all histograms in the Prometheus text exposition format.
+    """
+    lines = stage_seconds.render() + request_seconds.render()
+    return "\n".join(lines) + "\n"
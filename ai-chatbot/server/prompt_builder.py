@@ -0,0 +1,172 @@
+import os
+import re
+import logging
+
+from bm25_index import BM25Index
+from token_budget import estimate_tokens, take_within_budget, truncate_to_budget
+from metrics import timed
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+
+logger = logging.getLogger(__name__)
+
+# Prompt budget configuration, overridable through environment variables
+PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', 6000))
+# Share of the budget left after the system prompt and question that history may use
+HISTORY_TOKEN_SHARE = float(os.environ.get('HISTORY_TOKEN_SHARE', 0.3))
+# Share of the history budget reserved for the summary of older turns
+HISTORY_SUMMARY_SHARE = float(os.environ.get('HISTORY_SUMMARY_SHARE', 0.3))
+# The most history messages a chat request may send
+HISTORY_MAX_MESSAGES = int(os.environ.get('HISTORY_MAX_MESSAGES', 50))
+PAGE_CHUNK_CHARS = 1000
+SUMMARY_LINE_TOKENS = 40
+
+
+def _to_message(message: dict):
+    from langchain_core.messages import HumanMessage, AIMessage
+    if message.get('role') == 'user':
+        return HumanMessage(content=message.get('content') or "")
+    if message.get('role') == 'ai':
+        return AIMessage(content=message.get('content') or "")
+    return None
+
+
+def summarize_turns(history: list, budget: int) -> str:
+    """
+    Extractively summarizes older conversation turns: one short line per message,
+    keeping the most recent lines that fit in the budget.
+    """
+    lines = []
+    for message in history:
+        content = re.sub(r'\s+', ' ', message.get('content') or "").strip()
+        if not content:
+            continue
+        first_sentence = re.split(r'(?<=[.!?])\s', content, maxsplit=1)[0]
+        speaker = "User" if message.get('role') == 'user' else "Assistant"
+        lines.append(f"- {speaker}: {truncate_to_budget(first_sentence, SUMMARY_LINE_TOKENS)}")
+
+    kept = take_within_budget(list(reversed(lines)), budget)
+    if not kept or estimate_tokens(kept[0]) > budget:
+        return ""
+    return "\n".join(reversed(kept))
+
+
+def build_history_messages(history: list, budget: int) -> list:
+    """
+    Turns chat history into messages that fit the budget. The most recent
+    messages are kept verbatim; the ones that do not fit are folded into a
+    summary of the earlier conversation instead of being dropped. A message with
+    the role 'summary' (a session's rolling summary) opens that summary.
+    """
+    from langchain_core.messages import SystemMessage
+    rolling_summary = "\n".join(message.get('content') or "" for message in history
+                                if message.get('role') == 'summary').strip()
+    history = [message for message in history if message.get('role') in ('user', 'ai')][-HISTORY_MAX_MESSAGES:]
+    if not history and not rolling_summary:
+        return []
+
+    summary_budget = int(budget * HISTORY_SUMMARY_SHARE)
+    recent_budget = budget - summary_budget
+    recent = []
+    used = 0
+    for message in reversed(history):
+        tokens = estimate_tokens(message.get('content') or "")
+        if used + tokens > recent_budget:
+            break
+        recent.insert(0, message)
+        used += tokens
+
+    older = history[:len(history) - len(recent)]
+    summary_parts = []
+    if rolling_summary:
+        summary_parts.append(truncate_to_budget(rolling_summary, summary_budget))
+    if older:
+        remaining = summary_budget + (recent_budget - used) - sum(estimate_tokens(part) for part in summary_parts)
+        summary_parts.append(summarize_turns(older, max(remaining, 0)))
+        logger.info(f"Summarized {len(older)} older history messages.")
+
+    messages = []
+    summary = "\n".join(part for part in summary_parts if part)
+    if summary:
+        messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"))
+    messages.extend(_to_message(message) for message in recent)
+    return messages
+
+
+def _split_into_chunks(text: str, chunk_chars: int = PAGE_CHUNK_CHARS) -> list[str]:
+    chunks = []
+    current = ""
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip()
+        while len(paragraph) > chunk_chars:
+            cut = paragraph.rfind(' ', 0, chunk_chars)
+            cut = cut if cut > 0 else chunk_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:cut])
+            paragraph = paragraph[cut:].strip()
+        if current and len(current) + len(paragraph) + 2 > chunk_chars:
+            chunks.append(current)
+            current = ""
+        if paragraph:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def select_relevant_text(texts: list[str], question: str, budget: int) -> str:
+    """
+    Fits scraped page texts into the budget. Texts that already fit are used whole;
+    otherwise they are chunked, and the chunks that best match the question (by BM25)
+    are kept, in their original order. When nothing matches, the opening chunks
+    of each text are used.
+    """
+    joined = "\n\n".join(texts)
+    if estimate_tokens(joined) <= budget:
+        return joined
+
+    chunks = []
+    for text_number, text in enumerate(texts):
+        chunks.extend(((text_number, position), chunk) for position, chunk in enumerate(_split_into_chunks(text)))
+
+    index = BM25Index()
+    for chunk_number, (_, chunk) in enumerate(chunks):
+        index.add(chunk_number, chunk)
+    ranked = [chunk_number for chunk_number, _ in index.search(question, k=len(chunks))]
+    if not ranked:
+        # No overlap with the question (e.g. "summarize this page"): prefer each text's opening
+        ranked = sorted(range(len(chunks)), key=lambda chunk_number: chunks[chunk_number][0][::-1])
+
+    selected = sorted(take_within_budget(ranked, budget, text_of=lambda chunk_number: chunks[chunk_number][1]))
+    logger.info(f"Selected {len(selected)} of {len(chunks)} page chunks to fit the context budget.")
+    return truncate_to_budget("\n\n".join(chunks[chunk_number][1] for chunk_number in selected), budget)
+
+
+@timed('prompt_build')
+def build_prompt_messages(system_prompt: str, history: list, user_prompt_template: str, question: str,
+                          fit_context, budget: int = PROMPT_TOKEN_BUDGET) -> list:
+    """
+    Assembles the messages for the LLM within a token budget.
+
+    The system prompt and the question are always included. Of what remains,
+    up to HISTORY_TOKEN_SHARE goes to the conversation history and the rest,
+    including whatever the history does not use, to the context.
+    `user_prompt_template` has {context} and {question} placeholders, and
+    `fit_context(context_budget)` returns context text of at most that many tokens.
+    """
+    from langchain_core.messages import HumanMessage, SystemMessage
+    fixed_tokens = (estimate_tokens(system_prompt) + estimate_tokens(question)
+                    + estimate_tokens(user_prompt_template.format(context="", question="")))
+    remaining = max(budget - fixed_tokens, 0)
+
+    history_messages = build_history_messages(history, int(remaining * HISTORY_TOKEN_SHARE))
+    history_tokens = sum(estimate_tokens(message.content) for message in history_messages)
+    context = fit_context(max(remaining - history_tokens, 0))
+
+    messages = [SystemMessage(content=system_prompt)]
+    messages.extend(history_messages)
+    messages.append(HumanMessage(content=user_prompt_template.format(context=context, question=question)))
+    return messages
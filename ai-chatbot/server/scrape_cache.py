@@ -0,0 +1,215 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+
+logger = logging.getLogger(__name__)
+
+# Configuration, overridable through environment variables
+# Next to the server code by default, whatever the working directory
+SCRAPE_CACHE_PATH = os.environ.get('SCRAPE_CACHE_PATH',
+                                   os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scrape_cache.db'))
+SCRAPE_CACHE_TTL = float(os.environ.get('SCRAPE_CACHE_TTL', 3600))
+SCRAPE_CACHE_MAX_BYTES = int(os.environ.get('SCRAPE_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+SCRAPE_CACHE_HOT_ENTRIES = int(os.environ.get('SCRAPE_CACHE_HOT_ENTRIES', 128))
+# Access times of cache hits are buffered in memory and written at most this often (and before evicting)
+SCRAPE_CACHE_ACCESS_FLUSH_SECONDS = float(os.environ.get('SCRAPE_CACHE_ACCESS_FLUSH_SECONDS', 30))
+
+
+class CacheEntry:
+    """A cached scrape result together with its HTTP validators."""
+
+    __slots__ = ('url', 'content', 'tier', 'etag', 'last_modified', 'expires_at')
+
+    def __init__(self, url, content, tier, etag, last_modified, expires_at):
+        self.url = url
+        self.content = content
+        self.tier = tier
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def validator_headers(self) -> dict:
+        """
+        Returns the conditional request headers that can revalidate this entry.
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ScrapeCache:
+    """
+    A persistent URL -> extracted text cache.
+
+    Entries live in SQLite with a per-entry TTL and are evicted least-recently-used
+    once the stored text exceeds `max_bytes`. The most recently used entries are
+    also kept in an in-process hot tier.
+    """
+
+    def __init__(self, path: str = SCRAPE_CACHE_PATH, ttl: float = SCRAPE_CACHE_TTL,
+                 max_bytes: int = SCRAPE_CACHE_MAX_BYTES, hot_entries: int = SCRAPE_CACHE_HOT_ENTRIES,
+                 access_flush_seconds: float = SCRAPE_CACHE_ACCESS_FLUSH_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hot_entries = hot_entries
+        self.access_flush_seconds = access_flush_seconds
+
+        self._hot = OrderedDict()
+        # URL -> last access time not yet written to SQLite
+        self._pending_access = {}
+        self._last_access_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "hot_hits": 0, "misses": 0, "revalidated": 0, "evictions": 0}
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                tier TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed_at)")
+        self._conn.commit()
+        logger.info(f"Scrape cache initialized at: {path}")
+
+    def _remember(self, entry: CacheEntry):
+        self._hot[entry.url] = entry
+        self._hot.move_to_end(entry.url)
+        while len(self._hot) > self.hot_entries:
+            self._hot.popitem(last=False)
+
+    def get(self, url: str):
+        """
+        Returns the cached entry for a URL, fresh or stale, or None.
+        Use `CacheEntry.is_fresh()` to decide whether it needs revalidation.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._hot.get(url)
+            from_hot = entry is not None
+            if from_hot:
+                self._hot.move_to_end(url)
+            else:
+                row = self._conn.execute(
+                    "SELECT url, content, tier, etag, last_modified, expires_at FROM entries WHERE url = ?",
+                    (url,)).fetchone()
+                if row is None:
+                    self._counters["misses"] += 1
+                    return None
+                entry = CacheEntry(*row)
+                self._remember(entry)
+            # A hit is a read; its access time only matters for eviction, so it is written lazily
+            self._pending_access[url] = now
+            if time.monotonic() - self._last_access_flush >= self.access_flush_seconds:
+                self._flush_access_times()
+                self._conn.commit()
+
+            if entry.is_fresh():
+                self._counters["hits"] += 1
+                if from_hot:
+                    self._counters["hot_hits"] += 1
+            else:
+                self._counters["misses"] += 1
+            return entry
+
+    def put(self, url: str, content: str, tier: str, etag: str = None, last_modified: str = None):
+        """
+        Stores the extracted text for a URL and evicts old entries if the cache is over size.
+        """
+        now = time.time()
+        entry = CacheEntry(url, content, tier, etag, last_modified, now + self.ttl)
+        size = len(content.encode('utf-8'))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (url, content, tier, etag, last_modified, expires_at, accessed_at, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, content, tier, etag, last_modified, entry.expires_at, now, size))
+            self._pending_access.pop(url, None)
+            self._remember(entry)
+            self._evict()
+            self._conn.commit()
+
+    def mark_revalidated(self, entry: CacheEntry):
+        """
+        Extends the lifetime of an entry after the origin answered 304 Not Modified.
+        """
+        entry.expires_at = time.time() + self.ttl
+        with self._lock:
+            self._counters["revalidated"] += 1
+            self._conn.execute("UPDATE entries SET expires_at = ? WHERE url = ?", (entry.expires_at, entry.url))
+            self._conn.commit()
+
+    def _flush_access_times(self):
+        if self._pending_access:
+            self._conn.executemany("UPDATE entries SET accessed_at = ? WHERE url = ?",
+                                   [(accessed_at, url) for url, accessed_at in self._pending_access.items()])
+            self._pending_access.clear()
+        self._last_access_flush = time.monotonic()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total > self.max_bytes:
+            # The LRU order must reflect every hit before anything is evicted
+            self._flush_access_times()
+        while total > self.max_bytes:
+            row = self._conn.execute("SELECT url, size FROM entries ORDER BY accessed_at LIMIT 1").fetchone()
+            if row is None:
+                break
+            url, size = row
+            self._conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+            self._hot.pop(url, None)
+            self._counters["evictions"] += 1
+            total -= size
+
+    def stats(self) -> dict:
+        """
+        Returns hit/miss counters and the current size of the cache.
+        """
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            counters = dict(self._counters)
+        lookups = counters["hits"] + counters["misses"]
+        counters.update({
+            "entries": entries,
+            "bytes": total,
+            "hot_entries": len(self._hot),
+            "hit_ratio": counters["hits"] / lookups if lookups else 0.0,
+        })
+        return counters
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_scrape_cache() -> ScrapeCache:
+    """
+    Returns the process-wide scrape cache, creating it on first use.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ScrapeCache()
+    return _cache
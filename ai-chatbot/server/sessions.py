@@ -0,0 +1,154 @@
+import os
+import re
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from prompt_builder import summarize_turns
+from token_budget import take_within_budget
+from metrics import in_current_context
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+
+logger = logging.getLogger(__name__)
+
+# Session configuration, overridable through environment variables
+SESSION_MAX_SESSIONS = int(os.environ.get('SESSION_MAX_SESSIONS', 1000))
+SESSION_TTL_SECONDS = float(os.environ.get('SESSION_TTL_SECONDS', 3600))
+# The most recent messages of a session are kept verbatim; older ones are folded into its summary
+SESSION_RECENT_MESSAGES = int(os.environ.get('SESSION_RECENT_MESSAGES', 8))
+# How many messages beyond the recent ones accumulate before they are summarized in the background
+SESSION_COMPACT_EVERY = int(os.environ.get('SESSION_COMPACT_EVERY', 6))
+# Estimated tokens the rolling summary may take
+SESSION_SUMMARY_TOKENS = int(os.environ.get('SESSION_SUMMARY_TOKENS', 300))
+# 'llm' asks the chat model to rewrite the summary; 'extractive' keeps the first sentence of each message
+SESSION_SUMMARIZER = os.environ.get('SESSION_SUMMARIZER', 'llm')
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+def extractive_summary(previous_summary: str, messages: list, budget: int = SESSION_SUMMARY_TOKENS) -> str:
+    """
+    Appends one short line per message to the summary, keeping the most recent
+    lines that fit in the budget.
+    """
+    lines = [line for line in previous_summary.splitlines() if line.strip()]
+    new_lines = summarize_turns(messages, budget)
+    lines.extend(new_lines.splitlines() if new_lines else [])
+    kept = take_within_budget(list(reversed(lines)), budget)
+    return "\n".join(reversed(kept))
+
+
+class Session:
+    """
+    One conversation: its most recent messages and a rolling summary of the older ones.
+    """
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.summary = ""
+        self.messages = []
+        self.last_used = time.monotonic()
+        self.compacting = False
+        self.lock = threading.Lock()
+
+    def history(self) -> list:
+        """
+        The conversation as chat history: the summary (role 'summary') followed by the recent messages.
+        """
+        with self.lock:
+            history = [{"role": "summary", "content": self.summary}] if self.summary else []
+            return history + list(self.messages)
+
+
+class SessionStore:
+    """
+    An in-memory, size-bounded LRU store of chat sessions with an idle TTL.
+
+    Each recorded turn is appended to its session. Once more than
+    `recent_messages + compact_every` messages have piled up, the older ones are
+    folded into the session's rolling summary by `summarize(previous_summary,
+    messages)` on a background worker, so requests never wait for it. Until that
+    finishes, the messages stay in the session as they are.
+    """
+
+    def __init__(self, summarize=extractive_summary, max_sessions: int = SESSION_MAX_SESSIONS,
+                 ttl_seconds: float = SESSION_TTL_SECONDS, recent_messages: int = SESSION_RECENT_MESSAGES,
+                 compact_every: int = SESSION_COMPACT_EVERY):
+        self.summarize = summarize
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.recent_messages = recent_messages
+        self.compact_every = compact_every
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='session-summary')
+        self._counters = {"created": 0, "expired": 0, "evicted": 0, "compactions": 0, "compaction_failures": 0}
+
+    def get(self, session_id: str = None) -> Session:
+        """
+        Returns the session with this ID, or a new one if it is unknown or has expired.
+        A new session keeps the requested ID when it is well-formed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                if not (session_id and SESSION_ID_PATTERN.match(session_id)):
+                    session_id = uuid.uuid4().hex
+                session = self._sessions[session_id] = Session(session_id)
+                self._counters["created"] += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self._counters["evicted"] += 1
+            self._sessions.move_to_end(session_id)
+            session.last_used = now
+            return session
+
+    def _expire(self, now: float):
+        # Sessions are kept in order of last use, so the expired ones are at the front
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used < self.ttl_seconds:
+                return
+            del self._sessions[session.id]
+            self._counters["expired"] += 1
+
+    def record_turn(self, session: Session, user_message: str, ai_message: str):
+        """
+        Appends a question and its answer to the session, and schedules a compaction
+        if enough messages have piled up. Returns the compaction's Future, or None.
+        """
+        with session.lock:
+            session.messages.append({"role": "user", "content": user_message})
+            session.messages.append({"role": "ai", "content": ai_message})
+            if session.compacting or len(session.messages) <= self.recent_messages + self.compact_every:
+                return None
+            session.compacting = True
+            older = session.messages[:len(session.messages) - self.recent_messages]
+            previous_summary = session.summary
+        return self._executor.submit(in_current_context(self._compact), session, previous_summary, older)
+
+    def _compact(self, session: Session, previous_summary: str, older: list):
+        try:
+            summary = self.summarize(previous_summary, older)
+            self._counters["compactions"] += 1
+        except Exception as e:
+            logger.error(f"Summarizing session {session.id} failed, falling back to an extractive summary: {e}")
+            self._counters["compaction_failures"] += 1
+            summary = extractive_summary(previous_summary, older)
+        with session.lock:
+            # Only the summarized messages are dropped; turns recorded meanwhile stay
+            del session.messages[:len(older)]
+            session.summary = summary
+            session.compacting = False
+        logger.info(f"Folded {len(older)} messages into the summary of session {session.id}.")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sessions": len(self._sessions), **self._counters}
@@ -0,0 +1,80 @@
+import os
+import sqlite3
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+
+logger = logging.getLogger(__name__)
+
+# Configuration, overridable through environment variables
+# Next to the server code by default, whatever the working directory
+SHORT_URL_CACHE_PATH = os.environ.get('SHORT_URL_CACHE_PATH',
+                                      os.path.join(os.path.dirname(os.path.abspath(__file__)), 'short_urls.db'))
+
+
+class ShortUrlCache:
+    """
+    A persistent long URL -> short URL mapping.
+
+    Short links do not expire, so entries are kept for good; lookups are
+    served from an in-process dictionary that is filled from SQLite on start.
+    """
+
+    def __init__(self, path: str = SHORT_URL_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0}
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS short_urls (
+                long_url TEXT PRIMARY KEY,
+                short_url TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+        self._mapping = dict(self._conn.execute("SELECT long_url, short_url FROM short_urls"))
+        logger.info(f"Short URL cache loaded {len(self._mapping)} mappings from: {path}")
+
+    def get_many(self, long_urls) -> dict:
+        """
+        Returns the known short URLs for the given long URLs.
+        """
+        with self._lock:
+            found = {url: self._mapping[url] for url in long_urls if url in self._mapping}
+            self._counters["hits"] += len(found)
+            self._counters["misses"] += len(long_urls) - len(found)
+        return found
+
+    def put(self, long_url: str, short_url: str):
+        with self._lock:
+            self._mapping[long_url] = short_url
+            self._conn.execute("INSERT OR REPLACE INTO short_urls (long_url, short_url) VALUES (?, ?)",
+                               (long_url, short_url))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            counters["entries"] = len(self._mapping)
+        lookups = counters["hits"] + counters["misses"]
+        counters["hit_ratio"] = counters["hits"] / lookups if lookups else 0.0
+        return counters
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_short_url_cache() -> ShortUrlCache:
+    """
+    Returns the process-wide short URL cache, creating it on first use.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ShortUrlCache()
+    return _cache
@@ -7,7 +7,8 @@ document.addEventListener('DOMContentLoaded', () => {
 
 
     let stagedFiles = [];
-    let conversationHistory = [];
+    // The server keeps the conversation; each request only names its session
+    let sessionId = null;
 
     // --- Event listener for when user selects files ---
     fileInput.addEventListener('change', () => {
@@ -41,7 +42,7 @@ document.addEventListener('DOMContentLoaded', () => {
         chatInput.value = '';
 
         if (stagedFiles.length > 0 || gdocLink) {
-            displayMessage('<i>Processing documents...</i>', 'ai');
+            const progressMessage = displayMessage('<i>Processing documents...</i>', 'ai');
             const formData = new FormData();
             stagedFiles.forEach(file => formData.append('files', file));
             if (gdocLink) {
@@ -61,14 +62,29 @@ document.addEventListener('DOMContentLoaded', () => {
                     updateStagedFilesUI();
                     return; // Stop if upload fails
                 }
+
+                // No job is queued when every document is already in the knowledge base
+                const jobResult = uploadResult.job_id
+                    ? await waitForJob(uploadResult.job_id, progressMessage)
+                    : { status: 'completed' };
+                if (jobResult.status === 'failed') {
+                    displayMessage(`Error: ${jobResult.error}`, 'ai');
+                    stagedFiles = [];
+                    updateStagedFilesUI();
+                    return; // Stop if ingestion fails
+                }
+                // A partial job added what it could; its error lists what was left out
+                const warning = jobResult.status === 'partial'
+                    ? `<br>⚠️ Some content could not be added: ${jobResult.error}`
+                    : '';
                 if (!userQuery) {
-                    displayMessage('✅ Knowledge base updated. You can now ask questions about the document(s).', 'ai');
+                    displayMessage(`✅ Knowledge base updated. You can now ask questions about the document(s).${warning}`, 'ai');
                     stagedFiles = [];
                     updateStagedFilesUI();
                     return;
                 }
 
-                displayMessage('<i>Knowledge base updated. Now generating response...</i>', 'ai');
+                displayMessage(`<i>Knowledge base updated. Now generating response...</i>${warning}`, 'ai');
                 stagedFiles = [];
                 updateStagedFilesUI();
 
@@ -82,24 +98,41 @@ document.addEventListener('DOMContentLoaded', () => {
 
         const thikingMessage = displayMessage("<i>Thinking...</i>", 'ai');
 
-        conversationHistory.push({ role: 'user', content: userQuery });
-        if (conversationHistory.length > 6) {
-            conversationHistory = conversationHistory.slice(-6);
-        }
-
         try {
-            const chatResponse = await fetch('/chat', {
+            const chatResponse = await fetch('/chat/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
                     query: userQuery,
-                    history: conversationHistory,
+                    session_id: sessionId,
                 }),
             });
-            const chatResult = await chatResponse.json();
-            thikingMessage.remove();
-            displayMessage(chatResult.response, 'ai');
-            conversationHistory.push({ role: 'ai', content: chatResult.response });
+            if (!chatResponse.ok) {
+                const chatResult = await chatResponse.json();
+                thikingMessage.remove();
+                displayMessage(`Error: ${chatResult.error}`, 'ai');
+                return;
+            }
+
+            // Render tokens as they arrive, then swap in the final answer
+            let partialResponse = '';
+            let finalResponse = null;
+            await readServerSentEvents(chatResponse, (event, payload) => {
+                if (event === 'token') {
+                    partialResponse += payload.token;
+                    thikingMessage.innerHTML = marked.parse(partialResponse);
+                    chatBox.scrollTop = chatBox.scrollHeight;
+                } else if (event === 'done') {
+                    finalResponse = payload.response;
+                    sessionId = payload.session_id || sessionId;
+                } else if (event === 'error') {
+                    throw new Error(payload.error);
+                }
+            });
+            if (finalResponse === null) {
+                throw new Error('The response stream ended unexpectedly.');
+            }
+            thikingMessage.innerHTML = marked.parse(finalResponse);
 
         } catch (error) {
             thikingMessage.remove();
@@ -107,6 +140,49 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     };
 
+    // --- Reads a text/event-stream response and calls onEvent(event, payload) per event ---
+    async function readServerSentEvents(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                });
+                if (data) onEvent(event, JSON.parse(data));
+            }
+        }
+    }
+
+    // --- Polls an ingestion job until it finishes, showing per-stage progress ---
+    async function waitForJob(jobId, progressMessage) {
+        while (true) {
+            const response = await fetch(`/jobs/${jobId}`);
+            const job = await response.json();
+            if (!response.ok) {
+                return { status: 'failed', error: job.error };
+            }
+            if (['completed', 'partial', 'failed'].includes(job.status)) {
+                return job;
+            }
+            const stages = Object.entries(job.stages)
+                .filter(([, stage]) => stage.status !== 'pending')
+                .map(([name, stage]) => stage.total ? `${name} ${stage.done}/${stage.total}` : name);
+            progressMessage.innerHTML = marked.parse(`<i>Processing documents... ${stages.join(' · ')}</i>`);
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+
     function findGoogleDocLink(text) {
         const gdocPattern = /https:\/\/docs\.google\.com\/document\/d\/[a-zA-Z0-9_-]+/;
         const match = text.match(gdocPattern);
@@ -0,0 +1,56 @@
+import unittest
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from answer_cache import AnswerCache, scope_key
+
+
+class TestAnswerCache(unittest.TestCase):
+
+    def setUp(self):
+        print("Setting up for an AnswerCache test")
+        self.cache = AnswerCache(max_entries=2, similarity_threshold=0.9)
+        self.scope = scope_key([])
+
+    def _answer(self, query, embedding, chunk_ids, answer, kb_version="v1"):
+        ticket = self.cache.lookup(query, self.scope, kb_version)
+        ticket.match_similar(embedding, chunk_ids)
+        ticket.store(answer)
+
+    def test_near_duplicate_question_with_same_chunks_hits(self):
+        print("Running test: test_near_duplicate_question_with_same_chunks_hits")
+        self._answer("How do I reset my password?", [1.0, 0.0], ["c1", "c2"], "Use the reset link.")
+
+        ticket = self.cache.lookup("How can I reset my password?", self.scope, "v1")
+        self.assertIsNone(ticket.answer)
+        self.assertEqual(ticket.match_similar([0.99, 0.05], ["c1", "c2"]), "Use the reset link.")
+
+        other = self.cache.lookup("How can I reset my password?", self.scope, "v1")
+        self.assertIsNone(other.match_similar([0.99, 0.05], ["c3"]))
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["similar_hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+
+    def test_kb_version_change_invalidates(self):
+        print("Running test: test_kb_version_change_invalidates")
+        self._answer("What is SKU-42?", [0.0, 1.0], ["c1"], "A widget.")
+        self.assertEqual(self.cache.lookup("what is sku-42", self.scope, "v1").answer, "A widget.")
+        self.assertIsNone(self.cache.lookup("what is sku-42", self.scope, "v2").answer)
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        print("Running test: test_least_recently_used_entry_is_evicted")
+        self._answer("first", [1.0, 0.0], ["c1"], "1")
+        self._answer("second", [0.0, 1.0], ["c2"], "2")
+        self.cache.lookup("first", self.scope, "v1")
+        self._answer("third", [0.7, 0.7], ["c3"], "3")
+
+        self.assertEqual(self.cache.lookup("first", self.scope, "v1").answer, "1")
+        self.assertIsNone(self.cache.lookup("second", self.scope, "v1").answer)
+
+
+if __name__ == '__main__':
+    unittest.main()
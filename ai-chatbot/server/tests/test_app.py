@@ -1,12 +1,22 @@
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock, AsyncMock
+import io
+import asyncio
 import json
+import time
+import hashlib
+import tempfile
 
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import app as app_module
 from app import app
+from answer_cache import AnswerCache
+from sessions import SessionStore
+from scrape_cache import ScrapeCache
+from short_url_cache import ShortUrlCache
 
 class TestApp(unittest.TestCase):
 
@@ -15,25 +25,86 @@ class TestApp(unittest.TestCase):
         print("Setting up for a Flask app test")
         app.config['TESTING'] = True
         self.client = app.test_client()
-        self.kb_patch = patch('app.kb')
-        self.llm_patch = patch('app.llm')
-        self.mock_kb = self.kb_patch.start()
-        self.mock_llm = self.llm_patch.start()
+        self.kb_patch = patch('app.get_kb')
+        self.llm_patch = patch('app.get_llm')
+        self.answer_cache_patch = patch('app.answer_cache', AnswerCache())
+        self.mock_kb = self.kb_patch.start().return_value
+        self.mock_llm = self.llm_patch.start().return_value
+        self.answer_cache_patch.start()
+        self.mock_kb.version = "v1"
+        self.mock_kb.embed_query.return_value = [1.0, 0.0]
+        self.mock_kb.has_content.return_value = False
+        self.mock_llm.ainvoke = AsyncMock()
+        self.upload_dir = tempfile.TemporaryDirectory()
+        self.upload_folder_patch = patch.dict(app.config, {'UPLOAD_FOLDER': self.upload_dir.name})
+        self.upload_folder_patch.start()
    
     def tearDown(self):
         """Stop the patches."""
+        self.upload_folder_patch.stop()
+        self.upload_dir.cleanup()
         self.kb_patch.stop()
         self.llm_patch.stop()
+        self.answer_cache_patch.stop()
 
     def test_index_route(self):
         print("Running test: test_index_route")
         response = self.client.get('/')
         self.assertEqual(response.status_code, 200)
 
+    @patch('app.warm_up_scrapers')
+    def test_ready_reports_warmup_progress(self, _mock_warm_up_scrapers):
+        print("Running test: test_ready_reports_warmup_progress")
+        with patch('app._warmup_thread', None), \
+                patch.dict('app._warmup_status', {"knowledge_base": "pending", "llm": "pending", "scrapers": "pending"}):
+            response = self.client.get('/ready')
+            self.assertIn(response.status_code, (200, 503))
+            app_module._warmup_thread.join(timeout=5)
+
+            response = self.client.get('/ready')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()["components"]["knowledge_base"], "ready")
+
+    @patch('app.warm_up_scrapers')
+    def test_ready_retries_components_that_failed_to_warm_up(self, mock_warm_up_scrapers):
+        print("Running test: test_ready_retries_components_that_failed_to_warm_up")
+        mock_warm_up_scrapers.side_effect = [RuntimeError("no network"), None]
+        with patch('app._warmup_thread', None), \
+                patch.dict('app._warmup_status', {"knowledge_base": "pending", "llm": "pending", "scrapers": "pending"}):
+            self.client.get('/ready')
+            app_module._warmup_thread.join(timeout=5)
+            self.assertTrue(app_module._warmup_status["scrapers"].startswith("failed"))
+
+            self.client.get('/ready')
+            app_module._warmup_thread.join(timeout=5)
+            response = self.client.get('/ready')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(mock_warm_up_scrapers.call_count, 2)
+
+    def test_ready_reports_a_background_reindex(self):
+        print("Running test: test_ready_reports_a_background_reindex")
+        with patch('app._kb', MagicMock(reindex_status="running")), \
+                patch.dict('app._warmup_status', {"knowledge_base": "ready", "llm": "ready", "scrapers": "ready"}):
+            response = self.client.get('/ready')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["reindex"], "running")
+
+    def test_stats_does_not_open_the_knowledge_base(self):
+        print("Running test: test_stats_does_not_open_the_knowledge_base")
+        with patch('app._kb', None), \
+                patch('app.get_scrape_cache', return_value=ScrapeCache(':memory:')), \
+                patch('app.get_short_url_cache', return_value=ShortUrlCache(':memory:')):
+            response = self.client.get('/stats')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.get_json()["query_embedding_cache"])
+        app_module.get_kb.assert_not_called()
+
     def test_chat_with_kb_query(self):
         print("Running test: test_chat_with_kb_query")
-        self.mock_kb.query.return_value = ["context from a document"]
-        self.mock_llm.invoke.return_value.content = "This is the AI's answer."
+        self.mock_kb.query_with_ids.return_value = [("chunk-1", "context from a document")]
+        self.mock_llm.ainvoke.return_value.content = "This is the AI's answer."
 
         response = self.client.post('/chat',
             data=json.dumps({'query': 'A question for the documents'}),
@@ -42,7 +113,239 @@ class TestApp(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         data = response.get_json()
         self.assertEqual(data['response'], "This is the AI's answer.")
-        self.mock_kb.query.assert_called_with('A question for the documents')
+        self.mock_kb.query_with_ids.assert_called_with('A question for the documents', query_embedding=[1.0, 0.0],
+                                                       sources=None)
+
+    def test_async_views_share_one_event_loop(self):
+        print("Running test: test_async_views_share_one_event_loop")
+        self.mock_kb.query_with_ids.return_value = [("chunk-1", "context from a document")]
+        loops = []
+
+        async def ainvoke(messages):
+            loops.append(asyncio.get_running_loop())
+            return MagicMock(content="This is the AI's answer.")
+        self.mock_llm.ainvoke.side_effect = ainvoke
+
+        for version, query in (("v1", 'A first question'), ("v2", 'A second question')):
+            self.mock_kb.version = version
+            response = self.client.post('/chat', data=json.dumps({'query': query}),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(len(loops), 2)
+        self.assertIs(loops[0], loops[1])
+        self.assertFalse(loops[0].is_closed())
+
+    def test_chat_keeps_the_conversation_in_a_session(self):
+        print("Running test: test_chat_keeps_the_conversation_in_a_session")
+        self.mock_kb.query_with_ids.return_value = [("chunk-1", "context from a document")]
+        self.mock_llm.ainvoke.return_value.content = "The LX-200 takes the T-20 cartridge."
+
+        with patch('app.sessions', SessionStore()):
+            first = self.client.post('/chat', json={'query': 'Which toner does the LX-200 take?'}).get_json()
+            session_id = first['session_id']
+            second = self.client.post('/chat', json={'query': 'Where can I buy it?', 'session_id': session_id})
+            stateless = self.client.post('/chat', json={'query': 'Hello', 'history': []}).get_json()
+
+        self.assertEqual(second.get_json()['session_id'], session_id)
+        prompt = self.mock_llm.ainvoke.call_args_list[1].args[0]
+        self.assertEqual([message.content for message in prompt[1:3]],
+                         ['Which toner does the LX-200 take?', 'The LX-200 takes the T-20 cartridge.'])
+        self.assertNotIn('session_id', stateless)
+
+    def test_chat_filters_by_source(self):
+        print("Running test: test_chat_filters_by_source")
+        self.mock_kb.query_with_ids.return_value = [("chunk-1", "context from the manual")]
+        self.mock_llm.ainvoke.return_value.content = "From the manual."
+
+        response = self.client.post('/chat',
+            data=json.dumps({'query': 'How do I install it?', 'sources': ['manual.pdf']}),
+            content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        _, kwargs = self.mock_kb.query_with_ids.call_args
+        self.assertEqual(kwargs['sources'], ['manual.pdf'])
+
+        response = self.client.post('/chat',
+            data=json.dumps({'query': 'How do I install it?', 'sources': 'manual.pdf'}),
+            content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_repeated_chat_query_is_answered_from_cache(self):
+        print("Running test: test_repeated_chat_query_is_answered_from_cache")
+        self.mock_kb.query_with_ids.return_value = [("chunk-1", "context from a document")]
+        self.mock_llm.ainvoke.return_value.content = "This is the AI's answer."
+
+        for query in ['What is the refund policy?', 'what is the  refund policy']:
+            response = self.client.post('/chat',
+                data=json.dumps({'query': query}),
+                content_type='application/json')
+            self.assertEqual(response.get_json()['response'], "This is the AI's answer.")
+
+        self.assertEqual(self.mock_llm.ainvoke.await_count, 1)
+        self.assertTrue(response.get_json()['cached'])
+
+        # A knowledge base update invalidates the cached answer
+        self.mock_kb.version = "v2"
+        self.client.post('/chat',
+            data=json.dumps({'query': 'What is the refund policy?'}),
+            content_type='application/json')
+        self.assertEqual(self.mock_llm.ainvoke.await_count, 2)
+
+    def test_metrics_expose_stage_latencies_and_request_ids(self):
+        print("Running test: test_metrics_expose_stage_latencies_and_request_ids")
+        self.mock_kb.query_with_ids.return_value = [("chunk-1", "context from a document")]
+        self.mock_llm.ainvoke.return_value.content = "This is the AI's answer."
+
+        response = self.client.post('/chat', data=json.dumps({'query': 'Where is the manual?'}),
+                                    content_type='application/json', headers={'X-Request-ID': 'req-123'})
+        self.assertEqual(response.headers['X-Request-ID'], 'req-123')
+        self.assertTrue(self.client.get('/').headers['X-Request-ID'])
+
+        metrics = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('chatbot_stage_duration_seconds_count{stage="llm",outcome="ok"}', metrics)
+        self.assertIn('chatbot_stage_duration_seconds_count{stage="prompt_build",outcome="ok"}', metrics)
+        self.assertIn('chatbot_request_duration_seconds_bucket{endpoint="chat",method="POST",status="200",le="+Inf"}',
+                      metrics)
+
+    @patch('app.scrape_urls_async')
+    def test_chat_with_urls_awaits_the_async_path(self, mock_scrape_urls_async):
+        print("Running test: test_chat_with_urls_awaits_the_async_path")
+        mock_scrape_urls_async.return_value = [("Page one text.", None, 'http'), ("Page two text.", None, 'cache')]
+        self.mock_llm.ainvoke.return_value.content = "Both pages agree."
+
+        response = self.client.post('/chat',
+            data=json.dumps({'query': 'Compare https://example.com/1 and https://example.com/2'}),
+            content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['sources'], [{"url": "https://example.com/1", "tier": "http"},
+                                           {"url": "https://example.com/2", "tier": "cache"}])
+        mock_scrape_urls_async.assert_awaited_once_with(['https://example.com/1', 'https://example.com/2'])
+        prompt = self.mock_llm.ainvoke.await_args.args[0][-1].content
+        self.assertIn("Page one text.", prompt)
+        self.assertIn("Page two text.", prompt)
+
+    @patch('app.scrape_urls_async')
+    def test_chat_keeps_failed_pages_out_of_the_prompt(self, mock_scrape_urls_async):
+        print("Running test: test_chat_keeps_failed_pages_out_of_the_prompt")
+        mock_scrape_urls_async.return_value = [
+            ("Page one text.", None, 'http'),
+            ("Error: Could not retrieve content. Details: 500", None, 'error'),
+            ("Error: Timed out while retrieving https://example.com/3.", None, 'timeout'),
+        ]
+        self.mock_llm.ainvoke.return_value.content = "Answer from page one."
+
+        response = self.client.post('/chat',
+            data=json.dumps({'query': 'Summarize https://example.com/1 https://example.com/2 https://example.com/3'}),
+            content_type='application/json')
+
+        data = response.get_json()
+        self.assertEqual(data['timed_out'], ['https://example.com/3'])
+        self.assertEqual([source['tier'] for source in data['sources']], ['http', 'error', 'timeout'])
+        prompt = self.mock_llm.ainvoke.await_args.args[0][-1].content
+        self.assertIn("Page one text.", prompt)
+        self.assertNotIn("Error:", prompt)
+
+    def test_chat_stream_forwards_tokens(self):
+        print("Running test: test_chat_stream_forwards_tokens")
+        self.mock_kb.query_with_ids.return_value = [("chunk-1", "context from a document")]
+        chunks = [MagicMock(content="This is "), MagicMock(content="the AI's answer.")]
+        self.mock_llm.stream.return_value = iter(chunks)
+
+        response = self.client.post('/chat/stream',
+            data=json.dumps({'query': 'A question for the documents'}),
+            content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        body = response.get_data(as_text=True)
+        self.assertIn('event: token\ndata: {"token": "This is "}', body)
+        self.assertIn('event: done\ndata: {"response": "This is the AI\'s answer."', body)
+
+    def test_chat_stream_trace_covers_the_streamed_answer(self):
+        print("Running test: test_chat_stream_trace_covers_the_streamed_answer")
+        self.mock_kb.query_with_ids.return_value = [("chunk-1", "context from a document")]
+        self.mock_llm.stream.return_value = iter([MagicMock(content="An answer.")])
+
+        with patch.object(app_module.RequestTrace, 'finish', autospec=True) as mock_finish:
+            response = self.client.post('/chat/stream',
+                data=json.dumps({'query': 'A question for the documents'}),
+                content_type='application/json')
+            mock_finish.assert_not_called()
+            response.get_data()
+            response.close()
+
+        mock_finish.assert_called_once()
+        trace, endpoint, method, status = mock_finish.call_args.args
+        self.assertEqual((endpoint, method, status), ('chat_stream', 'POST', 200))
+        self.assertIn('llm_stream', trace.stages)
+
+    def test_upload_runs_as_background_job(self):
+        print("Running test: test_upload_runs_as_background_job")
+        added_pages = []
+
+        def add_pages(source, pages, progress=None):
+            added_pages.append((source, list(pages)))
+            return {"added": 1, "skipped": 0, "removed": 0, "failed": 0}
+
+        self.mock_kb.add_pages.side_effect = add_pages
+
+        response = self.client.post('/upload',
+            data={'files': (io.BytesIO(b"Some notes without links."), 'notes.txt')},
+            content_type='multipart/form-data')
+
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['job_id']
+
+        deadline = time.time() + 5
+        status = self.client.get(f'/jobs/{job_id}').get_json()
+        while status['status'] in ('queued', 'running') and time.time() < deadline:
+            time.sleep(0.05)
+            status = self.client.get(f'/jobs/{job_id}').get_json()
+
+        self.assertEqual(status['status'], 'completed')
+        self.assertEqual(status['stages']['parse'], {"status": "completed", "done": 1, "total": 1})
+        self.assertEqual(status['result']['chunks']['added'], 1)
+        self.assertEqual(added_pages, [('notes.txt', [(1, "Some notes without links.")])])
+        self.mock_kb.add_documents.assert_not_called()
+        content_hash = hashlib.sha256(b"Some notes without links.").hexdigest()
+        self.mock_kb.record_content.assert_called_once_with('notes.txt', content_hash)
+        self.assertEqual(os.listdir(self.upload_dir.name), [f"{content_hash}.txt"])
+
+    def test_upload_skips_documents_already_in_the_knowledge_base(self):
+        print("Running test: test_upload_skips_documents_already_in_the_knowledge_base")
+        self.mock_kb.has_content.return_value = True
+
+        response = self.client.post('/upload',
+            data={'files': [(io.BytesIO(b"Same notes."), 'notes.txt')]},
+            content_type='multipart/form-data')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['duplicates'], ['notes.txt'])
+        self.mock_kb.has_content.assert_called_once_with('notes.txt', hashlib.sha256(b"Same notes.").hexdigest())
+        self.assertEqual(os.listdir(self.upload_dir.name), [])
+
+    def test_upload_limits_are_enforced_while_streaming(self):
+        print("Running test: test_upload_limits_are_enforced_while_streaming")
+        too_many = {'files': [(io.BytesIO(f"Document {number}".encode()), f'doc{number}.txt') for number in range(4)]}
+        response = self.client.post('/upload', data=too_many, content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("maximum of 3 documents", response.get_json()['error'])
+
+        with patch('upload_storage.UploadRequest.max_upload_file_bytes', 10):
+            response = self.client.post('/upload',
+                data={'files': (io.BytesIO(b"x" * 100), 'big.txt')},
+                content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(os.listdir(self.upload_dir.name), [])
+        self.mock_kb.add_pages.assert_not_called()
+
+    def test_unknown_job_returns_404(self):
+        print("Running test: test_unknown_job_returns_404")
+        response = self.client.get('/jobs/does-not-exist')
+        self.assertEqual(response.status_code, 404)
 
 
 if __name__ == '__main__':
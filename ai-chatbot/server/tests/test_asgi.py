@@ -0,0 +1,181 @@
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import request_started, request_finished, got_request_exception
+
+import asgi
+from app import app as flask_app
+from answer_cache import AnswerCache
+
+
+async def call(method: str, path: str, body_chunks: list[bytes] = (), headers: list = ()):
+    """Sends one HTTP request through the ASGI app and returns the messages it sent back."""
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(body_chunks) - 1}
+                for i, chunk in enumerate(body_chunks)] or [{'type': 'http.request', 'body': b"", 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b"", 'root_path': '',
+             'headers': [(b'content-type', b'application/json'), *headers], 'http_version': '1.1',
+             'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 50000)}
+    await asgi.app(scope, receive, send)
+    return sent
+
+
+def response_of(sent: list) -> tuple:
+    """Returns (status, headers, body) of the messages sent for one response."""
+    start = sent[0]
+    body = b"".join(message.get('body', b"") for message in sent[1:])
+    return start['status'], dict(start['headers']), body
+
+
+class TestAsgi(unittest.TestCase):
+
+    def setUp(self):
+        print("Setting up for an ASGI app test")
+        flask_app.config['TESTING'] = True
+        self.kb_patch = patch('app.get_kb')
+        self.llm_patch = patch('app.get_llm')
+        self.answer_cache_patch = patch('app.answer_cache', AnswerCache())
+        self.mock_kb = self.kb_patch.start().return_value
+        self.mock_llm = self.llm_patch.start().return_value
+        self.answer_cache_patch.start()
+        self.mock_kb.version = "v1"
+        self.mock_kb.embed_query.return_value = [1.0, 0.0]
+        self.mock_kb.has_content.return_value = False
+        self.mock_kb.query_with_ids.return_value = [("chunk-1", "context from a document")]
+        self.mock_llm.ainvoke = AsyncMock()
+
+    def tearDown(self):
+        self.kb_patch.stop()
+        self.llm_patch.stop()
+        self.answer_cache_patch.stop()
+
+    def test_concurrent_chats_run_on_the_event_loop_without_threads(self):
+        print("Running test: test_concurrent_chats_run_on_the_event_loop_without_threads")
+        both_in_flight = None
+        in_flight = 0
+        threads = set()
+
+        async def ainvoke(messages):
+            nonlocal in_flight
+            threads.add(threading.current_thread())
+            in_flight += 1
+            if in_flight == 2:
+                both_in_flight.set()
+            await asyncio.wait_for(both_in_flight.wait(), timeout=5)
+            return MagicMock(content="This is the AI's answer.")
+        self.mock_llm.ainvoke.side_effect = ainvoke
+
+        async def two_chats():
+            nonlocal both_in_flight
+            both_in_flight = asyncio.Event()
+            return await asyncio.gather(
+                call('POST', '/chat', [json.dumps({'query': 'A first question'}).encode()]),
+                call('POST', '/chat', [json.dumps({'query': 'A second question'}).encode()]))
+
+        # With no thread left for synchronous routes, the chats can only finish on the loop itself
+        blocker = threading.Event()
+        with patch('asgi._executor', ThreadPoolExecutor(max_workers=1)) as executor:
+            executor.submit(blocker.wait, 5)
+            try:
+                results = asyncio.run(two_chats())
+            finally:
+                blocker.set()
+
+        for sent in results:
+            status, headers, body = response_of(sent)
+            self.assertEqual(status, 200)
+            self.assertIn(b'x-request-id', headers)
+            self.assertEqual(json.loads(body)['response'], "This is the AI's answer.")
+        self.assertEqual(threads, {threading.main_thread()})
+
+    def test_sync_routes_stream_the_request_and_the_response(self):
+        print("Running test: test_sync_routes_stream_the_request_and_the_response")
+        self.mock_llm.stream.return_value = iter([MagicMock(content="This is "), MagicMock(content="the AI's answer.")])
+        body = json.dumps({'query': 'A question for the documents'}).encode()
+
+        sent = asyncio.run(call('POST', '/chat/stream', [body[:10], body[10:]],
+                                headers=[(b'content-length', str(len(body)).encode())]))
+
+        status, headers, response_body = response_of(sent)
+        self.assertEqual(status, 200)
+        self.assertTrue(headers[b'content-type'].startswith(b'text/event-stream'))
+        self.assertGreater(len(sent), 3)
+        self.assertIn(b'event: token\ndata: {"token": "This is "}', response_body)
+        self.assertIn(b'event: done', response_body)
+
+    def test_errors_are_answered_like_under_wsgi(self):
+        print("Running test: test_errors_are_answered_like_under_wsgi")
+        status, _, body = response_of(asyncio.run(call('GET', '/jobs/unknown')))
+        self.assertEqual(status, 404)
+
+        status, _, body = response_of(asyncio.run(call('POST', '/chat', [b'{"history": []}'])))
+        self.assertEqual(status, 400)
+        self.assertIn('error', json.loads(body))
+
+    def test_async_views_send_flask_signals(self):
+        print("Running test: test_async_views_send_flask_signals")
+        self.mock_llm.ainvoke.return_value.content = "This is the AI's answer."
+        received = []
+
+        def receiver(sender, **extra):
+            received.append(extra.get('response', 'started'))
+
+        with request_started.connected_to(receiver, flask_app), request_finished.connected_to(receiver, flask_app):
+            sent = asyncio.run(call('POST', '/chat', [json.dumps({'query': 'A question'}).encode()]))
+
+        self.assertEqual(response_of(sent)[0], 200)
+        self.assertEqual(received[0], 'started')
+        self.assertEqual(received[1].status_code, 200)
+
+    def test_errors_while_finalizing_an_async_view_are_handled_by_flask(self):
+        print("Running test: test_errors_while_finalizing_an_async_view_are_handled_by_flask")
+        self.mock_llm.ainvoke.return_value.content = "This is the AI's answer."
+        exceptions = []
+
+        def receiver(sender, exception, **extra):
+            exceptions.append(exception)
+
+        with patch.dict(flask_app.config, {'PROPAGATE_EXCEPTIONS': False}), \
+                patch.object(flask_app, 'process_response', side_effect=RuntimeError("after_request failed")), \
+                got_request_exception.connected_to(receiver, flask_app):
+            sent = asyncio.run(call('POST', '/chat', [json.dumps({'query': 'A question'}).encode()]))
+
+        self.assertEqual(response_of(sent)[0], 500)
+        self.assertEqual([str(exception) for exception in exceptions], ["after_request failed"])
+
+    def test_lifespan_startup_starts_the_warmup(self):
+        print("Running test: test_lifespan_startup_starts_the_warmup")
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        with patch('asgi.start_warmup') as mock_start_warmup:
+            asyncio.run(asgi.app({'type': 'lifespan'}, receive, send))
+
+        mock_start_warmup.assert_called_once()
+        self.assertEqual([message['type'] for message in sent],
+                         ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+if __name__ == '__main__':
+    unittest.main()
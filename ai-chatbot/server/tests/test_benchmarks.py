@@ -0,0 +1,65 @@
+import json
+import tempfile
+import unittest
+import subprocess
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.run import compare
+from benchmarks.corpus import generate_corpus
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_generate_corpus(self):
+        print("Running test: test_generate_corpus")
+        with tempfile.TemporaryDirectory() as directory:
+            paths = generate_corpus(directory, txt_files=2, pdf_files=1, words_per_file=300, pdf_pages=2,
+                                    links=["http://127.0.0.1/page/1"])
+            self.assertEqual(len(paths), 3)
+            self.assertEqual(sum(path.endswith('.pdf') for path in paths), 1)
+            with open(paths[0], encoding='utf-8') as f:
+                self.assertIn("http://127.0.0.1/page/1", f.read())
+
+            from tools import iter_file_pages
+            pdf_path = [path for path in paths if path.endswith('.pdf')][0]
+            with open(pdf_path, 'rb') as f:
+                pages = iter_file_pages(f, os.path.basename(pdf_path))
+                self.assertTrue("".join(text for _, text in pages).strip())
+
+    def test_compare_flags_regressions(self):
+        print("Running test: test_compare_flags_regressions")
+        baseline = {"upload": {"chunks_per_second": 100.0}, "chat": {"p50_ms": 500.0, "p99_ms": 900.0}}
+        results = {"upload": {"chunks_per_second": 80.0}, "chat": {"p50_ms": 505.0, "p99_ms": 1200.0}}
+
+        regressions = compare(results, baseline, tolerance=0.1)
+
+        self.assertEqual(sorted(regressions), ["chat.p99_ms", "upload.chunks_per_second"])
+
+    def test_run_small_benchmark(self):
+        print("Running test: test_run_small_benchmark")
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            command = [sys.executable, '-m', 'benchmarks.run', '--txt-files', '1', '--pdf-files', '1',
+                       '--words-per-file', '400', '--pdf-pages', '2', '--links-per-file', '1', '--clients', '2',
+                       '--requests-per-client', '2', '--url-fraction', '0.5', '--llm-latency', '0',
+                       '--embed-latency', '0', '--web-latency', '0', '--output', output]
+            completed = subprocess.run(command, cwd=SERVER_DIR, capture_output=True, text=True, timeout=240)
+            self.assertEqual(completed.returncode, 0, completed.stderr[-2000:])
+
+            with open(output, encoding='utf-8') as f:
+                results = json.load(f)
+            self.assertEqual(results["upload"]["failed_jobs"], 0)
+            self.assertGreater(results["upload"]["chunks"], 0)
+            self.assertEqual(results["chat"]["requests"], 4)
+            self.assertEqual(results["chat"]["errors"], 0)
+            self.assertGreater(results["memory"]["peak_rss_mb"], 0)
+            self.assertIn("llm", results["stages"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bm25_index import BM25Index, LexicalReranker, reciprocal_rank_fusion, tokenize
+from token_budget import estimate_tokens, take_within_budget
+
+
+class TestBM25Index(unittest.TestCase):
+
+    def setUp(self):
+        print("Setting up for a BM25 index test")
+        self.index = BM25Index()
+        self.index.add('a', "Error ERR-4711 means the toner is empty.", {"source": "errors.txt"})
+        self.index.add('b', "The printer supports duplex printing.", {"source": "manual.pdf"})
+        self.index.add('c', "Order SKU_1234 for a replacement toner.", {"source": "manual.pdf", "filename": "manual.pdf"})
+
+    def test_compound_terms_are_kept_whole_and_split(self):
+        print("Running test: test_compound_terms_are_kept_whole_and_split")
+        self.assertEqual(tokenize("See ERR-4711!"), ['see', 'err-4711', 'err', '4711'])
+
+    def test_search_ranks_exact_matches_and_applies_source_filter(self):
+        print("Running test: test_search_ranks_exact_matches_and_applies_source_filter")
+        self.assertEqual(self.index.search("err-4711")[0][0], 'a')
+        self.assertEqual(sorted(doc_id for doc_id, _ in self.index.search("toner")), ['a', 'c'])
+        self.assertEqual([doc_id for doc_id, _ in self.index.search("toner", sources=['manual.pdf'])], ['c'])
+
+    def test_replace_and_remove(self):
+        print("Running test: test_replace_and_remove")
+        self.index.add('a', "Nothing relevant here.", {"source": "errors.txt"})
+        self.assertEqual(self.index.search("err-4711"), [])
+        self.index.remove(['b', 'c', 'missing'])
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.search("toner"), [])
+
+
+class TestFusionAndBudget(unittest.TestCase):
+
+    def test_reciprocal_rank_fusion_rewards_agreement(self):
+        print("Running test: test_reciprocal_rank_fusion_rewards_agreement")
+        self.assertEqual(reciprocal_rank_fusion([['x', 'y', 'z'], ['y']]), ['y', 'x', 'z'])
+
+    def test_reranker_prefers_passages_covering_the_query(self):
+        print("Running test: test_reranker_prefers_passages_covering_the_query")
+        passages = [('1', "toner levels"), ('2', "ERR-4711 means low toner"), ('3', "unrelated")]
+        self.assertEqual([chunk_id for chunk_id, _ in LexicalReranker()("ERR-4711 toner", passages)], ['2', '1', '3'])
+
+    def test_take_within_budget_keeps_at_least_one_item(self):
+        print("Running test: test_take_within_budget_keeps_at_least_one_item")
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+        self.assertEqual(take_within_budget(["a" * 40, "b" * 40, "c" * 40], 20), ["a" * 40, "b" * 40])
+        self.assertEqual(take_within_budget(["a" * 400], 20), ["a" * 400])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+import unittest
+import threading
+import time
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from browser_pool import BrowserPool
+
+
+class FakeDriver:
+    """A stand-in for a Selenium WebDriver."""
+
+    def __init__(self):
+        self.visited = []
+        self.quit_called = False
+        self.healthy = True
+        self.page_source = ""
+        self.body_text = ""
+        self.page_load_timeout = None
+
+    def set_page_load_timeout(self, seconds):
+        self.page_load_timeout = seconds
+
+    def get(self, url):
+        self.visited.append(url)
+        self.page_source = f"<html><body>{url}</body></html>"
+        self.body_text = url
+
+    def execute_script(self, script):
+        if not self.healthy:
+            raise RuntimeError("browser crashed")
+        return len(self.body_text) if 'innerText' in script else 1
+
+    def quit(self):
+        self.quit_called = True
+
+
+class TestBrowserPool(unittest.TestCase):
+
+    def setUp(self):
+        print("Setting up for a BrowserPool test")
+        self.drivers = []
+
+        def factory():
+            driver = FakeDriver()
+            self.drivers.append(driver)
+            return driver
+
+        self.pool = BrowserPool(driver_factory=factory, size=2, max_pages=3, checkout_timeout=0.1, poll_seconds=0.01)
+
+    def test_sessions_are_reused(self):
+        print("Running test: test_sessions_are_reused")
+        for _ in range(2):
+            self.assertIn("example.com", self.pool.fetch_page_source("https://example.com"))
+
+        self.assertEqual(len(self.drivers), 1)
+        self.assertEqual(len(self.drivers[0].visited), 2)
+
+    def test_session_recycled_after_max_pages(self):
+        print("Running test: test_session_recycled_after_max_pages")
+        for _ in range(4):
+            self.pool.fetch_page_source("https://example.com")
+
+        self.assertEqual(len(self.drivers), 2)
+        self.assertTrue(self.drivers[0].quit_called)
+
+    def test_unhealthy_session_is_discarded(self):
+        print("Running test: test_unhealthy_session_is_discarded")
+        with self.pool.session() as driver:
+            driver.healthy = False
+
+        self.pool.fetch_page_source("https://example.com")
+        self.assertTrue(self.drivers[0].quit_called)
+        self.assertEqual(len(self.drivers), 2)
+
+    def test_checkout_times_out_when_pool_exhausted(self):
+        print("Running test: test_checkout_times_out_when_pool_exhausted")
+        release = threading.Event()
+        holders = []
+
+        def hold():
+            with self.pool.session():
+                holders.append(True)
+                release.wait()
+
+        threads = [threading.Thread(target=hold) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        while len(holders) < 2:
+            time.sleep(0.01)
+
+        with self.assertRaises(TimeoutError):
+            with self.pool.session():
+                pass
+
+        release.set()
+        for thread in threads:
+            thread.join()
+
+    def test_ready_wait_lasts_until_scripts_render_the_content(self):
+        print("Running test: test_ready_wait_lasts_until_scripts_render_the_content")
+
+        class ScriptRenderedDriver(FakeDriver):
+            """Serves an empty app shell, then renders the content in two steps."""
+
+            def get(self, url):
+                self.visited.append(url)
+                self.body_text = ""
+                self.polls = 0
+
+            def execute_script(self, script):
+                self.polls += 1
+                if self.polls == 2:
+                    self.body_text = "Loading"
+                elif self.polls == 4:
+                    self.body_text = "The rendered article text"
+                self.page_source = f"<html><body>{self.body_text}</body></html>"
+                return super().execute_script(script)
+
+        pool = BrowserPool(driver_factory=ScriptRenderedDriver, size=1, wait_seconds=2, poll_seconds=0.01)
+
+        self.assertIn("The rendered article text", pool.fetch_page_source("https://example.com/app"))
+
+    def test_waiter_replaces_a_recycled_session(self):
+        print("Running test: test_waiter_replaces_a_recycled_session")
+        pool = BrowserPool(driver_factory=FakeDriver, size=1, max_pages=1, checkout_timeout=5, poll_seconds=0.01)
+        entered = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with pool.session():
+                entered.set()
+                release.wait()
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        entered.wait()
+        threading.Timer(0.1, release.set).start()
+
+        started = time.monotonic()
+        self.assertIn("example.com", pool.fetch_page_source("https://example.com"))
+        self.assertLess(time.monotonic() - started, 2)
+        holder.join()
+
+    def test_fetch_timeout_bounds_the_checkout_and_page_load(self):
+        print("Running test: test_fetch_timeout_bounds_the_checkout_and_page_load")
+        pool = BrowserPool(driver_factory=FakeDriver, size=1, checkout_timeout=5, poll_seconds=0.01)
+        release = threading.Event()
+        entered = threading.Event()
+
+        def hold():
+            with pool.session():
+                entered.set()
+                release.wait()
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        entered.wait()
+
+        started = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            pool.fetch_page_source("https://example.com", timeout=0.2)
+        self.assertLess(time.monotonic() - started, 1)
+
+        release.set()
+        holder.join()
+        pool.fetch_page_source("https://example.com", timeout=3)
+        self.assertLessEqual(pool._idle[0].page_load_timeout, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import threading
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from embedding_cache import QueryEmbeddingCache, QueryEmbeddingBatcher
+
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+
+    def test_round_trip_and_eviction(self):
+        print("Running test: test_round_trip_and_eviction")
+        cache = QueryEmbeddingCache(':memory:', namespace='model-a', max_entries=2, hot_entries=1)
+        cache.put("first", [0.5, 0.25])
+        cache.put("second", [1.0, 0.0])
+        self.assertEqual(cache.get("first"), [0.5, 0.25])
+        cache.put("third", [0.0, 1.0])
+
+        self.assertIsNone(cache.get("second"))
+        self.assertEqual(cache.get("first"), [0.5, 0.25])
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_hits_do_not_write_until_the_access_flush(self):
+        print("Running test: test_hits_do_not_write_until_the_access_flush")
+        cache = QueryEmbeddingCache(':memory:', namespace='model-a')
+        cache.put("first", [0.5, 0.25])
+        writes = cache._conn.total_changes
+        for _ in range(3):
+            self.assertEqual(cache.get("first"), [0.5, 0.25])
+        self.assertEqual(cache._conn.total_changes, writes)
+        cache.access_flush_seconds = 0
+        cache.get("first")
+        self.assertEqual(cache._conn.total_changes, writes + 1)
+
+    def test_batcher_coalesces_concurrent_queries(self):
+        print("Running test: test_batcher_coalesces_concurrent_queries")
+        batches = []
+
+        def embed_batch(texts):
+            batches.append(list(texts))
+            return [[float(len(text))] for text in texts]
+
+        batcher = QueryEmbeddingBatcher(embed_batch, window_ms=2000, max_batch=3)
+        results = {}
+
+        def ask(text):
+            results[text] = batcher.embed(text)
+
+        threads = [threading.Thread(target=ask, args=(text,)) for text in ("a", "bb", "ccc")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(results, {"a": [1.0], "bb": [2.0], "ccc": [3.0]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from embeddings import (EmbeddingProvider, HashingEmbeddingProvider, create_embedding_provider,
+                        provider_for_key, collection_name_for, LEGACY_EMBEDDING_KEY)
+
+
+class TestHashingEmbeddingProvider(unittest.TestCase):
+
+    def test_vectors_are_normalized_and_batch_consistent(self):
+        print("Running test: test_vectors_are_normalized_and_batch_consistent")
+        provider = HashingEmbeddingProvider(dimensions=128)
+        texts = ["Error ERR-404 means the page is missing.", "Restart the router twice.", ""]
+
+        vectors = np.array(provider.embed_documents(texts))
+
+        self.assertEqual(vectors.shape, (3, 128))
+        np.testing.assert_allclose(np.linalg.norm(vectors[:2], axis=1), [1.0, 1.0], rtol=1e-5)
+        self.assertFalse(vectors[2].any())
+        np.testing.assert_allclose(provider.embed_query(texts[0]), vectors[0], rtol=1e-6)
+
+        query = np.array(provider.embed_query("what does err-404 mean"))
+        self.assertGreater(query @ vectors[0], query @ vectors[1])
+
+    def test_backends_are_keyed_and_validated(self):
+        print("Running test: test_backends_are_keyed_and_validated")
+        provider = create_embedding_provider('hashing')
+        self.assertEqual(provider.key, "hashing:v1-1024")
+        self.assertEqual(provider.collection_name, "kb-hashing-v1-1024")
+        self.assertEqual(collection_name_for(LEGACY_EMBEDDING_KEY), "langchain")
+        with self.assertRaises(ValueError):
+            create_embedding_provider('word2vec')
+
+    def test_providers_are_recreated_from_their_key(self):
+        print("Running test: test_providers_are_recreated_from_their_key")
+        provider = provider_for_key("hashing:v1-64")
+        self.assertEqual(provider.dimensions, 64)
+        self.assertEqual(len(provider.embed_query("router")), 64)
+
+        class QueryOnlyProvider(EmbeddingProvider):
+            def embed_query(self, text):
+                return [1.0]
+
+        with self.assertRaises(TypeError):
+            QueryOnlyProvider()
+
+
+if __name__ == '__main__':
+    unittest.main()
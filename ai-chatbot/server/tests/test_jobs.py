@@ -0,0 +1,83 @@
+import unittest
+import threading
+import time
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from jobs import JobManager, JobQueueFull
+
+
+def wait_for(job, timeout=5):
+    deadline = time.time() + timeout
+    while job.status in ('queued', 'running') and time.time() < deadline:
+        time.sleep(0.01)
+
+
+class TestJobManager(unittest.TestCase):
+
+    def setUp(self):
+        print("Setting up for a JobManager test")
+        self.manager = JobManager(max_workers=1, max_pending=1, history_limit=10)
+
+    def test_job_reports_progress_and_result(self):
+        print("Running test: test_job_reports_progress_and_result")
+
+        def work(job, count):
+            job.progress('parse', total=count)
+            for _ in range(count):
+                job.progress('parse', done=1)
+            job.finish_stage('parse')
+            return {"parsed": count}
+
+        job = self.manager.submit(work, 3)
+        wait_for(job)
+
+        status = self.manager.get(job.id).to_dict()
+        self.assertEqual(status['status'], 'completed')
+        self.assertEqual(status['result'], {"parsed": 3})
+        self.assertEqual(status['stages']['parse'], {"status": "completed", "done": 3, "total": 3})
+        self.assertEqual(status['stages']['embed']['status'], 'pending')
+
+    def test_failed_job_records_error(self):
+        print("Running test: test_failed_job_records_error")
+
+        def work(job):
+            raise ValueError("nothing to ingest")
+
+        job = self.manager.submit(work)
+        wait_for(job)
+
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, "nothing to ingest")
+
+    def test_job_with_reported_errors_is_partial(self):
+        print("Running test: test_job_with_reported_errors_is_partial")
+
+        def work(job):
+            job.report_error("a.pdf: corrupt page 2")
+            return {"added": 1}
+
+        job = self.manager.submit(work)
+        wait_for(job)
+
+        self.assertEqual(job.status, 'partial')
+        self.assertEqual(job.error, "a.pdf: corrupt page 2")
+        self.assertEqual(job.result, {"added": 1})
+
+    def test_queue_is_bounded(self):
+        print("Running test: test_queue_is_bounded")
+        release = threading.Event()
+        running = self.manager.submit(lambda job: release.wait())
+        while running.status == 'queued':
+            time.sleep(0.01)
+        self.manager.submit(lambda job: None)
+
+        with self.assertRaises(JobQueueFull):
+            self.manager.submit(lambda job: None)
+        release.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
 import unittest
+import tempfile
+import threading
+import shutil
 from unittest.mock import patch, MagicMock
+from langchain_core.embeddings import Embeddings
 
 import sys
 import os
@@ -19,20 +23,20 @@ class TestKnowledgeBase(unittest.TestCase):
         print("Setting up for a KnowledgeBase test")
 
         # --- CORRECTED PATCH TARGETS ---
-        # We patch the names as they are looked up inside the 'knowledge_base.py' module.
-        self.patcher_configure = patch('knowledge_base.genai.configure')
-        self.patcher_embeddings = patch('knowledge_base.GoogleGenerativeAIEmbeddings')
-        self.patcher_chroma = patch('knowledge_base.Chroma')
-        self.patcher_splitter = patch('knowledge_base.RecursiveCharacterTextSplitter')
+        # KnowledgeBase imports these lazily, so we patch them in the modules that define them.
+        self.patcher_env = patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key"})
+        self.patcher_embeddings = patch('langchain_google_genai.GoogleGenerativeAIEmbeddings')
+        self.patcher_chroma = patch('langchain_chroma.Chroma')
+        self.patcher_splitter = patch('langchain.text_splitter.RecursiveCharacterTextSplitter')
 
         # Start the patchers and get the mock objects
-        self.MockConfigure = self.patcher_configure.start()
+        self.patcher_env.start()
         self.MockEmbeddings = self.patcher_embeddings.start()
         self.MockChroma = self.patcher_chroma.start()
         self.MockSplitter = self.patcher_splitter.start()
 
         # Ensure the patchers are stopped after the test runs
-        self.addCleanup(self.patcher_configure.stop)
+        self.addCleanup(self.patcher_env.stop)
         self.addCleanup(self.patcher_embeddings.stop)
         self.addCleanup(self.patcher_chroma.stop)
         self.addCleanup(self.patcher_splitter.stop)
@@ -45,17 +49,81 @@ class TestKnowledgeBase(unittest.TestCase):
         self.MockSplitter.return_value.split_text.return_value = ['chunk1', 'chunk2']
        
         # Now that mocks are active, we can import and initialize KnowledgeBase
+        # on a temporary directory, which also holds the query embedding cache
         from knowledge_base import KnowledgeBase
-        self.kb = KnowledgeBase()
+        self.persist_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.persist_directory, ignore_errors=True)
+        self.kb = KnowledgeBase(persist_directory=self.persist_directory)
 
     def test_add_documents(self):
         """Tests if the add_documents method correctly calls the vector store."""
         print("Running test: test_add_documents")
         documents = ["This is the first document."]
+        version_before = self.kb.version
         self.kb.add_documents(documents)
+        self.assertNotEqual(self.kb.version, version_before)
        
         # Assert that the method on our MOCK INSTANCE was called
-        self.mock_vector_store_instance.add_texts.assert_called_with(texts=['chunk1', 'chunk2'])
+        _, kwargs = self.mock_vector_store_instance.add_texts.call_args
+        self.assertEqual(kwargs['texts'], ['chunk1', 'chunk2'])
+        self.assertEqual(len(set(kwargs['ids'])), 2)
+
+    def test_add_documents_skips_existing_and_removes_stale_chunks(self):
+        """Tests that re-adding a source only stores changed chunks."""
+        print("Running test: test_add_documents_skips_existing_and_removes_stale_chunks")
+        existing_id = self.kb._chunk_id('doc.txt', 'chunk1')
+        self.mock_vector_store_instance.get.return_value = {"ids": [existing_id, 'outdated-id']}
+
+        summary = self.kb.add_documents(["An updated document."], sources=['doc.txt'])
+
+        _, kwargs = self.mock_vector_store_instance.add_texts.call_args
+        self.assertEqual(kwargs['texts'], ['chunk2'])
+        self.assertEqual(kwargs['ids'], [self.kb._chunk_id('doc.txt', 'chunk2')])
+        self.assertEqual(kwargs['metadatas'][0]['source'], 'doc.txt')
+        self.mock_vector_store_instance.delete.assert_called_once_with(ids=['outdated-id'])
+        self.assertEqual(summary, {"added": 1, "skipped": 1, "removed": 1, "failed": 0})
+
+    def test_add_pages_streams_pages_into_the_store(self):
+        """Tests that pages are split one by one and duplicate chunks are stored once."""
+        print("Running test: test_add_pages_streams_pages_into_the_store")
+        self.MockSplitter.return_value.split_text.side_effect = lambda text: [text, 'shared footer']
+        pages = iter([(1, 'page one'), (2, 'page two')])
+
+        summary = self.kb.add_pages('manual.pdf', pages)
+
+        _, kwargs = self.mock_vector_store_instance.add_texts.call_args
+        self.assertEqual(kwargs['texts'], ['page one', 'shared footer', 'page two'])
+        self.assertEqual([metadata['page'] for metadata in kwargs['metadatas']], [1, 1, 2])
+        self.assertEqual(kwargs['metadatas'][0]['filename'], 'manual.pdf')
+        self.assertIn('uploaded_at', kwargs['metadatas'][0])
+        self.assertEqual(summary["added"], 3)
+
+    def test_add_pages_keeps_the_chunks_stored_before_a_parse_error(self):
+        """Tests that a document failing halfway reports what was stored and bumps the version."""
+        print("Running test: test_add_pages_keeps_the_chunks_stored_before_a_parse_error")
+        self.MockSplitter.return_value.split_text.side_effect = lambda text: [text]
+        self.mock_vector_store_instance.get.return_value = {"ids": ['outdated-id']}
+        self.kb.embed_batch_size = 1
+
+        def pages():
+            yield 1, 'page one'
+            raise ValueError("corrupt page 2")
+
+        version_before = self.kb.version
+        summary = self.kb.add_pages('manual.pdf', pages())
+
+        self.assertEqual(summary["added"], 1)
+        self.assertEqual(summary["removed"], 0)
+        self.assertIn("corrupt page 2", summary["error"])
+        self.mock_vector_store_instance.delete.assert_not_called()
+        self.assertNotEqual(self.kb.version, version_before)
+
+    def test_missing_api_key_raises_instead_of_exiting(self):
+        print("Running test: test_missing_api_key_raises_instead_of_exiting")
+        from knowledge_base import KnowledgeBase
+        with patch.dict(os.environ, {"GOOGLE_API_KEY": ""}):
+            with self.assertRaises(RuntimeError):
+                KnowledgeBase(persist_directory=self.persist_directory)
 
     def test_query(self):
         """Tests if the query method correctly calls similarity_search."""
@@ -63,13 +131,151 @@ class TestKnowledgeBase(unittest.TestCase):
         # Define what our mock search should return
         mock_doc = MagicMock()
         mock_doc.page_content = "relevant chunk of text"
-        self.mock_vector_store_instance.similarity_search.return_value = [mock_doc]
+        self.mock_vector_store_instance.similarity_search_by_vector.return_value = [mock_doc]
+        self.MockEmbeddings.return_value.embed_query.return_value = [0.5, 0.25]
        
         results = self.kb.query("A question")
        
-        # Check that the similarity_search method was called
-        self.mock_vector_store_instance.similarity_search.assert_called_with("A question")
+        # Check that the similarity search was run with the question's embedding
+        self.mock_vector_store_instance.similarity_search_by_vector.assert_called_with([0.5, 0.25], k=10, filter=None)
         self.assertEqual(results, ["relevant chunk of text"])
 
+    def test_query_pushes_source_filter_down(self):
+        """Tests that a source filter is passed to the Chroma search."""
+        print("Running test: test_query_pushes_source_filter_down")
+        self.MockEmbeddings.return_value.embed_query.return_value = [0.5, 0.25]
+        self.mock_vector_store_instance.similarity_search_by_vector.return_value = []
+
+        self.kb.query("A question", sources=['manual.pdf'])
+
+        _, kwargs = self.mock_vector_store_instance.similarity_search_by_vector.call_args
+        self.assertEqual(kwargs['filter'], {"$or": [{"source": {"$in": ['manual.pdf']}},
+                                                    {"filename": {"$in": ['manual.pdf']}}]})
+
+    def test_query_embeddings_are_cached(self):
+        """Tests that repeated questions reuse the cached query embedding."""
+        print("Running test: test_query_embeddings_are_cached")
+        embed_query = self.MockEmbeddings.return_value.embed_query
+        embed_query.return_value = [0.5, 0.25]
+
+        self.assertEqual(self.kb.embed_query("A repeated question"), [0.5, 0.25])
+        self.assertEqual(self.kb.embed_query("A repeated question"), [0.5, 0.25])
+
+        embed_query.assert_called_once_with("A repeated question")
+
+
+class StubEmbeddings(Embeddings):
+    """Deterministic embeddings that hit a quota error on the first call."""
+
+    def __init__(self):
+        self.calls = 0
+        self.batch_sizes = []
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.calls == 1:
+            raise Exception("429 Resource has been exhausted (e.g. check quota).")
+        self.batch_sizes.append(len(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+class TestEmbeddingPipeline(unittest.TestCase):
+
+    def setUp(self):
+        """Builds a KnowledgeBase on a real, temporary Chroma store with stub embeddings."""
+        print("Setting up for an embedding pipeline test")
+        self.persist_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.persist_directory, ignore_errors=True)
+        self.embeddings = StubEmbeddings()
+
+        patcher_env = patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key"})
+        patcher_embeddings = patch('langchain_google_genai.GoogleGenerativeAIEmbeddings', return_value=self.embeddings)
+        patcher_sleep = patch('knowledge_base.time.sleep')
+        for patcher in (patcher_env, patcher_embeddings, patcher_sleep):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        from knowledge_base import KnowledgeBase
+        self.kb = KnowledgeBase(persist_directory=self.persist_directory)
+        self.kb.embed_batch_size = 4
+        self.kb.embed_concurrency = 2
+
+    def test_chunks_are_batched_and_retried_on_quota_errors(self):
+        print("Running test: test_chunks_are_batched_and_retried_on_quota_errors")
+        document = "\n\n".join(f"Paragraph number {i}. " * 60 for i in range(10))
+
+        summary = self.kb.add_documents([document], sources=['manual.txt'])
+
+        self.assertEqual(summary["failed"], 0)
+        self.assertGreater(summary["added"], 4)
+        self.assertTrue(all(size <= 4 for size in self.embeddings.batch_sizes))
+        self.assertEqual(len(self.kb.vector_store.get()["ids"]), summary["added"])
+
+    def test_hybrid_query_finds_exact_terms_within_the_token_budget(self):
+        print("Running test: test_hybrid_query_finds_exact_terms_within_the_token_budget")
+        self.embeddings.calls = 1
+        self.kb.add_documents(["The printer is out of paper.", "Restart the router twice."],
+                              sources=['faq.txt', 'network.txt'])
+        self.assertEqual(len(self.kb.query("ERR-4711")), 2)
+
+        # Chunks added after the lexical index was built are searchable straight away
+        self.kb.add_documents(["Error ERR-4711 means the toner cartridge is empty."], sources=['errors.txt'])
+        self.assertEqual(len(self.kb.bm25_index), 3)
+        self.kb.context_token_budget = 5
+        self.assertEqual(self.kb.query("what does ERR-4711 mean"),
+                         ["Error ERR-4711 means the toner cartridge is empty."])
+        self.assertEqual(self.kb.query("ERR-4711", sources=['network.txt']), ["Restart the router twice."])
+
+    def test_switching_embedding_backend_reindexes_the_store(self):
+        print("Running test: test_switching_embedding_backend_reindexes_the_store")
+        self.embeddings.calls = 1
+        self.kb.add_documents(["The printer is out of paper.", "Restart the router twice."],
+                              sources=['faq.txt', 'network.txt'])
+
+        from knowledge_base import KnowledgeBase
+        from embeddings import HashingEmbeddingProvider
+        reindex_from = KnowledgeBase._reindex_from
+        release = threading.Event()
+
+        def blocked_reindex_from(kb, *args):
+            release.wait(timeout=10)
+            return reindex_from(kb, *args)
+
+        with patch.object(KnowledgeBase, '_reindex_from', blocked_reindex_from):
+            local_kb = KnowledgeBase(persist_directory=self.persist_directory,
+                                     embedding_provider=HashingEmbeddingProvider(dimensions=64))
+
+            # Until the re-index finishes, questions are answered from the previous collection
+            self.assertFalse(local_kb.wait_for_reindex(timeout=0))
+            self.assertEqual(local_kb.embedding_model.key, "google:models/embedding-001")
+            self.assertEqual(len(local_kb.query("router")), 2)
+            release.set()
+            self.assertTrue(local_kb.wait_for_reindex(timeout=10))
+
+        self.assertEqual(local_kb.reindex_status, "completed")
+        self.assertEqual(local_kb.embedding_model.key, "hashing:v1-64")
+        self.assertEqual(sorted(local_kb.vector_store.get()["documents"]),
+                         ["Restart the router twice.", "The printer is out of paper."])
+        with open(os.path.join(self.persist_directory, 'embedding_backend'), encoding='utf-8') as f:
+            self.assertEqual(f.read(), "hashing:v1-64")
+
+        local_kb.context_token_budget = 5
+        self.assertEqual(local_kb.query("router restart"), ["Restart the router twice."])
+
+    def test_content_hashes_are_recorded_per_source(self):
+        print("Running test: test_content_hashes_are_recorded_per_source")
+        self.assertFalse(self.kb.has_content('manual.pdf', 'abc'))
+
+        self.kb.record_content('manual.pdf', 'abc')
+        self.kb.record_content('manual.pdf', 'def')
+
+        self.assertFalse(self.kb.has_content('manual.pdf', 'abc'))
+        self.assertTrue(self.kb.has_content('manual.pdf', 'def'))
+        self.assertFalse(self.kb.has_content('notes.txt', 'def'))
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,62 @@
+import unittest
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from metrics import Histogram, RequestTrace, RequestIdFilter, span, timed, in_current_context, request_id_var
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_renders_cumulative_buckets(self):
+        print("Running test: test_histogram_renders_cumulative_buckets")
+        histogram = Histogram('test_seconds', 'Test histogram.', ('stage',), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, 'scrape')
+
+        lines = histogram.render()
+
+        self.assertIn('# TYPE test_seconds histogram', lines)
+        self.assertIn('test_seconds_bucket{stage="scrape",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="scrape",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="scrape",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{stage="scrape"} 3', lines)
+
+    def test_spans_feed_the_request_breakdown(self):
+        print("Running test: test_spans_feed_the_request_breakdown")
+        @timed('test_async_stage')
+        async def async_stage():
+            return 'done'
+
+        def run_request():
+            trace = RequestTrace('req-1')
+            self.assertEqual(asyncio.run(async_stage()), 'done')
+            with self.assertRaises(ValueError):
+                with span('test_failing_stage'):
+                    raise ValueError("boom")
+            return trace
+
+        trace = contextvars.copy_context().run(run_request)
+        self.assertEqual(set(trace.stages), {'test_async_stage', 'test_failing_stage'})
+
+    def test_request_id_reaches_worker_threads_and_logs(self):
+        print("Running test: test_request_id_reaches_worker_threads_and_logs")
+        def handle_request():
+            RequestTrace('req-42')
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                return executor.submit(in_current_context(request_id_var.get)).result()
+
+        self.assertEqual(contextvars.copy_context().run(handle_request), 'req-42')
+
+        record = logging.LogRecord('test', logging.INFO, __file__, 1, "message", None, None)
+        contextvars.copy_context().run(lambda: (request_id_var.set('req-7'), RequestIdFilter().filter(record)))
+        self.assertEqual(record.request_id, 'req-7')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from prompt_builder import build_history_messages, select_relevant_text, build_prompt_messages
+from token_budget import estimate_tokens
+
+
+class TestPromptBuilder(unittest.TestCase):
+
+    def test_older_history_is_summarized_not_dropped(self):
+        print("Running test: test_older_history_is_summarized_not_dropped")
+        history = []
+        for i in range(10):
+            history.append({"role": "user", "content": f"Question number {i}? " + "padding " * 40})
+            history.append({"role": "ai", "content": f"Answer number {i}. " + "padding " * 40})
+
+        messages = build_history_messages(history, 400)
+
+        self.assertIsInstance(messages[0], SystemMessage)
+        self.assertIn("Summary of the earlier conversation", messages[0].content)
+        self.assertIn("- User: Question number 0?", messages[0].content)
+        self.assertIn("- Assistant: Answer number 7.", messages[0].content)
+        self.assertIsInstance(messages[-1], AIMessage)
+        self.assertTrue(messages[-1].content.startswith("Answer number 9."))
+        self.assertLessEqual(sum(estimate_tokens(message.content) for message in messages), 400 + 20)
+
+    def test_rolling_summary_opens_the_history(self):
+        print("Running test: test_rolling_summary_opens_the_history")
+        history = [{"role": "summary", "content": "The user's printer model is LX-200."},
+                   {"role": "user", "content": "Which toner does it take?"},
+                   {"role": "ai", "content": "It takes the T-20 cartridge."}]
+
+        messages = build_history_messages(history, 400)
+
+        self.assertEqual(len(messages), 3)
+        self.assertEqual(messages[0].content, "Summary of the earlier conversation:\nThe user's printer model is LX-200.")
+        self.assertIsInstance(messages[1], HumanMessage)
+        self.assertEqual(build_history_messages([{"role": "summary", "content": "Only a summary."}], 400)[0].content,
+                         "Summary of the earlier conversation:\nOnly a summary.")
+
+    def test_oversized_pages_keep_the_relevant_chunks(self):
+        print("Running test: test_oversized_pages_keep_the_relevant_chunks")
+        filler = "\n\n".join(f"Section {i} talks about the weather in general terms. " * 10 for i in range(50))
+        page = filler + "\n\nThe warranty covers battery replacement for two years.\n\n" + filler
+
+        context = select_relevant_text([page], "How long is the battery warranty?", 300)
+
+        self.assertIn("The warranty covers battery replacement for two years.", context)
+        self.assertLessEqual(estimate_tokens(context), 300)
+        self.assertEqual(select_relevant_text(["short page"], "question", 300), "short page")
+
+    def test_prompt_stays_within_the_budget(self):
+        print("Running test: test_prompt_stays_within_the_budget")
+        history = [{"role": "user", "content": "hello " * 500}, {"role": "ai", "content": "hi " * 500}]
+        budgets = []
+
+        def fit_context(budget):
+            budgets.append(budget)
+            return "c" * (budget * 4)
+
+        messages = build_prompt_messages("System.", history, "Context:\n{context}\nQ: {question}", "Why?",
+                                         fit_context, budget=1000)
+
+        self.assertIsInstance(messages[0], SystemMessage)
+        self.assertIsInstance(messages[-1], HumanMessage)
+        self.assertTrue(messages[-1].content.endswith("Q: Why?"))
+        self.assertLessEqual(sum(estimate_tokens(message.content) for message in messages), 1000)
+        self.assertGreater(budgets[0], 600)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scrape_cache import ScrapeCache
+from tools import scrape_url
+
+
+class TestScrapeCache(unittest.TestCase):
+
+    def setUp(self):
+        print("Setting up for a ScrapeCache test")
+        self.cache = ScrapeCache(':memory:', ttl=60, max_bytes=100, hot_entries=1)
+
+    def test_put_and_get(self):
+        print("Running test: test_put_and_get")
+        self.assertIsNone(self.cache.get("https://example.com"))
+        self.cache.put("https://example.com", "page text", 'http', etag='"abc"')
+
+        entry = self.cache.get("https://example.com")
+        self.assertTrue(entry.is_fresh())
+        self.assertEqual(entry.content, "page text")
+        self.assertEqual(entry.validator_headers(), {'If-None-Match': '"abc"'})
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        print("Running test: test_least_recently_used_entries_are_evicted")
+        self.cache.put("https://a.com", "a" * 40, 'http')
+        self.cache.put("https://b.com", "b" * 40, 'http')
+        self.cache.get("https://a.com")
+        self.cache.put("https://c.com", "c" * 40, 'http')
+
+        self.assertIsNotNone(self.cache.get("https://a.com"))
+        self.assertIsNone(self.cache.get("https://b.com"))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_hits_do_not_write_until_the_access_flush(self):
+        print("Running test: test_hits_do_not_write_until_the_access_flush")
+        self.cache.put("https://a.com", "a" * 40, 'http')
+        writes = self.cache._conn.total_changes
+
+        for _ in range(3):
+            self.cache.get("https://a.com")
+        self.assertEqual(self.cache._conn.total_changes, writes)
+
+        self.cache.access_flush_seconds = 0
+        self.cache.get("https://a.com")
+        self.assertEqual(self.cache._conn.total_changes, writes + 1)
+
+    @patch('tools.get_http_session')
+    def test_stale_entry_is_revalidated(self, mock_get_session):
+        print("Running test: test_stale_entry_is_revalidated")
+        self.cache.ttl = -1
+        self.cache.put("https://example.com", "cached text", 'http', etag='"v1"')
+        self.cache.ttl = 60
+        not_modified = MagicMock(status_code=304)
+        mock_get_session.return_value.get.return_value = not_modified
+
+        with patch('tools.get_scrape_cache', return_value=self.cache):
+            content, _, tier = scrape_url("https://example.com")
+
+        self.assertEqual((content, tier), ("cached text", 'cache'))
+        _, kwargs = mock_get_session.return_value.get.call_args
+        self.assertEqual(kwargs['headers'], {'If-None-Match': '"v1"'})
+        self.assertEqual(self.cache.stats()["revalidated"], 1)
+        self.assertTrue(self.cache.get("https://example.com").is_fresh())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import time
+import unittest
+from unittest.mock import patch
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sessions import SessionStore, extractive_summary
+
+
+class TestSessionStore(unittest.TestCase):
+
+    def test_sessions_are_bounded_and_expire(self):
+        print("Running test: test_sessions_are_bounded_and_expire")
+        store = SessionStore(max_sessions=2, ttl_seconds=60)
+        first = store.get("session-aaaa")
+        store.get("session-bbbb")
+        self.assertIs(store.get("session-aaaa"), first)
+        store.get("session-cccc")
+
+        # The least recently used session was evicted
+        self.assertEqual(store.stats(), {"sessions": 2, "created": 3, "expired": 0, "evicted": 1,
+                                         "compactions": 0, "compaction_failures": 0})
+        self.assertIs(store.get("session-aaaa"), first)
+        self.assertNotEqual(store.get("bad id!").id, "bad id!")
+
+        with patch('sessions.time.monotonic', return_value=time.monotonic() + 120):
+            fresh = store.get("session-aaaa")
+        self.assertIsNot(fresh, first)
+        self.assertGreaterEqual(store.stats()["expired"], 2)
+
+    def test_older_turns_are_folded_into_the_summary_in_the_background(self):
+        print("Running test: test_older_turns_are_folded_into_the_summary_in_the_background")
+        calls = []
+
+        def summarize(previous_summary, messages):
+            calls.append((previous_summary, [message["content"] for message in messages]))
+            return f"{previous_summary}+{len(messages)}".lstrip("+")
+
+        store = SessionStore(summarize=summarize, recent_messages=2, compact_every=2)
+        session = store.get()
+        futures = [store.record_turn(session, f"Question {i}?", f"Answer {i}.") for i in range(5)]
+
+        self.assertEqual(futures[:2], [None, None])
+        futures[2].result(timeout=5)
+        self.assertEqual(calls[0], ("", ["Question 0?", "Answer 0.", "Question 1?", "Answer 1."]))
+        for future in futures[3:]:
+            if future is not None:
+                future.result(timeout=5)
+
+        history = session.history()
+        self.assertEqual(history[0]["role"], "summary")
+        self.assertEqual(history[-1], {"role": "ai", "content": "Answer 4."})
+        self.assertLessEqual(len(history), 1 + 2 + 2)
+        self.assertEqual(store.stats()["compactions"], len(calls))
+
+    def test_failed_summaries_fall_back_to_extractive(self):
+        print("Running test: test_failed_summaries_fall_back_to_extractive")
+
+        def summarize(previous_summary, messages):
+            raise RuntimeError("quota exceeded")
+
+        store = SessionStore(summarize=summarize, recent_messages=0, compact_every=1)
+        session = store.get()
+        store.record_turn(session, "My printer is an LX-200. It is jammed.", "Open the rear tray.").result(timeout=5)
+
+        self.assertIn("- User: My printer is an LX-200.", session.summary)
+        self.assertEqual(session.messages, [])
+        self.assertEqual(store.stats()["compaction_failures"], 1)
+        self.assertEqual(extractive_summary("- User: a", [], budget=100), "- User: a")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import json
+import unittest
+import subprocess
+
+import sys
+import os
+
+SERVER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Cold `import app` must stay under this many seconds
+STARTUP_BUDGET_SECONDS = float(os.environ.get('STARTUP_BUDGET_SECONDS', 2.0))
+
+# Libraries that must only be loaded on first use
+DEFERRED_MODULES = ['chromadb', 'langchain_google_genai', 'langchain_chroma', 'google.generativeai',
+                    'selenium', 'PyPDF2', 'bs4', 'httpx']
+
+STARTUP_SCRIPT = """
+import sys, time, json
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "loaded": [name for name in %r if name in sys.modules]}))
+""" % (DEFERRED_MODULES,)
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_import_app_is_fast_and_lazy(self):
+        print("Running test: test_import_app_is_fast_and_lazy")
+        env = {key: value for key, value in os.environ.items() if key != 'GOOGLE_API_KEY'}
+        # The first run warms the OS file cache; the second one is measured
+        for _ in range(2):
+            completed = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=SERVER_DIR, env=env,
+                                       capture_output=True, text=True, timeout=120)
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"import app took {result['seconds']:.3f}s")
+        self.assertEqual(result["loaded"], [])
+        self.assertLess(result["seconds"], STARTUP_BUDGET_SECONDS)
+
+
+if __name__ == '__main__':
+    unittest.main()
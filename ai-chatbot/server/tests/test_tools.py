@@ -1,13 +1,51 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import io
+import asyncio
+import time
+import httpx
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 # Important: We need to add the project root to the path so we can import our modules
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from tools import find_and_clean_urls, file_processor_tool, url_shortener_tool
+from tools import (find_and_clean_urls, scrape_found_urls, url_shortener_tool, scrape_url, set_shortener_backend,
+                   IsGdShortener, iter_pdf_pages, iter_file_pages, scrape_urls_async, url_shortener_tool_async,
+                   scrape_urls_with_deadline, async_http_client)
+import tools
+from short_url_cache import ShortUrlCache
+from scrape_cache import ScrapeCache
+
+def make_pdf(page_texts: list[str]) -> bytes:
+    """Builds a minimal PDF with one line of Helvetica text per page."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for text in page_texts:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>"
+
+    pdf = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n"
+    xref_offset = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n"
+    return pdf.encode('latin-1')
+
 
 class TestTools(unittest.TestCase):
 
@@ -17,27 +55,75 @@ class TestTools(unittest.TestCase):
         expected = ['https://example.com', 'http://test.com/page', 'https://another.com/']
         self.assertEqual(find_and_clean_urls(text), expected)
 
-    @patch('tools.url_scraper_tool')
-    def test_file_processor_tool_txt(self, mock_scraper_tool):
-        print("Running test: test_file_processor_tool_txt")
-        mock_scraper_tool.return_value = ("scraped content", None)
+    @patch('tools.scrape_url')
+    def test_txt_pages_and_their_urls_are_scraped(self, mock_scrape_url):
+        print("Running test: test_txt_pages_and_their_urls_are_scraped")
+        mock_scrape_url.return_value = ("scraped content", None, 'http')
 
         text_content = "This is a test file with a url https://example.com/inside."
         file_stream = io.BytesIO(text_content.encode('utf-8'))
-       
-        original, scraped = file_processor_tool(file_stream, 'test.txt')
-       
-        self.assertEqual(original, text_content)
+
+        pages = list(iter_file_pages(file_stream, 'test.txt'))
+        found_urls = set(find_and_clean_urls(pages[0][1]))
+        scraped = scrape_found_urls(found_urls, 'test.txt')
+
+        self.assertEqual(pages, [(1, text_content)])
         self.assertIn("scraped content", scraped)
-        mock_scraper_tool.assert_called_with('https://example.com/inside')
+        mock_scrape_url.assert_called_with('https://example.com/inside')
+
+    @patch('tools.scrape_url')
+    def test_failed_urls_are_left_out_of_scraped_content(self, mock_scrape_url):
+        print("Running test: test_failed_urls_are_left_out_of_scraped_content")
+        mock_scrape_url.side_effect = lambda url: (
+            ("Error: Could not retrieve content.", None, 'error') if url.endswith('down')
+            else (f"Text of {url}", None, 'http'))
+
+        scraped = scrape_found_urls(["https://example.com/up", "https://example.com/down"], 'notes.txt')
+
+        self.assertEqual(scraped, "Text of https://example.com/up")
+
+    def test_iter_pdf_pages_in_process(self):
+        print("Running test: test_iter_pdf_pages_in_process")
+        pdf = io.BytesIO(make_pdf(["First page", "Second page"]))
+
+        pages = list(iter_pdf_pages(pdf))
+
+        self.assertEqual([number for number, _ in pages], [1, 2])
+        self.assertIn("Second page", pages[1][1])
+
+    @patch('tools.PDF_PAGES_IN_FLIGHT', 2)
+    @patch('tools.PDF_PARALLEL_MIN_PAGES', 1)
+    def test_iter_pdf_pages_on_process_pool(self):
+        print("Running test: test_iter_pdf_pages_on_process_pool")
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as pdf_file:
+            pdf_file.write(make_pdf([f"Page {i}" for i in range(1, 6)]))
+        self.addCleanup(os.remove, pdf_file.name)
+
+        with open(pdf_file.name, 'rb') as pdf:
+            pages = list(iter_pdf_pages(pdf, workers=2))
 
-    @patch('tools.requests.get')
-    def test_url_shortener_tool(self, mock_requests_get):
+        self.assertEqual([number for number, _ in pages], [1, 2, 3, 4, 5])
+        self.assertTrue(all(f"Page {number}" in text for number, text in pages))
+
+    @patch('tools.TEXT_SEGMENT_BYTES', 16)
+    def test_text_files_are_read_in_segments(self):
+        print("Running test: test_text_files_are_read_in_segments")
+        text = "line one\nline two é\nline three\n"
+
+        segments = list(iter_file_pages(io.BytesIO(text.encode('utf-8')), 'notes.txt'))
+
+        self.assertGreater(len(segments), 1)
+        self.assertEqual("".join(segment for _, segment in segments), text)
+
+    @patch('tools.get_short_url_cache')
+    def test_url_shortener_tool(self, mock_get_cache):
         print("Running test: test_url_shortener_tool")
-        # Mock the response from the is.gd API
-        mock_response = MagicMock()
-        mock_response.text = "https://is.gd/short"
-        mock_requests_get.return_value = mock_response
+        mock_get_cache.return_value = ShortUrlCache(':memory:')
+        # Use a local stand-in instead of the is.gd API
+        backend = MagicMock()
+        backend.shorten.return_value = "https://is.gd/short"
+        set_shortener_backend(backend)
+        self.addCleanup(set_shortener_backend, IsGdShortener())
 
         text = "Here is a long link: https://a-very-long-and-complex-url.com/that-needs-shortening"
         result = url_shortener_tool(text)
@@ -45,6 +131,177 @@ class TestTools(unittest.TestCase):
         self.assertIn("https://is.gd/short", result)
         self.assertNotIn("a-very-long-and-complex-url", result)
 
+    @patch('tools.get_short_url_cache')
+    def test_url_shortener_tool_reuses_known_mappings(self, mock_get_cache):
+        print("Running test: test_url_shortener_tool_reuses_known_mappings")
+        mock_get_cache.return_value = ShortUrlCache(':memory:')
+        backend = MagicMock()
+        backend.shorten.side_effect = lambda url: "https://is.gd/" + url[-1]
+        set_shortener_backend(backend)
+        self.addCleanup(set_shortener_backend, IsGdShortener())
+
+        text = "See https://example.com/a, then https://example.com/b. Again: (https://example.com/a)."
+        expected = "See https://is.gd/a, then https://is.gd/b. Again: (https://is.gd/a)."
+        self.assertEqual(url_shortener_tool(text), expected)
+        self.assertEqual(url_shortener_tool(text), expected)
+
+        self.assertEqual(backend.shorten.call_count, 2)
+
+    @patch('tools.get_scrape_cache', return_value=ScrapeCache(':memory:'))
+    @patch('tools.get_browser_pool')
+    @patch('tools.get_http_session')
+    def test_scrape_url_uses_http_fast_path(self, mock_get_session, mock_get_pool, _mock_cache):
+        print("Running test: test_scrape_url_uses_http_fast_path")
+        mock_response = MagicMock()
+        mock_response.headers = {'Content-Type': 'text/html; charset=utf-8'}
+        mock_response.text = "<html><body><p>" + "Static article text. " * 20 + "</p></body></html>"
+        mock_get_session.return_value.get.return_value = mock_response
+
+        content, _, tier = scrape_url("https://example.com/article")
+
+        self.assertEqual(tier, 'http')
+        self.assertIn("Static article text.", content)
+        mock_get_pool.assert_not_called()
+
+    @patch('tools.get_scrape_cache', return_value=ScrapeCache(':memory:'))
+    @patch('tools.get_browser_pool')
+    @patch('tools.get_http_session')
+    def test_scrape_url_escalates_js_pages_to_browser(self, mock_get_session, mock_get_pool, _mock_cache):
+        print("Running test: test_scrape_url_escalates_js_pages_to_browser")
+        mock_response = MagicMock()
+        mock_response.headers = {'Content-Type': 'text/html'}
+        mock_response.text = '<html><body><div id="root"></div><script>app()</script></body></html>'
+        mock_get_session.return_value.get.return_value = mock_response
+        mock_get_pool.return_value.fetch_page_source.return_value = "<html><body>Rendered by JS</body></html>"
+
+        content, _, tier = scrape_url("https://example.com/app")
+
+        self.assertEqual(tier, 'browser')
+        self.assertEqual(content, "Rendered by JS")
+
+
+    def test_async_http_client_is_pooled_per_event_loop(self):
+        print("Running test: test_async_http_client_is_pooled_per_event_loop")
+        async def two_clients():
+            return async_http_client(), async_http_client()
+
+        first, again = asyncio.run(two_clients())
+        other, _ = asyncio.run(two_clients())
+
+        self.assertIs(first, again)
+        self.assertIsNot(first, other)
+
+    @patch('tools.get_scrape_cache', return_value=ScrapeCache(':memory:'))
+    @patch('tools.get_browser_pool')
+    def test_scrape_urls_async_fetches_concurrently(self, mock_get_pool, _mock_cache):
+        print("Running test: test_scrape_urls_async_fetches_concurrently")
+        in_flight = 0
+        peak = 0
+
+        async def handler(request):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.05)
+            in_flight -= 1
+            return httpx.Response(200, headers={'Content-Type': 'text/plain'}, text=f"Text of {request.url.path}")
+
+        with patch('tools.async_http_client', lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler))):
+            results = asyncio.run(scrape_urls_async([f"https://example.com/page{i}" for i in range(3)]))
+
+        self.assertEqual([content for content, _, _ in results], [f"Text of /page{i}" for i in range(3)])
+        self.assertEqual({tier for _, _, tier in results}, {'http'})
+        self.assertEqual(peak, 3)
+        mock_get_pool.assert_not_called()
+
+    @patch('tools.get_short_url_cache')
+    def test_url_shortener_tool_async(self, mock_get_cache):
+        print("Running test: test_url_shortener_tool_async")
+        mock_get_cache.return_value = ShortUrlCache(':memory:')
+
+        class StandInShortener:
+            async def ashorten(self, long_url, client):
+                return "https://is.gd/" + long_url[-1]
+
+        set_shortener_backend(StandInShortener())
+        self.addCleanup(set_shortener_backend, IsGdShortener())
+
+        text = "See https://example.com/a, then https://example.com/b."
+        self.assertEqual(asyncio.run(url_shortener_tool_async(text)), "See https://is.gd/a, then https://is.gd/b.")
+
+
+    @patch('tools.scrape_url')
+    def test_scrape_urls_with_deadline_returns_partial_results(self, mock_scrape_url):
+        print("Running test: test_scrape_urls_with_deadline_returns_partial_results")
+        def scrape(url, timeout=None):
+            if url.endswith('slow'):
+                time.sleep(1)
+            return f"Text of {url}", None, 'http'
+        mock_scrape_url.side_effect = scrape
+
+        started = time.monotonic()
+        results = scrape_urls_with_deadline(["https://example.com/fast", "https://example.com/slow"],
+                                            url_timeout=0.2, deadline=5)
+
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertEqual(results[0], ("Text of https://example.com/fast", None, 'http'))
+        self.assertEqual(results[1][2], 'timeout')
+
+    @patch('tools._chat_scrape_executor', ThreadPoolExecutor(max_workers=1))
+    @patch('tools.scrape_url')
+    def test_url_timeout_counts_from_the_start_of_the_fetch(self, mock_scrape_url):
+        print("Running test: test_url_timeout_counts_from_the_start_of_the_fetch")
+        timeouts = []
+
+        def scrape(url, timeout=None):
+            timeouts.append(timeout)
+            time.sleep(0.15)
+            return f"Text of {url}", None, 'http'
+        mock_scrape_url.side_effect = scrape
+
+        results = scrape_urls_with_deadline(["https://example.com/1", "https://example.com/2"],
+                                            url_timeout=0.25, deadline=5)
+
+        self.assertEqual([tier for _, _, tier in results], ['http', 'http'])
+        self.assertEqual(timeouts, [0.25, 0.25])
+
+    @patch('tools.fetch_tier_counts', new_callable=Counter)
+    @patch('tools.scrape_url')
+    def test_abandoned_fetches_are_counted_once(self, mock_scrape_url, mock_tier_counts):
+        print("Running test: test_abandoned_fetches_are_counted_once")
+        slow_done = threading.Event()
+
+        def scrape(url, timeout=None):
+            if url.endswith('slow'):
+                time.sleep(0.4)
+            # Like scrape_url, each fetch records the tier that served it
+            tools._record_tier('http')
+            if url.endswith('slow'):
+                slow_done.set()
+            return f"Text of {url}", None, 'http'
+        mock_scrape_url.side_effect = scrape
+
+        results = scrape_urls_with_deadline(["https://example.com/fast", "https://example.com/slow"],
+                                            url_timeout=0.1, deadline=5)
+        self.assertTrue(slow_done.wait(5))
+
+        self.assertEqual([tier for _, _, tier in results], ['http', 'timeout'])
+        self.assertEqual(mock_tier_counts, Counter({'http': 1, 'timeout': 1}))
+
+    @patch('tools.scrape_url_async')
+    def test_scrape_urls_async_stops_at_the_deadline(self, mock_scrape_url_async):
+        print("Running test: test_scrape_urls_async_stops_at_the_deadline")
+        async def scrape(client, url, timeout=None):
+            await asyncio.sleep(1 if url.endswith('slow') else 0)
+            return f"Text of {url}", None, 'http'
+        mock_scrape_url_async.side_effect = scrape
+
+        results = asyncio.run(scrape_urls_async(["https://example.com/fast", "https://example.com/slow"],
+                                                url_timeout=5, deadline=0.2))
+
+        self.assertEqual(results[0][2], 'http')
+        self.assertEqual(results[1][2], 'timeout')
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
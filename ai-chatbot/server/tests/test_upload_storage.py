@@ -0,0 +1,48 @@
+import hashlib
+import tempfile
+import unittest
+
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from upload_storage import HashingSpool, FileTooLarge
+
+
+class TestHashingSpool(unittest.TestCase):
+
+    def setUp(self):
+        print("Setting up for an upload storage test")
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def test_store_moves_the_file_to_its_content_address(self):
+        print("Running test: test_store_moves_the_file_to_its_content_address")
+        spool = HashingSpool(self.folder.name, 'Manual.PDF')
+        spool.write(b"%PDF-1.4 ")
+        spool.write(b"page one")
+        spool.seek(0)
+        self.assertEqual(spool.read(), b"%PDF-1.4 page one")
+
+        path = spool.store()
+        spool.close()
+
+        digest = hashlib.sha256(b"%PDF-1.4 page one").hexdigest()
+        self.assertEqual(spool.sha256, digest)
+        self.assertEqual(path, os.path.join(self.folder.name, f"{digest}.pdf"))
+        self.assertEqual(os.listdir(self.folder.name), [f"{digest}.pdf"])
+
+    def test_oversized_upload_is_rejected_and_discarded(self):
+        print("Running test: test_oversized_upload_is_rejected_and_discarded")
+        spool = HashingSpool(self.folder.name, 'notes.txt', max_bytes=10)
+        spool.write(b"12345")
+        with self.assertRaises(FileTooLarge):
+            spool.write(b"678901")
+
+        spool.close()
+
+        self.assertEqual(os.listdir(self.folder.name), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import math
+
+# Rough number of characters per token for English text with Gemini/GPT-style tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens in a text without calling a tokenizer.
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def take_within_budget(items: list, budget: int, text_of=lambda item: item) -> list:
+    """
+    Returns the leading items whose combined estimated token count fits the budget.
+    The first item is always kept so there is some context to work with.
+    """
+    selected = []
+    used = 0
+    for item in items:
+        tokens = estimate_tokens(text_of(item))
+        if selected and used + tokens > budget:
+            break
+        selected.append(item)
+        used += tokens
+    return selected
+
+
+def truncate_to_budget(text: str, budget: int) -> str:
+    """
+    Cuts a text down to roughly `budget` tokens.
+    """
+    max_chars = budget * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(' ', 1)[0] + " ..."
@@ -1,158 +1,776 @@
+import io
+import codecs
 import requests
 import os 
 import re 
-import logging
 import time
-import PyPDF2
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from concurrent.futures import ThreadPoolExecutor
+import logging
+import asyncio
+import threading
+import contextvars
+import weakref
+import multiprocessing
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import TYPE_CHECKING
+from browser_pool import get_browser_pool
+from scrape_cache import get_scrape_cache
+from short_url_cache import get_short_url_cache
+from metrics import timed, in_current_context
+
+if TYPE_CHECKING:
+    # Imported on first use at run time, to keep the app quick to start
+    import httpx
 
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
 
 logger = logging.getLogger(__name__)
 
-def url_scraper_tool(url: str, save_to_folder: str = None) -> (str, str): # type: ignore
+# --- Fast-path HTTP fetching configuration ---
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))
+HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', 10))
+# Pages whose extracted text is shorter than this are re-rendered in the browser
+FAST_PATH_MIN_TEXT_CHARS = int(os.environ.get('FAST_PATH_MIN_TEXT_CHARS', 200))
+# Text/HTML ratio below which a page carrying a JS-app marker is re-rendered in the browser
+FAST_PATH_MIN_TEXT_RATIO = float(os.environ.get('FAST_PATH_MIN_TEXT_RATIO', 0.02))
+
+JS_APP_MARKERS = (
+    'id="root"></div>',
+    'id="app"></div>',
+    'id="__next"></div>',
+    'enable javascript',
+    'requires javascript',
+    'javascript is disabled',
+)
+URL_PATTERN = r'https?://\S+'
+# List of common punctuation to strip from the end of a URL
+TRAILING_URL_PUNCTUATION = '.,;:)!?'
+
+# --- File extraction configuration ---
+PDF_EXTRACT_WORKERS = int(os.environ.get('PDF_EXTRACT_WORKERS', min(4, os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', 32))
+PDF_PAGES_IN_FLIGHT = int(os.environ.get('PDF_PAGES_IN_FLIGHT', 16))
+TEXT_SEGMENT_BYTES = int(os.environ.get('TEXT_SEGMENT_BYTES', 64 * 1024))
+
+# --- URL shortener configuration ---
+SHORTENER_WORKERS = int(os.environ.get('SHORTENER_WORKERS', 8))
+SHORTENER_TIMEOUT = float(os.environ.get('SHORTENER_TIMEOUT', 5))
+# URLs in a chat query: time allowed per URL and for all of them together, in seconds
+CHAT_URL_TIMEOUT = float(os.environ.get('CHAT_URL_TIMEOUT', 15))
+CHAT_SCRAPE_DEADLINE = float(os.environ.get('CHAT_SCRAPE_DEADLINE', 20))
+CHAT_SCRAPE_WORKERS = int(os.environ.get('CHAT_SCRAPE_WORKERS', 8))
+
+PLAIN_TEXT_TYPES = ('text/plain', 'text/markdown', 'text/csv', 'application/json')
+HTML_TYPES = ('text/html', 'application/xhtml+xml')
+
+_http_session = None
+_http_session_lock = threading.Lock()
+# One async client per event loop; an entry goes away with its loop
+_async_http_clients = weakref.WeakKeyDictionary()
+
+fetch_tier_counts = Counter()
+_fetch_tier_lock = threading.Lock()
+
+# Shared so that a chat request can stop waiting for slow pages without waiting for their threads.
+# Each fetch is bounded by its URL's time limit, so an abandoned one frees its worker soon after.
+_chat_scrape_executor = ThreadPoolExecutor(max_workers=CHAT_SCRAPE_WORKERS, thread_name_prefix='chat-scrape')
+
+# Tiers whose content is an error message rather than page text
+FAILED_TIERS = ('error', 'timeout')
+
+
+def _browser_user_agent() -> str:
+    return ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+            '(KHTML, like Gecko) Chrome/120.0 Safari/537.36')
+
+
+def get_http_session() -> requests.Session:
     """
-    Intelligently scrapes a URL and optionally saves the content.
+    Returns a process-wide requests.Session with a keep-alive connection pool.
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE,
+                                                        pool_maxsize=HTTP_POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers['User-Agent'] = _browser_user_agent()
+                _http_session = session
+    return _http_session
 
-    Returns a tuple: (text_content, saved_file_path)
-    - saved_file_path will be None if save_to_folder is not specified.
+
+def async_http_client() -> 'httpx.AsyncClient':
     """
+    Returns the pooled async HTTP client of the running event loop, creating it on
+    first use. Async clients are bound to their loop, so there is one per loop,
+    and it lives as long as that loop; callers must not close it.
+    """
+    import httpx
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            headers={'User-Agent': _browser_user_agent()},
+            timeout=HTTP_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE),
+        )
+        _async_http_clients[loop] = client
+    return client
+
+
+def warm_up_scrapers():
+    """
+    Imports the parsing and HTTP libraries the scrapers load lazily, and opens the pooled session.
+    """
+    import bs4, PyPDF2, httpx  # noqa: F401
+    get_http_session()
+
+
+class _FetchTally:
+    """
+    Makes a fetch that its caller may abandon count once in fetch_tier_counts:
+    either with its own tier or as the caller's 'timeout', whichever comes first.
+    """
+
+    def __init__(self):
+        self.counted = False
+
+
+# The tally of the fetch running in this context, if its caller may abandon it
+_current_fetch_tally = contextvars.ContextVar('current_fetch_tally', default=None)
+
+
+def _record_tier(tier: str, tally: _FetchTally = None):
+    tally = tally or _current_fetch_tally.get()
+    with _fetch_tier_lock:
+        if tally is not None:
+            if tally.counted:
+                return
+            tally.counted = True
+        fetch_tier_counts[tier] += 1
+
+
+def get_fetch_tier_stats() -> dict:
+    """
+    Returns how many URLs each fetch tier served and the fast-path hit ratio.
+    """
+    with _fetch_tier_lock:
+        counts = dict(fetch_tier_counts)
+    served = counts.get('http', 0) + counts.get('browser', 0)
+    return {
+        "counts": counts,
+        "http_hit_ratio": counts.get('http', 0) / served if served else 0.0,
+    }
+
+
+def _needs_browser(html: str, text: str) -> bool:
+    """
+    Decides whether a page fetched over plain HTTP needs JavaScript rendering.
+    """
+    if len(text) < FAST_PATH_MIN_TEXT_CHARS:
+        return True
+    lowered = html.lower()
+    text_ratio = len(text) / max(len(html), 1)
+    return text_ratio < FAST_PATH_MIN_TEXT_RATIO and any(marker in lowered for marker in JS_APP_MARKERS)
+
+
+def _pdf_bytes_to_text(data: bytes) -> str:
+    return "".join([text for _, text in iter_pdf_pages(io.BytesIO(data))])
+
+
+def _time_left(deadline, limit: float = None):
+    """
+    The seconds left until a time.monotonic() deadline, capped at `limit`.
+    Without a deadline, returns `limit`.
+    """
+    if deadline is None:
+        return limit
+    remaining = deadline - time.monotonic()
+    return remaining if limit is None else min(limit, remaining)
+
+
+def _fetch_over_http(url: str, headers: dict = None, timeout: float = HTTP_TIMEOUT):
+    """
+    Fetches a URL with the pooled HTTP session.
+
+    Returns a tuple: (status, text_content, validators)
+    - status is 'ok', 'not_modified' (the origin answered 304) or 'escalate'
+      (the page should be rendered in the browser).
+    - validators holds the ETag/Last-Modified headers of the response.
+    """
+    try:
+        response = get_http_session().get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            return 'not_modified', None, {}
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.info(f"Fast-path fetch failed for {url}, falling back to the browser. Error: {e}")
+        return 'escalate', None, {}
+    return _read_http_response(url, response)
+
+
+async def _fetch_over_http_async(client: 'httpx.AsyncClient', url: str, headers: dict = None,
+                                 timeout: float = HTTP_TIMEOUT):
+    """
+    Same as _fetch_over_http, but with an async HTTP client.
+    """
+    import httpx
+    try:
+        response = await client.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            return 'not_modified', None, {}
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.info(f"Fast-path fetch failed for {url}, falling back to the browser. Error: {e}")
+        return 'escalate', None, {}
+    return _read_http_response(url, response)
+
+
+def _read_http_response(url: str, response):
+    """
+    Turns a successful requests or httpx response into the _fetch_over_http result.
+    """
+    validators = {
+        "etag": response.headers.get('ETag'),
+        "last_modified": response.headers.get('Last-Modified'),
+    }
+    content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+
+    if content_type in PLAIN_TEXT_TYPES:
+        return 'ok', response.text, validators
+    if content_type == 'application/pdf':
+        return 'ok', _pdf_bytes_to_text(response.content), validators
+    if content_type in HTML_TYPES or not content_type:
+        html = response.text
+        text = html_to_text(html)
+        if _needs_browser(html, text):
+            logger.info(f"Page at {url} looks JavaScript-rendered, escalating to the browser.")
+            return 'escalate', None, {}
+        return 'ok', text, validators
+
+    raise ValueError(f"Unsupported content type '{content_type}'.")
+
+
+def _google_doc_export_url(url: str):
+    """
+    Returns (doc_id, export_url) for a Google Doc link, or None if the ID cannot be found.
+    """
+    match = re.search(r'/document/d/([^/]+)', url)
+    if not match:
+        return None
+    doc_id = match.group(1)
+    return doc_id, f'https://docs.google.com/document/d/{doc_id}/export?format=txt'
+
+
+def _save_google_doc(doc_id: str, content: str, save_to_folder: str) -> str:
+    if not save_to_folder:
+        return None
+    saved_path = os.path.join(save_to_folder, f"gdoc_{doc_id}.txt")
+    with open(saved_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    logger.info(f"Saved Google Doc content to: {saved_path}")
+    return saved_path
+
+
+@timed('scrape')
+def scrape_url(url: str, save_to_folder: str = None, timeout: float = None) -> (str, str, str): # type: ignore
+    """
+    Scrapes a URL through the cheapest tier that can serve it and optionally saves the content.
+
+    With a `timeout`, the network fetches and the browser fallback together get
+    about that many seconds, counted from the start of this call.
+
+    Returns a tuple: (text_content, saved_file_path, tier)
+    - tier is one of 'gdoc', 'cache', 'http', 'browser', 'error' or 'timeout'.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
     # --- Special Handler for Google Docs ---
     if 'docs.google.com' in url:
         try:
             logger.info(f"Detected Google Doc. Using direct export for: {url}")
-            match = re.search(r'/document/d/([^/]+)', url)
-            if not match:
-                return "Error: Could not extract Google Doc ID from URL.", None
+            export = _google_doc_export_url(url)
+            if export is None:
+                _record_tier('error')
+                return "Error: Could not extract Google Doc ID from URL.", None, 'error'
            
-            doc_id = match.group(1)
-            export_url = f'https://docs.google.com/document/d/{doc_id}/export?format=txt'
-           
-            response = requests.get(export_url, timeout=10)
+            doc_id, export_url = export
+            response = get_http_session().get(export_url, timeout=_time_left(deadline, HTTP_TIMEOUT))
             response.raise_for_status()
            
             content = response.text
-            saved_path = None
+            saved_path = _save_google_doc(doc_id, content, save_to_folder)
+            _record_tier('gdoc')
+            return content, saved_path, 'gdoc'
+
+        except Exception as e:
+            _record_tier('error')
+            return f"Error: Could not export Google Doc. Details: {e}", None, 'error'
 
-            if save_to_folder:
-                filename = f"gdoc_{doc_id}.txt"
-                saved_path = os.path.join(save_to_folder, filename)
-                with open(saved_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                logger.info(f"Saved Google Doc content to: {saved_path}")
+    # --- Cached content, revalidated with the origin once stale ---
+    cache = get_scrape_cache()
+    cached = cache.get(url)
+    if cached is not None and cached.is_fresh():
+        _record_tier('cache')
+        return cached.content, None, 'cache'
 
-            return content, saved_path
+    # --- Fast path over plain HTTP ---
+    try:
+        headers = cached.validator_headers() if cached is not None else None
+        status, content, validators = _fetch_over_http(url, headers=headers,
+                                                       timeout=_time_left(deadline, HTTP_TIMEOUT))
+    except Exception as e:
+        _record_tier('error')
+        return f"Error: Could not retrieve content. Details: {e}", None, 'error'
+    if status == 'not_modified' and cached is not None:
+        cache.mark_revalidated(cached)
+        _record_tier('cache')
+        return cached.content, None, 'cache'
+    if status == 'ok':
+        cache.put(url, content, 'http', **validators)
+        _record_tier('http')
+        return content, None, 'http'
 
-        except Exception as e:
-            return f"Error: Could not export Google Doc. Details: {e}", None
+    # --- Selenium fallback for JavaScript-heavy pages ---
+    if deadline is not None and _time_left(deadline) <= 0:
+        return _timed_out(url)
+    try:
+        logger.info(f"Using Selenium for general URL: {url}")
+        page_source = get_browser_pool().fetch_page_source(url, timeout=_time_left(deadline))
+        content = html_to_text(page_source)
+        cache.put(url, content, 'browser')
+        _record_tier('browser')
+        return content, None, 'browser'
+
+    except Exception as e:
+        if deadline is not None and _time_left(deadline) <= 0:
+            return _timed_out(url)
+        _record_tier('error')
+        return f"Error: Could not retrieve content using Selenium. Details: {e}", None, 'error'
 
-    # --- Default Selenium Handler for all other websites ---
-    else:
-        content = ""
+@timed('scrape')
+async def scrape_url_async(client: 'httpx.AsyncClient', url: str, timeout: float = None) -> (str, str, str): # type: ignore
+    """
+    Async counterpart of scrape_url for the chat path: network fetches go through
+    the async client, and only the browser fallback is handed to a worker thread.
+    The `timeout` is passed down to that thread too, since cancelling the
+    coroutine does not stop it.
+
+    Returns a tuple: (text_content, saved_file_path, tier); saved_file_path is always None.
+    """
+    import httpx
+    deadline = None if timeout is None else time.monotonic() + timeout
+    if 'docs.google.com' in url:
+        export = _google_doc_export_url(url)
+        if export is None:
+            _record_tier('error')
+            return "Error: Could not extract Google Doc ID from URL.", None, 'error'
         try:
-            logger.info(f"Using Selenium for general URL: {url}")
-            chrome_options = Options()
-            chrome_options.add_argument("--headless")
-            chrome_options.add_argument("--window-size=1920,1080")
-            driver = webdriver.Chrome(options=chrome_options)
-            driver.get(url)
-            time.sleep(3)
-            page_source = driver.page_source
-            driver.quit()
-            soup = BeautifulSoup(page_source, 'html.parser')
-            for script_or_style in soup(['script', 'style']):
-                script_or_style.decompose()
-            text = soup.get_text()
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            content = '\n'.join(chunk for chunk in chunks if chunk)
-           
-            return content, None
+            response = await client.get(export[1], timeout=_time_left(deadline, HTTP_TIMEOUT))
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            _record_tier('error')
+            return f"Error: Could not export Google Doc. Details: {e}", None, 'error'
+        _record_tier('gdoc')
+        return response.text, None, 'gdoc'
 
-        except Exception as e:
-            return f"Error: Could not retrieve content using Selenium. Details: {e}", None
+    cache = get_scrape_cache()
+    cached = cache.get(url)
+    if cached is not None and cached.is_fresh():
+        _record_tier('cache')
+        return cached.content, None, 'cache'
+
+    try:
+        headers = cached.validator_headers() if cached is not None else None
+        status, content, validators = await _fetch_over_http_async(client, url, headers=headers,
+                                                                   timeout=_time_left(deadline, HTTP_TIMEOUT))
+    except Exception as e:
+        _record_tier('error')
+        return f"Error: Could not retrieve content. Details: {e}", None, 'error'
+    if status == 'not_modified' and cached is not None:
+        cache.mark_revalidated(cached)
+        _record_tier('cache')
+        return cached.content, None, 'cache'
+    if status == 'ok':
+        cache.put(url, content, 'http', **validators)
+        _record_tier('http')
+        return content, None, 'http'
 
-def process_urls_in_parallel(urls: list[str]) -> list[str]:
+    if deadline is not None and _time_left(deadline) <= 0:
+        return _timed_out(url)
+    try:
+        logger.info(f"Using Selenium for general URL: {url}")
+        page_source = await asyncio.to_thread(get_browser_pool().fetch_page_source, url,
+                                              timeout=_time_left(deadline))
+        content = html_to_text(page_source)
+        cache.put(url, content, 'browser')
+        _record_tier('browser')
+        return content, None, 'browser'
+
+    except Exception as e:
+        if deadline is not None and _time_left(deadline) <= 0:
+            return _timed_out(url)
+        _record_tier('error')
+        return f"Error: Could not retrieve content using Selenium. Details: {e}", None, 'error'
+
+
+def _timed_out(url: str, tally: _FetchTally = None) -> tuple:
+    logger.warning(f"Gave up waiting for {url}.")
+    _record_tier('timeout', tally)
+    return f"Error: Timed out while retrieving {url}.", None, 'timeout'
+
+
+def scrape_urls_with_deadline(urls: list[str], url_timeout: float = CHAT_URL_TIMEOUT,
+                              deadline: float = CHAT_SCRAPE_DEADLINE) -> list[tuple]:
+    """
+    Scrapes several URLs concurrently, waiting at most `url_timeout` seconds for
+    any one of them and `deadline` seconds for all of them. A URL's own limit
+    counts from when a worker starts fetching it, not from when it was queued,
+    and is also passed down to the fetch itself.
+
+    Returns the scrape_url result of each URL, in order. URLs that did not finish
+    in time get the tier 'timeout'; their fetches are abandoned, not waited for,
+    and those that had not started yet are cancelled. An abandoned fetch that
+    finishes later is not counted in fetch_tier_counts again.
+    """
+    deadline_at = time.monotonic() + deadline
+    started_at = [None] * len(urls)
+    tallies = [_FetchTally() for _ in urls]
+    # Notified whenever a fetch starts or finishes
+    changed = threading.Condition()
+
+    def scrape(index, url):
+        _current_fetch_tally.set(tallies[index])
+        with changed:
+            started_at[index] = time.monotonic()
+            changed.notify()
+        return scrape_url(url, timeout=url_timeout)
+
+    def finished(_):
+        with changed:
+            changed.notify()
+
+    futures = [_chat_scrape_executor.submit(in_current_context(scrape), index, url) for index, url in enumerate(urls)]
+    for future in futures:
+        future.add_done_callback(finished)
+    waiting = set(range(len(urls)))
+    with changed:
+        while True:
+            now = time.monotonic()
+            waiting = {index for index in waiting if not futures[index].done()
+                       and (started_at[index] is None or now < started_at[index] + url_timeout)}
+            if not waiting or now >= deadline_at:
+                break
+            wake_at = min([deadline_at] + [started_at[index] + url_timeout for index in waiting
+                                           if started_at[index] is not None])
+            changed.wait(wake_at - now)
+
+    results = []
+    for url, future, tally in zip(urls, futures, tallies):
+        if future.done():
+            results.append(future.result())
+        else:
+            future.cancel()
+            results.append(_timed_out(url, tally))
+    return results
+
+
+async def scrape_urls_async(urls: list[str], url_timeout: float = CHAT_URL_TIMEOUT,
+                            deadline: float = CHAT_SCRAPE_DEADLINE) -> list[tuple]:
+    """
+    Async counterpart of scrape_urls_with_deadline: scrapes several URLs
+    concurrently over one async client under the same per-URL and overall limits.
+    """
+    async def scrape(client, url):
+        try:
+            return await asyncio.wait_for(scrape_url_async(client, url, timeout=url_timeout), timeout=url_timeout)
+        except asyncio.TimeoutError:
+            return _timed_out(url)
+
+    client = async_http_client()
+    tasks = [asyncio.ensure_future(scrape(client, url)) for url in urls]
+    await asyncio.wait(tasks, timeout=deadline)
+    results = []
+    for url, task in zip(urls, tasks):
+        if task.done():
+            results.append(task.result())
+        else:
+            task.cancel()
+            results.append(_timed_out(url))
+    return results
+
+
+def url_scraper_tool(url: str, save_to_folder: str = None) -> (str, str): # type: ignore
+    """
+    Intelligently scrapes a URL and optionally saves the content.
+
+    Returns a tuple: (text_content, saved_file_path)
+    - saved_file_path will be None if save_to_folder is not specified.
+    """
+    content, saved_path, _ = scrape_url(url, save_to_folder=save_to_folder)
+    return content, saved_path
+
+def html_to_text(page_source: str) -> str:
+    """
+    Strips scripts and styles from an HTML document and returns its visible text.
+    """
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(page_source, 'html.parser')
+    for script_or_style in soup(['script', 'style']):
+        script_or_style.decompose()
+    text = soup.get_text()
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return '\n'.join(chunk for chunk in chunks if chunk)
+
+def process_urls_in_parallel(urls: list[str], on_done=None) -> list[str]:
     """
     Scrapes a list of URLs in parallel using a thread pool.
-    Returns a list of the scraped text content.
+    Returns a list of the scraped text content; URLs that could not be
+    retrieved are logged and left out.
+
+    If given, `on_done(url)` is called as each URL finishes.
     """
+    def scrape(url):
+        content, _, tier = scrape_url(url)
+        if on_done:
+            on_done(url)
+        if tier in FAILED_TIERS:
+            logger.warning(f"Leaving {url} out of the knowledge base: {content}")
+            return None
+        return content
+
     scraped_contents = []
     with ThreadPoolExecutor(max_workers=10) as executor:
-        results = executor.map(lambda url: url_scraper_tool(url)[0], urls)
+        results = executor.map(scrape, urls)
        
         for content in results:
-            scraped_contents.append(content)
+            if content is not None:
+                scraped_contents.append(content)
            
     return scraped_contents
 
-    
-def file_processor_tool(file_stream, file_name: str) -> (str, str):
+
+# PDF reader opened once per extraction process
+_worker_pdf_reader = None
+
+
+def _init_pdf_worker(file_path: str):
+    import PyPDF2
+    global _worker_pdf_reader
+    _worker_pdf_reader = PyPDF2.PdfReader(file_path)
+
+
+def _extract_pdf_page(page_index: int) -> str:
+    return _worker_pdf_reader.pages[page_index].extract_text() or ""
+
+
+def iter_pdf_pages(file_stream, workers: int = None):
     """
-    Reads content from a file stream (.txt or .pdf), extracts text,
-    finds any URLs within the text, and scrapes them.
+    Yields (page_number, text) for each page of a PDF, in order, as pages are extracted.
 
-    Returns a tuple containing:
-    1. The original text content from the file.
-    2. The combined text content scraped from all URLs found in the file.
+    PDFs backed by a file on disk with at least PDF_PARALLEL_MIN_PAGES pages are
+    extracted on a process pool, with at most PDF_PAGES_IN_FLIGHT pages pending at
+    once, so memory stays bounded however long the document is.
     """
-    original_text = ""
-    scraped_text = ""
+    import PyPDF2
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+    pdf_reader = PyPDF2.PdfReader(file_stream)
+    page_count = len(pdf_reader.pages)
+    file_path = getattr(file_stream, 'name', None)
 
+    if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES or not (isinstance(file_path, str) and os.path.isfile(file_path)):
+        for page_index, page in enumerate(pdf_reader.pages):
+            yield page_index + 1, page.extract_text() or ""
+        return
+
+    logger.info(f"Extracting {page_count} PDF pages on {workers} processes.")
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_pdf_worker, initargs=(file_path,)) as executor:
+        pending = deque()
+        for page_index in range(page_count):
+            pending.append((page_index, executor.submit(_extract_pdf_page, page_index)))
+            if len(pending) >= PDF_PAGES_IN_FLIGHT:
+                done_index, future = pending.popleft()
+                yield done_index + 1, future.result()
+        while pending:
+            done_index, future = pending.popleft()
+            yield done_index + 1, future.result()
+
+
+def _iter_text_segments(file_stream):
+    """
+    Yields (segment_number, text) for a UTF-8 text stream, reading it in blocks
+    of about TEXT_SEGMENT_BYTES that end on a line break.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    remainder = ""
+    segment_number = 0
+    while True:
+        block = file_stream.read(TEXT_SEGMENT_BYTES)
+        text = remainder + decoder.decode(block, final=not block)
+        if not block:
+            if text:
+                yield segment_number + 1, text
+            return
+        cut = text.rfind('\n') + 1
+        if cut == 0 and len(text) < 4 * TEXT_SEGMENT_BYTES:
+            remainder = text
+            continue
+        cut = cut or len(text)
+        segment_number += 1
+        yield segment_number, text[:cut]
+        remainder = text[cut:]
+
+
+def iter_file_pages(file_stream, file_name: str):
+    """
+    Returns an iterator of (page_number, text) for a .pdf or .txt file stream,
+    or None if the file type is not supported. Text files are split into
+    segments that are numbered like pages.
+    """
     if file_name.endswith('.pdf'):
-        pdf_reader = PyPDF2.PdfReader(file_stream)
-        for page in pdf_reader.pages:
-            original_text += page.extract_text() or ""
+        return iter_pdf_pages(file_stream)
     elif file_name.endswith('.txt'):
-        original_text = file_stream.read().decode('utf-8')
-    else:
-        return "", "Unsupported file type."
+        return _iter_text_segments(file_stream)
+    return None
 
-    found_urls = find_and_clean_urls(original_text)
-   
-    if found_urls:
-        logger.info(f"Found {len(found_urls)} URLs in {file_name}. Scraping them now.")
-        scraped_contents = process_urls_in_parallel(set(found_urls))
-        scraped_text = "\n\n--- End of Scraped Content ---\n\n".join(scraped_contents)
 
-    return original_text, scraped_text
+def scrape_found_urls(found_urls: set, file_name: str, on_done=None) -> str:
+    """
+    Scrapes the URLs found in a file and returns the combined scraped text content.
+    """
+    if not found_urls:
+        return ""
+
+    logger.info(f"Found {len(found_urls)} URLs in {file_name}. Scraping them now.")
+    scraped_contents = process_urls_in_parallel(found_urls, on_done=on_done)
+    return "\n\n--- End of Scraped Content ---\n\n".join(scraped_contents)
+
 
 def find_and_clean_urls(text: str) -> list[str]:
     """
     Finds all URLs in a text and cleans them by stripping common trailing punctuation.
     """
-    url_pattern = r'https?://\S+'
-    found_urls = re.findall(url_pattern, text)
-   
-    # List of common punctuation to strip from the end of a URL
-    trailing_punctuation = '.,;:)!?'
+    found_urls = re.findall(URL_PATTERN, text)
    
     # Clean each URL by stripping the trailing characters
-    cleaned_urls = [url.rstrip(trailing_punctuation) for url in found_urls]
+    cleaned_urls = [url.rstrip(TRAILING_URL_PUNCTUATION) for url in found_urls]
    
     return cleaned_urls
 
+class IsGdShortener:
+    """
+    Shortens URLs with the is.gd API over the pooled HTTP session.
+    """
+    api_url = "https://is.gd/create.php"
+
+    def __init__(self, session: requests.Session = None, timeout: float = SHORTENER_TIMEOUT):
+        self.session = session
+        self.timeout = timeout
+
+    def shorten(self, long_url: str) -> str:
+        session = self.session or get_http_session()
+        response = session.get(self.api_url, params={"format": "simple", "url": long_url}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.text.strip()
+
+    async def ashorten(self, long_url: str, client: 'httpx.AsyncClient') -> str:
+        response = await client.get(self.api_url, params={"format": "simple", "url": long_url}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.text.strip()
+
+
+_shortener_backend = IsGdShortener()
+
+
+def set_shortener_backend(backend):
+    """
+    Replaces the URL shortener backend. A backend is any object with a
+    `shorten(long_url) -> short_url` method, and optionally an async
+    `ashorten(long_url, client) -> short_url` method used by the async chat path.
+    """
+    global _shortener_backend
+    _shortener_backend = backend
+
+
+def _urls_to_shorten(text_content: str) -> set:
+    return {url for url in find_and_clean_urls(text_content) if 'is.gd' not in url}
+
+
+def _replace_urls(text_content: str, short_urls: dict) -> str:
+    def replace(match):
+        found_url = match.group(0)
+        long_url = found_url.rstrip(TRAILING_URL_PUNCTUATION)
+        return short_urls.get(long_url, long_url) + found_url[len(long_url):]
+
+    return re.sub(URL_PATTERN, replace, text_content)
+
+
+@timed('url_shortener')
 def url_shortener_tool(text_content: str) -> str:
     """
     Finds all URLs in a string and replaces them with shortened versions from is.gd.
+
+    Known mappings come from the persistent short URL cache; the rest are
+    shortened concurrently, and all URLs are then replaced in a single pass.
     """
-    urls_to_shorten = find_and_clean_urls(text_content)
+    urls_to_shorten = _urls_to_shorten(text_content)
+    if not urls_to_shorten:
+        return text_content
 
-    for long_url in urls_to_shorten:
-        if 'is.gd' in long_url:
-            continue
-        try:
-            api_url = f"https://is.gd/create.php?format=simple&url={long_url}"
-            response = requests.get(api_url, timeout=5)
-            response.raise_for_status()
-            short_url = response.text
-            text_content = re.sub(re.escape(long_url) + r'[.,;:)!?]*', short_url, text_content, 1)
-        except requests.exceptions.RequestException as e:
-            logger.error(f"URL shortening failed for {long_url}. Error: {e}")
-            continue
-           
-    return text_content
+    cache = get_short_url_cache()
+    short_urls = cache.get_many(urls_to_shorten)
+    missing_urls = urls_to_shorten - short_urls.keys()
+
+    if missing_urls:
+        backend = _shortener_backend
+        with ThreadPoolExecutor(max_workers=min(SHORTENER_WORKERS, len(missing_urls))) as executor:
+            futures = {executor.submit(backend.shorten, long_url): long_url for long_url in missing_urls}
+            for future, long_url in futures.items():
+                try:
+                    short_url = future.result()
+                except Exception as e:
+                    logger.error(f"URL shortening failed for {long_url}. Error: {e}")
+                    continue
+                short_urls[long_url] = short_url
+                cache.put(long_url, short_url)
+
+    return _replace_urls(text_content, short_urls)
+
+
+@timed('url_shortener')
+async def url_shortener_tool_async(text_content: str) -> str:
+    """
+    Async counterpart of url_shortener_tool: the missing short URLs are requested
+    concurrently on the event loop instead of in a thread pool.
+    """
+    urls_to_shorten = _urls_to_shorten(text_content)
+    if not urls_to_shorten:
+        return text_content
+
+    cache = get_short_url_cache()
+    short_urls = cache.get_many(urls_to_shorten)
+    missing_urls = sorted(urls_to_shorten - short_urls.keys())
+
+    if missing_urls:
+        backend = _shortener_backend
+        if hasattr(backend, 'ashorten'):
+            client = async_http_client()
+            calls = [backend.ashorten(long_url, client) for long_url in missing_urls]
+        else:
+            calls = [asyncio.to_thread(backend.shorten, long_url) for long_url in missing_urls]
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        for long_url, short_url in zip(missing_urls, results):
+            if isinstance(short_url, Exception):
+                logger.error(f"URL shortening failed for {long_url}. Error: {short_url}")
+                continue
+            short_urls[long_url] = short_url
+            cache.put(long_url, short_url)
+
+    return _replace_urls(text_content, short_urls)
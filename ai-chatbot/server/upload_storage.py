@@ -0,0 +1,115 @@
+import os
+import hashlib
+import logging
+import tempfile
+
+from flask import Request, current_app
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s')
+
+logger = logging.getLogger(__name__)
+
+# Upload limits, overridable through environment variables
+UPLOAD_MAX_FILES = int(os.environ.get('UPLOAD_MAX_FILES', 3))
+UPLOAD_MAX_FILE_BYTES = int(float(os.environ.get('UPLOAD_MAX_FILE_MB', 50)) * 1024 * 1024)
+# The whole request body: every file plus the form fields and multipart framing
+UPLOAD_MAX_REQUEST_BYTES = UPLOAD_MAX_FILES * UPLOAD_MAX_FILE_BYTES + 1024 * 1024
+SPOOL_PREFIX = '.upload-'
+
+
+class TooManyFiles(BadRequest):
+    description = f"You can upload a maximum of {UPLOAD_MAX_FILES} documents."
+
+
+class FileTooLarge(RequestEntityTooLarge):
+    description = f"Each document can be at most {UPLOAD_MAX_FILE_BYTES / (1024 * 1024):g} MB."
+
+
+class HashingSpool:
+    """
+    Receives one uploaded file from the multipart parser as it arrives: the data
+    is written to a temporary file in the upload folder and hashed on the way,
+    and the upload is aborted as soon as it exceeds `max_bytes`.
+    """
+
+    def __init__(self, folder: str, filename: str, max_bytes: int = UPLOAD_MAX_FILE_BYTES):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.stored_path = None
+        self._hash = hashlib.sha256()
+        os.makedirs(folder, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=folder, prefix=SPOOL_PREFIX, suffix='.part', delete=False)
+        self.path = self._file.name
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise FileTooLarge()
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def store(self) -> str:
+        """
+        Moves the file to its content-addressed path, <sha256><extension>, in the
+        upload folder and returns that path. Identical uploads share one file.
+        """
+        self._file.close()
+        extension = os.path.splitext(self.filename)[1].lower()
+        stored_path = os.path.join(os.path.dirname(self.path), f"{self.sha256}{extension}")
+        os.replace(self.path, stored_path)
+        self.stored_path = stored_path
+        return stored_path
+
+    def close(self):
+        self._file.close()
+        if self.stored_path is None:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class UploadRequest(Request):
+    """
+    A request whose uploaded files are streamed into HashingSpools in the
+    upload folder instead of Werkzeug's in-memory or anonymous temporary files.
+    The file count and per-file size limits are enforced while the body is
+    still being parsed; MAX_CONTENT_LENGTH bounds the body as a whole.
+    """
+
+    max_upload_files = UPLOAD_MAX_FILES
+    max_upload_file_bytes = UPLOAD_MAX_FILE_BYTES
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spools = self.__dict__.setdefault('_upload_spools', [])
+        if filename and sum(1 for spool in spools if spool.filename) >= self.max_upload_files:
+            raise TooManyFiles()
+        if content_length and content_length > self.max_upload_file_bytes:
+            raise FileTooLarge()
+        spool = HashingSpool(current_app.config['UPLOAD_FOLDER'], filename or "", self.max_upload_file_bytes)
+        spools.append(spool)
+        return spool
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            # Removes the spools of files that were rejected or never stored
+            for spool in self.__dict__.get('_upload_spools', ()):
+                spool.close()
@@ -0,0 +1,9 @@
+"""
+Production entry point: `gunicorn -c gunicorn.conf.py wsgi:app`
+"""
+from app import app, start_warmup
+
+# Warm the clients up in the background so the first requests do not pay for it
+start_warmup()
+
+__all__ = ['app']